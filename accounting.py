@@ -0,0 +1,318 @@
+"""
+Token, cost and throughput accounting of a run, with budgets.
+
+llm_utils records every LLM request (model, tokens, latency) on the
+process-wide RunAccount (get_account). The account keeps running totals
+per model, prices them with MODEL_PRICES_USD_PER_MTOK and measures tokens/s
+and requests/s since the run started.
+
+Budgets, checked before every request (check):
+    - RUN_BUDGET_USD and RUN_BUDGET_TOKENS (environment or .env, 0 for no
+      limit): budgets of the run. Once BUDGET_STOP_FRACTION (80%) of one is
+      spent no request is sent; the driver stops dispatching locations and
+      leaves the run unfinished, so it can be resumed when the budget
+      allows. The rest of the budget is headroom for the requests in
+      flight, which still complete.
+    - MODEL_TOKEN_BUDGETS: token quotas per model, e.g. a provider's daily
+      limit. A model over its quota is skipped.
+
+forecast() estimates the tokens and cost of a run from the mean token
+counts of earlier runs, so a run that will not fit is not started.
+"""
+
+import os
+import threading
+import time
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# (input, output) USD per million tokens
+MODEL_PRICES_USD_PER_MTOK = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "gemma2-9b-it": (0.20, 0.20),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "deepseek-r1-distill-llama-70b": (0.75, 0.99),
+    "mistral-saba-24b": (0.79, 0.79),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+RUN_BUDGET_USD = float(os.getenv("RUN_BUDGET_USD") or 0)
+RUN_BUDGET_TOKENS = int(os.getenv("RUN_BUDGET_TOKENS") or 0)
+# total tokens per model and run; models without an entry have no quota
+MODEL_TOKEN_BUDGETS = {}
+# share of a run budget at which dispatching stops, the rest is headroom
+# for the requests in flight
+BUDGET_STOP_FRACTION = 0.8
+# (input, output) tokens per forecast day assumed for models without history
+DEFAULT_TOKENS_PER_DAY = (4000, 200)
+
+COUNTERS = ("requests", "failed", "skipped", "input_tokens", "output_tokens")
+
+
+def usage_tokens(response):
+    """
+    (input tokens, output tokens) of a response; (0, 0) if it has no usage.
+
+    Handles the usage of OpenAI-compatible clients (Groq) and the
+    usage_metadata of Google GenAI responses.
+    """
+    usage = getattr(response, "usage", None)
+    if usage:
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.prompt_token_count or 0, usage.candidates_token_count or 0
+    return 0, 0
+
+
+def request_cost(model, input_tokens, output_tokens):
+    """USD cost of a request; 0 for models without a price."""
+    input_price, output_price = MODEL_PRICES_USD_PER_MTOK.get(model, (0, 0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+class RunAccount:
+    """
+    Thread-safe running totals of the LLM requests of a run.
+
+    :param budget_usd: Cost budget of the run; 0 for none.
+    :param budget_tokens: Token budget of the run; 0 for none.
+    :param model_token_budgets: Dictionary of {model: token quota}.
+    """
+
+    def __init__(
+        self,
+        budget_usd=RUN_BUDGET_USD,
+        budget_tokens=RUN_BUDGET_TOKENS,
+        model_token_budgets=None,
+    ):
+        self.budget_usd = budget_usd
+        self.budget_tokens = budget_tokens
+        self.model_token_budgets = (
+            MODEL_TOKEN_BUDGETS if model_token_budgets is None else model_token_budgets
+        )
+        self.models = {}  # model -> counters of this process
+        self.previous = {}  # model -> counters of earlier attempts of the run
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _counters(self, model):
+        return self.models.setdefault(
+            model, {**dict.fromkeys(COUNTERS, 0), "latency_seconds": 0.0}
+        )
+
+    def record(self, model, input_tokens, output_tokens, latency_seconds, failed=False):
+        """Add one sent request."""
+        with self._lock:
+            counters = self._counters(model)
+            counters["requests"] += 1
+            counters["failed"] += int(failed)
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+            counters["latency_seconds"] += latency_seconds
+
+    def record_skipped(self, model):
+        """Add one request that was not sent because of a budget."""
+        with self._lock:
+            self._counters(model)["skipped"] += 1
+
+    def restore(self, usage):
+        """
+        Count the usage of earlier attempts of a resumed run against the budgets.
+
+        :param usage: Dictionary of {model: counters}, see ResultsStore.usage.
+        """
+        with self._lock:
+            self.previous = {model: dict(counters) for model, counters in usage.items()}
+
+    def _tokens(self, model=None):
+        """Tokens spent so far, by model or in total, earlier attempts included."""
+        total = 0
+        for counters in (self.models, self.previous):
+            for name, values in counters.items():
+                if model is None or name == model:
+                    total += values["input_tokens"] + values["output_tokens"]
+        return total
+
+    def _cost(self):
+        return sum(
+            request_cost(model, values["input_tokens"], values["output_tokens"])
+            for counters in (self.models, self.previous)
+            for model, values in counters.items()
+        )
+
+    def exhausted(self):
+        """Reason the run budget is used up, or None while requests may be sent."""
+        with self._lock:
+            if self.budget_usd and self._cost() >= BUDGET_STOP_FRACTION * self.budget_usd:
+                return (
+                    f"{BUDGET_STOP_FRACTION:.0%} of the run budget of "
+                    f"${self.budget_usd:.2f} spent"
+                )
+            if (
+                self.budget_tokens
+                and self._tokens() >= BUDGET_STOP_FRACTION * self.budget_tokens
+            ):
+                return (
+                    f"{BUDGET_STOP_FRACTION:.0%} of the run budget of "
+                    f"{self.budget_tokens} tokens spent"
+                )
+        return None
+
+    def check(self, model):
+        """
+        Check the budgets before a request to model.
+
+        :return: None if the request may be sent, else the reason it may not.
+        """
+        reason = self.exhausted()
+        if reason:
+            return reason
+        with self._lock:
+            quota = self.model_token_budgets.get(model)
+            if quota and self._tokens(model) >= quota:
+                return f"{model} token quota of {quota} reached"
+        return None
+
+    @property
+    def skipped(self):
+        """Number of requests skipped because of a budget."""
+        with self._lock:
+            return sum(counters["skipped"] for counters in self.models.values())
+
+    def usage(self):
+        """
+        Counters per model, earlier attempts of the run included.
+
+        :return: Dictionary of {model: {"requests", "failed", "skipped",
+                 "input_tokens", "output_tokens", "latency_seconds", "cost_usd"}}.
+        """
+        with self._lock:
+            usage = {}
+            for counters in (self.previous, self.models):
+                for model, values in counters.items():
+                    total = usage.setdefault(
+                        model, {**dict.fromkeys(COUNTERS, 0), "latency_seconds": 0.0}
+                    )
+                    for key in (*COUNTERS, "latency_seconds"):
+                        total[key] += values[key]
+        for model, total in usage.items():
+            total["cost_usd"] = request_cost(
+                model, total["input_tokens"], total["output_tokens"]
+            )
+        return usage
+
+    def report(self):
+        """
+        Usage of the run and throughput of this process.
+
+        :return: Dictionary with the per-model "usage", the run "total", and
+                 "tokens_per_second" and "requests_per_second" over the
+                 time since the account was created.
+        """
+        usage = self.usage()
+        total = {
+            key: sum(values[key] for values in usage.values())
+            for key in (*COUNTERS, "cost_usd")
+        }
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            tokens = sum(
+                values["input_tokens"] + values["output_tokens"]
+                for values in self.models.values()
+            )
+            requests = sum(values["requests"] for values in self.models.values())
+        return {
+            "usage": usage,
+            "total": total,
+            "elapsed_seconds": elapsed,
+            "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+            "requests_per_second": requests / elapsed if elapsed else 0.0,
+        }
+
+    def print_report(self):
+        """Print the report as a table."""
+        report = self.report()
+        print(
+            f"{'model':<32}{'requests':>9}{'failed':>7}{'skipped':>8}"
+            f"{'input tok':>11}{'output tok':>11}{'out tok/s':>10}{'cost $':>9}"
+        )
+        for model, values in report["usage"].items():
+            latency = values["latency_seconds"]
+            output_rate = values["output_tokens"] / latency if latency else 0.0
+            print(
+                f"{model:<32}{values['requests']:>9}{values['failed']:>7}"
+                f"{values['skipped']:>8}{values['input_tokens']:>11.0f}"
+                f"{values['output_tokens']:>11.0f}{output_rate:>10.1f}"
+                f"{values['cost_usd']:>9.4f}"
+            )
+        total = report["total"]
+        print(
+            f"Total: {total['requests']} requests, "
+            f"{total['input_tokens'] + total['output_tokens']:.0f} tokens, "
+            f"${total['cost_usd']:.4f}; {report['tokens_per_second']:.1f} tokens/s, "
+            f"{report['requests_per_second']:.2f} requests/s"
+        )
+
+    def forecast(self, planned_days, mean_tokens):
+        """
+        Estimate the tokens and cost of the requests of a run.
+
+        :param planned_days: Dictionary of {model: number of forecast days}.
+        :param mean_tokens: Dictionary of {model: (mean input tokens, mean
+                            output tokens) per day}, e.g. from
+                            ResultsStore.mean_tokens; DEFAULT_TOKENS_PER_DAY
+                            for the missing models.
+        :return: Dictionary with the estimated "tokens" and "cost_usd", and
+                 "fits" (False with a "reason" if the run would spend more
+                 than BUDGET_STOP_FRACTION of a run budget, or a model quota).
+        """
+        tokens = 0
+        cost = 0.0
+        model_tokens = {}
+        for model, n_days in planned_days.items():
+            input_tokens, output_tokens = mean_tokens.get(model, DEFAULT_TOKENS_PER_DAY)
+            model_tokens[model] = n_days * (input_tokens + output_tokens)
+            tokens += model_tokens[model]
+            cost += request_cost(model, n_days * input_tokens, n_days * output_tokens)
+
+        forecast = {"tokens": tokens, "cost_usd": cost, "fits": True, "reason": None}
+        reasons = []
+        if self.budget_usd and self._cost() + cost > BUDGET_STOP_FRACTION * self.budget_usd:
+            reasons.append(
+                f"estimated ${cost:.2f} exceeds {BUDGET_STOP_FRACTION:.0%} of the "
+                f"run budget of ${self.budget_usd:.2f}"
+            )
+        if (
+            self.budget_tokens
+            and self._tokens() + tokens > BUDGET_STOP_FRACTION * self.budget_tokens
+        ):
+            reasons.append(
+                f"estimated {tokens:.0f} tokens exceed {BUDGET_STOP_FRACTION:.0%} "
+                f"of the run budget of {self.budget_tokens}"
+            )
+        for model, quota in self.model_token_budgets.items():
+            if model not in model_tokens:
+                continue
+            if self._tokens(model) + model_tokens[model] > quota:
+                reasons.append(
+                    f"estimated {model_tokens[model]:.0f} {model} tokens exceed "
+                    f"its quota of {quota}"
+                )
+        if reasons:
+            forecast.update(fits=False, reason="; ".join(reasons))
+        return forecast
+
+
+_ACCOUNT = None
+_ACCOUNT_LOCK = threading.Lock()
+
+
+def get_account():
+    """Return the process-wide RunAccount."""
+    global _ACCOUNT
+    with _ACCOUNT_LOCK:
+        if _ACCOUNT is None:
+            _ACCOUNT = RunAccount()
+        return _ACCOUNT
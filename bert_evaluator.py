@@ -0,0 +1,97 @@
+"""
+Shared BERTScore evaluator for the daily overview scripts.
+
+The BERT model is loaded once per process (get_bert_evaluator) instead of
+once per scored cell. The scripts queue (candidate, reference) pairs with
+the sheet cell the score belongs to, and flush() scores all of them in
+batched forward passes and writes the F1 scores back to their cells.
+"""
+
+import threading
+
+from pipeline import start_background
+
+BERT_MODEL_TYPE = "bert-base-uncased"
+# pairs per forward pass
+BERT_BATCH_SIZE = 64
+
+
+class BertScoreEvaluator:
+    """
+    BERTScore F1 of queued (candidate, reference) pairs.
+
+    :param model_type: Model used by bert_score.BERTScorer.
+    :param batch_size: Number of pairs per forward pass.
+    """
+
+    def __init__(self, model_type=BERT_MODEL_TYPE, batch_size=BERT_BATCH_SIZE):
+        self.model_type = model_type
+        self.batch_size = batch_size
+        self._scorer = None
+        self._pending = []  # (sheet, cell, candidate, reference)
+        self._lock = threading.Lock()
+
+    @property
+    def scorer(self):
+        """The BERTScorer, loaded on first use."""
+        with self._lock:
+            if self._scorer is None:
+                from bert_score import BERTScorer
+
+                print(f"Loading BERTScore model {self.model_type}...")
+                self._scorer = BERTScorer(
+                    model_type=self.model_type, batch_size=self.batch_size
+                )
+            return self._scorer
+
+    def warm_up(self):
+        """Load the BERTScore model in a background thread; returns the thread."""
+        return start_background("bert-score-warm-up", lambda: self.scorer)
+
+    def score(self, candidates, references):
+        """
+        Calculate BERTScore for pairs of candidate and reference texts.
+
+        :param candidates: The generated texts from the LLM.
+        :param references: The original texts from BOM.
+        :return: List of BERTScore F1 scores, one per pair.
+        """
+        if not candidates:
+            return []
+        P, R, F1 = self.scorer.score(
+            list(candidates), list(references), batch_size=self.batch_size
+        )
+        return F1.tolist()
+
+    def add(self, sheet, cell, candidate, reference):
+        """
+        Queue a pair; its score is written to sheet[cell] by flush().
+
+        :param sheet: openpyxl worksheet the score belongs to.
+        :param cell: Cell coordinate, e.g. "D4".
+        """
+        self._pending.append((sheet, cell, candidate, reference))
+
+    def flush(self):
+        """Score every queued pair in batches and write the scores to their cells."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        print(f"Scoring {len(pending)} pairs with BERTScore...")
+        scores = self.score(
+            [candidate for _, _, candidate, _ in pending],
+            [reference for _, _, _, reference in pending],
+        )
+        for (sheet, cell, _, _), score in zip(pending, scores):
+            sheet[cell] = score
+
+
+_EVALUATOR = None
+
+
+def get_bert_evaluator():
+    """Return the process-wide BertScoreEvaluator."""
+    global _EVALUATOR
+    if _EVALUATOR is None:
+        _EVALUATOR = BertScoreEvaluator()
+    return _EVALUATOR
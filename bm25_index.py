@@ -0,0 +1,274 @@
+"""
+Sparse BM25 index persisted next to the Chroma store.
+
+rag_indexing builds the index once, at indexing time, and writes it to
+<db_path>/bm25/ as flat numpy arrays:
+    - vocab_bytes.npy / vocab_offsets.npy: the terms, UTF-8 encoded and
+      sorted; a term's position is its term id
+    - postings_offsets.npy: start of each term's postings (n_terms + 1)
+    - postings_docs.npy / postings_tf.npy: doc ids and term frequencies
+    - idf.npy: idf of each term
+    - length_norm.npy: BM25 length normalization of each chunk
+    - documents.jsonl / document_offsets.npy: chunk text and metadata, one
+      line per doc id, and the byte offset of each line
+    - meta.json: BM25 parameters, the format and the index version it was
+      built with
+At query time the arrays are memory-mapped, terms are found by binary search
+and only the returned chunks are read, so loading does not depend on the
+size of the knowledge base.
+"""
+
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+
+BM25_DIR_NAME = "bm25"
+# layout of the files above; indexes of another format are rebuilt
+BM25_FORMAT = 2
+# Same defaults as rank_bm25.BM25Okapi, used by LangChain's BM25Retriever
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+ARRAY_NAMES = (
+    "vocab_bytes",
+    "vocab_offsets",
+    "postings_offsets",
+    "postings_docs",
+    "postings_tf",
+    "idf",
+    "length_norm",
+)
+
+
+def tokenize(text):
+    """Split text into BM25 terms (same as BM25Retriever's default preprocessing)."""
+    return text.split()
+
+
+def build_bm25_arrays(documents, index_version):
+    """
+    Compute the vocabulary, postings, idf and length normalization of the chunks.
+
+    :return: (arrays, meta) where arrays maps the .npy file stems to numpy
+             arrays and meta is the content of meta.json.
+    """
+    term_postings = {}  # term -> list of (doc_id, tf)
+    doc_lengths = np.zeros(len(documents), dtype=np.int32)
+    for doc_id, doc in enumerate(documents):
+        tokens = tokenize(doc.page_content)
+        doc_lengths[doc_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_postings.setdefault(term, []).append((doc_id, tf))
+
+    # term ids follow the sorted terms (code point order, which is also the
+    # order of their UTF-8 bytes), so a term is found by binary search
+    terms = sorted(term_postings)
+    postings = [term_postings[term] for term in terms]
+    encoded = [term.encode("utf-8") for term in terms]
+    vocab_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    vocab_offsets[1:] = np.cumsum([len(term) for term in encoded])
+    vocab_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    postings_docs = np.fromiter(
+        (doc_id for p in postings for doc_id, _ in p), dtype=np.int32, count=offsets[-1]
+    )
+    postings_tf = np.fromiter(
+        (tf for p in postings for _, tf in p), dtype=np.float32, count=offsets[-1]
+    )
+
+    # idf as in rank_bm25.BM25Okapi, negative values floored at epsilon * mean idf
+    n_docs = len(documents)
+    df = np.diff(offsets).astype(np.float64)
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    floor = BM25_EPSILON * idf.mean() if len(idf) else 0.0
+    idf = np.where(idf < 0, floor, idf)
+    avgdl = float(doc_lengths.mean()) if n_docs else 0.0
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / (avgdl or 1.0))
+
+    arrays = {
+        "vocab_bytes": vocab_bytes,
+        "vocab_offsets": vocab_offsets,
+        "postings_offsets": offsets,
+        "postings_docs": postings_docs,
+        "postings_tf": postings_tf,
+        "idf": idf,
+        "length_norm": length_norm,
+    }
+    meta = {
+        "index_version": index_version,
+        "format": BM25_FORMAT,
+        "n_docs": n_docs,
+        "n_terms": len(terms),
+        "avgdl": avgdl,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "epsilon": BM25_EPSILON,
+    }
+    return arrays, meta
+
+
+def write_bm25_index(documents, db_path, index_version):
+    """
+    Build the BM25 index for the chunks in the store and write it to disk.
+
+    :param documents: List of Documents, in the order they were added to the store.
+    :param db_path: Path of the Chroma persist directory.
+    :param index_version: Index version of the store the chunks belong to.
+    """
+    index_dir = os.path.join(db_path, BM25_DIR_NAME)
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    arrays, meta = build_bm25_arrays(documents, index_version)
+    document_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    with open(os.path.join(index_dir, "documents.jsonl"), "wb") as f:
+        for doc_id, d in enumerate(documents):
+            line = json.dumps({"page_content": d.page_content, "metadata": d.metadata})
+            document_offsets[doc_id + 1] = document_offsets[doc_id] + f.write(
+                (line + "\n").encode("utf-8")
+            )
+    arrays["document_offsets"] = document_offsets
+    for name, array in arrays.items():
+        np.save(os.path.join(index_dir, f"{name}.npy"), array)
+    # meta.json is written last, so a partly written index is never loaded
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"BM25 index written: {len(documents)} chunks, {meta['n_terms']} terms.")
+
+
+class BM25Index:
+    """
+    BM25 index over compact arrays, memory-mapped from <db_path>/bm25/ or built in memory.
+
+    :param arrays: Dictionary of the ARRAY_NAMES arrays.
+    :param meta: Content of meta.json.
+    :param documents: List of the chunk Documents, or None to read them from
+                      documents_path.
+    :param documents_path: documents.jsonl of a persisted index.
+    :param document_offsets: Byte offset of each line of documents_path.
+    """
+
+    def __init__(self, arrays, meta, documents=None, documents_path=None, document_offsets=None):
+        self.meta = meta
+        self.vocab_bytes = arrays["vocab_bytes"]
+        self.vocab_offsets = arrays["vocab_offsets"]
+        self.offsets = arrays["postings_offsets"]
+        self.postings_docs = arrays["postings_docs"]
+        self.postings_tf = arrays["postings_tf"]
+        self.idf = arrays["idf"]
+        self.length_norm = arrays["length_norm"]
+        self._documents = documents
+        self._documents_path = documents_path
+        self._document_offsets = document_offsets
+
+    @classmethod
+    def load(cls, index_dir):
+        """Memory-map a persisted index."""
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+            for name in (*ARRAY_NAMES, "document_offsets")
+        }
+        return cls(
+            arrays,
+            meta,
+            documents_path=os.path.join(index_dir, "documents.jsonl"),
+            document_offsets=arrays["document_offsets"],
+        )
+
+    @classmethod
+    def from_documents(cls, documents, index_version=None):
+        """Build an index in memory, for stores without a persisted one."""
+        arrays, meta = build_bm25_arrays(documents, index_version)
+        return cls(arrays, meta, documents=list(documents))
+
+    @property
+    def index_version(self):
+        return self.meta["index_version"]
+
+    @property
+    def n_docs(self):
+        return self.meta["n_docs"]
+
+    def document(self, doc_id):
+        """The chunk Document of doc_id; read from disk for a persisted index."""
+        if self._documents is not None:
+            return self._documents[doc_id]
+        start = int(self._document_offsets[doc_id])
+        end = int(self._document_offsets[doc_id + 1])
+        with open(self._documents_path, "rb") as f:
+            f.seek(start)
+            return Document(**json.loads(f.read(end - start)))
+
+    def term_id(self, term):
+        """Term id of term, or None if it is not in the vocabulary."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.meta["n_terms"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = self.vocab_offsets[mid], self.vocab_offsets[mid + 1]
+            found = self.vocab_bytes[start:end].tobytes()
+            if found == key:
+                return mid
+            if found < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def scores(self, query):
+        """Return the BM25 score of every chunk for the query."""
+        k1 = self.meta["k1"]
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        for term in tokenize(query):
+            term_id = self.term_id(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[term_id] * tf * (k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+    def top_k(self, query, k):
+        """Return the (doc_id, score) pairs of the k best chunks, best first."""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+def load_bm25_index(db_path, index_version):
+    """
+    Load the persisted BM25 index if it matches the store's index version.
+
+    :return: A BM25Index, or None if the index is missing or out of date.
+    """
+    index_dir = os.path.join(db_path, BM25_DIR_NAME)
+    meta_path = os.path.join(index_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        index_format = json.load(f).get("format")
+    if index_format != BM25_FORMAT:
+        print(f"BM25 index format {index_format} is not {BM25_FORMAT}. Ignoring it.")
+        return None
+    index = BM25Index.load(index_dir)
+    if index.index_version != index_version:
+        print(
+            f"BM25 index version {index.index_version} does not match "
+            f"store version {index_version}. Ignoring it."
+        )
+        return None
+    return index
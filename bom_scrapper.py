@@ -2,6 +2,14 @@ import requests
 from bs4 import BeautifulSoup
 import re
 
+from cassette import http_get
+
+BOM_FORECAST_URL = "http://www.bom.gov.au/{state}/forecasts/{city}.shtml"
+# Define a User-Agent header to mimic a browser request
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
 
 def scrape_forecast_texts(state, city):
     """
@@ -10,104 +18,108 @@ def scrape_forecast_texts(state, city):
     Fetches the HTML content, parses it, and extracts the date, short summary,
     and detailed forecast text for each available day.
     """
-    url = f"http://www.bom.gov.au/{state}/forecasts/{city}.shtml"
-    forecast_data = []
+    url = BOM_FORECAST_URL.format(state=state, city=city)
 
     print(f"Fetching forecast data from: {url}\n")
 
-    # Define a User-Agent header to mimic a browser request
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
     try:
         # Send a GET request to the URL with the headers
-        response = requests.get(
-            url, headers=headers, timeout=10
-        )  # Added timeout and headers
+        # recorded or replayed in cassette mode
+        response = http_get(url, headers=REQUEST_HEADERS, timeout=10)  # Added timeout and headers
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
         # Send a GET request to the URL
         # response = requests.get(url, timeout=10)  # Added timeout
         # response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
-        # Parse the HTML content using BeautifulSoup
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        forecast_data = {}
-
-        # Extract forecast issued date
-        date_tag = soup.find("p", class_="date")
-        if date_tag:
-            forecast_data["issued_at"] = date_tag.get_text(strip=True).replace(
-                "Forecast issued at ", ""
-            )
-
-        # Extract forecasts for subsequent 7 days
-        daily_forecasts = []
-        # Find all 'div' elements with class 'day' that are not 'day main'
-        other_day_divs = soup.find_all("div", class_="day")
-
-        for day_div in other_day_divs:
-            day_forecast = {}
-            day_forecast["day"] = day_div.find("h2").get_text(strip=True)
-
-            summary_dl = day_div.find("div", class_="forecast").find("dl")
-            if summary_dl:
-                day_forecast["precis"] = summary_dl.find(
-                    "dd", class_="summary"
-                ).get_text(strip=True)
-
-            city_p = day_div.find("div", class_="forecast").find("p")
-            if city_p:
-                day_forecast["long_form_text"] = city_p.get_text(strip=True)
-
-            daily_forecasts.append(day_forecast)
-        forecast_data["daily_forecasts"] = daily_forecasts
-
-        # replace "Forecast for the rest of " by date and day from "issued_at"
-        # check if it has ESTon
-        check_split_keys = forecast_data["issued_at"].split()
-
-        if "ESTon" in check_split_keys:
-            # split_key = "ESTon"
-            date_delimiter_pattern = r"\bESTon\b"
-        elif "CSTon" in check_split_keys:
-            # split_key = "ESTon"
-            date_delimiter_pattern = r"\bCSTon\b"
-        elif "on" in check_split_keys:
-            # split_key = "on"
-            date_delimiter_pattern = r"\bon\b"
-        else:
-            print(f"No split_key found in issued_at: {forecast_data['issued_at']}")
-            print(check_split_keys)
-            exit()
-
-        # print(forecast_data["issued_at"])
-        # print(date_delimiter_pattern)
-        # date_to_update = forecast_data["issued_at"].split(split_key)[1]
-        date_to_update = re.split(
-            date_delimiter_pattern, forecast_data["issued_at"], 1
-        )[1]
-        date_to_update = date_to_update[:-5]
-
-        # print(re.split(date_delimiter_pattern, forecast_data["issued_at"], 1))
-        # print(date_to_update)
-        # exit()
-
-        # find the key in the forecast_data dictionary that contains "Forecast for the rest of "
-        for dic in forecast_data.get("daily_forecasts", []):
-            if "Forecast for the rest of" in dic.get("day", ""):
-                # change key
-                dic["day"] = date_to_update.strip()
-                break
-
-        return forecast_data
+        return parse_forecast_page(response.content)
     except requests.RequestException as e:
         print(f"An error occurred: {e}")
         return None
 
 
+def parse_forecast_page(content):
+    """
+    Extract the issue date and the daily forecast texts from a BoM forecast page.
+
+    :param content: HTML of the page, as bytes or str.
+    :return: Dictionary with "issued_at" and the "daily_forecasts" list of
+             {"day", "precis", "long_form_text"} dictionaries.
+    """
+    # Parse the HTML content using BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+
+    forecast_data = {}
+
+    # Extract forecast issued date
+    date_tag = soup.find("p", class_="date")
+    if date_tag:
+        forecast_data["issued_at"] = date_tag.get_text(strip=True).replace(
+            "Forecast issued at ", ""
+        )
+
+    # Extract forecasts for subsequent 7 days
+    daily_forecasts = []
+    # Find all 'div' elements with class 'day' that are not 'day main'
+    other_day_divs = soup.find_all("div", class_="day")
+
+    for day_div in other_day_divs:
+        day_forecast = {}
+        day_forecast["day"] = day_div.find("h2").get_text(strip=True)
+
+        summary_dl = day_div.find("div", class_="forecast").find("dl")
+        if summary_dl:
+            day_forecast["precis"] = summary_dl.find(
+                "dd", class_="summary"
+            ).get_text(strip=True)
+
+        city_p = day_div.find("div", class_="forecast").find("p")
+        if city_p:
+            day_forecast["long_form_text"] = city_p.get_text(strip=True)
+
+        daily_forecasts.append(day_forecast)
+    forecast_data["daily_forecasts"] = daily_forecasts
+
+    # replace "Forecast for the rest of " by date and day from "issued_at"
+    # check if it has ESTon
+    check_split_keys = forecast_data["issued_at"].split()
+
+    if "ESTon" in check_split_keys:
+        # split_key = "ESTon"
+        date_delimiter_pattern = r"\bESTon\b"
+    elif "CSTon" in check_split_keys:
+        # split_key = "ESTon"
+        date_delimiter_pattern = r"\bCSTon\b"
+    elif "on" in check_split_keys:
+        # split_key = "on"
+        date_delimiter_pattern = r"\bon\b"
+    else:
+        print(f"No split_key found in issued_at: {forecast_data['issued_at']}")
+        print(check_split_keys)
+        exit()
+
+    # print(forecast_data["issued_at"])
+    # print(date_delimiter_pattern)
+    # date_to_update = forecast_data["issued_at"].split(split_key)[1]
+    date_to_update = re.split(
+        date_delimiter_pattern, forecast_data["issued_at"], 1
+    )[1]
+    date_to_update = date_to_update[:-5]
+
+    # print(re.split(date_delimiter_pattern, forecast_data["issued_at"], 1))
+    # print(date_to_update)
+    # exit()
+
+    # find the key in the forecast_data dictionary that contains "Forecast for the rest of "
+    for dic in forecast_data.get("daily_forecasts", []):
+        if "Forecast for the rest of" in dic.get("day", ""):
+            # change key
+            dic["day"] = date_to_update.strip()
+            break
+
+    return forecast_data
+
+
 if __name__ == "__main__":
     import json
 
@@ -0,0 +1,249 @@
+"""
+Record and replay of the outbound traffic of the daily overview scripts.
+
+The JW forecast API and bom.gov.au pages are fetched with http_get, and
+the LLM clients are wrapped by chat_client / genai_client. The
+CASSETTE_MODE setting (environment or .env) selects what they do:
+    - "off" (default): requests go out as usual.
+    - "record": requests go out, and every response is written to
+      CASSETTE_DIR together with its latency.
+    - "replay": responses are served from CASSETTE_DIR. No network access,
+      API keys or provider SDKs are needed. A request that was not
+      recorded raises CassetteMiss.
+In replay mode each response is delayed by its recorded latency times
+CASSETTE_LATENCY_SCALE (0, the default, replays without delay).
+
+Every interaction is one JSON file, <CASSETTE_DIR>/<kind>/<key>.json. The
+key is a hash of the request, with its API key headers left out, so the
+same run replays the same responses, e.g.
+
+    CASSETTE_MODE=record python llm_daily_overview.py sydney
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=1 python llm_daily_overview.py sydney
+"""
+
+import hashlib
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import dotenv
+import requests
+
+dotenv.load_dotenv()
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes/default")
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE") or 0)
+# request headers that are never written to a cassette (lowercase)
+SECRET_HEADERS = {"x-api-key", "authorization"}
+
+if CASSETTE_MODE not in ("off", "record", "replay"):
+    raise ValueError(f"Unknown CASSETTE_MODE: {CASSETTE_MODE}")
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode for a request that was not recorded."""
+
+
+def _interaction_path(kind, request, cassette_dir=CASSETTE_DIR):
+    canonical = json.dumps([kind, request], sort_keys=True, default=str)
+    key = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cassette_dir, kind, f"{key}.json")
+
+
+def save_interaction(kind, request, response, latency_seconds, cassette_dir=CASSETTE_DIR):
+    """
+    Write one interaction, e.g. a synthetic response (see synthetic_forecasts).
+
+    :param kind: "http", "llm" or "genai".
+    :param request: The request as recorded, e.g. from http_request.
+    :param response: JSON-serializable response, as written by record mode.
+    """
+    path = _interaction_path(kind, request, cassette_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    interaction = {
+        "request": request,
+        "response": response,
+        "latency_seconds": latency_seconds,
+    }
+    # written to a temporary file first, so a crash leaves no partial file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(interaction, f, default=str)
+    os.replace(temporary_path, path)
+
+
+def _replay(kind, request):
+    path = _interaction_path(kind, request)
+    try:
+        with open(path, encoding="utf-8") as f:
+            interaction = json.load(f)
+    except FileNotFoundError:
+        raise CassetteMiss(
+            f"No recorded {kind} response in {CASSETTE_DIR} for "
+            f"{json.dumps(request, default=str)[:200]}; "
+            "record it with CASSETTE_MODE=record"
+        ) from None
+    if CASSETTE_LATENCY_SCALE:
+        time.sleep(interaction["latency_seconds"] * CASSETTE_LATENCY_SCALE)
+    return interaction["response"]
+
+
+def _recorded(kind, func, to_record, from_record):
+    """
+    Wrap func(**request) for the current mode.
+
+    :param to_record: Converts func's result to a JSON-serializable dictionary.
+    :param from_record: Rebuilds a result-like object from that dictionary.
+    """
+
+    def call(**request):
+        if CASSETTE_MODE == "replay":
+            return from_record(_replay(kind, request))
+        start = time.perf_counter()
+        result = func(**request)
+        if CASSETTE_MODE == "record":
+            save_interaction(
+                kind, request, to_record(result), time.perf_counter() - start
+            )
+        return result
+
+    return call
+
+
+class RecordedResponse:
+    """The parts of requests.Response used by the scripts, from a cassette."""
+
+    def __init__(self, url, status_code, text, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.encoding = encoding
+
+    @property
+    def content(self):
+        return self.text.encode(self.encoding or "utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}")
+
+
+def http_request(url, headers=None, params=None):
+    """A GET request as it is recorded: its API key headers are left out."""
+    return {
+        "url": url,
+        "params": params or {},
+        "headers": {
+            name: value
+            for name, value in (headers or {}).items()
+            if name.lower() not in SECRET_HEADERS
+        },
+    }
+
+
+def http_get(url, headers=None, params=None, **kwargs):
+    """
+    requests.get that is recorded or replayed, see CASSETTE_MODE.
+
+    :return: A requests.Response, or a RecordedResponse in replay mode.
+    """
+    request = http_request(url, headers, params)
+
+    def get(**_):
+        return requests.get(url, headers=headers, params=params, **kwargs)
+
+    return _recorded(
+        "http",
+        get,
+        lambda response: {
+            "url": response.url,
+            "status_code": response.status_code,
+            "text": response.text,
+            "encoding": response.encoding,
+        },
+        lambda recorded: RecordedResponse(**recorded),
+    )(**request)
+
+
+def _completion_to_record(completion):
+    usage = completion.usage
+    return {
+        "content": completion.choices[0].message.content,
+        "usage": (
+            {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+            }
+            if usage
+            else None
+        ),
+    }
+
+
+def _completion_from_record(recorded):
+    usage = recorded["usage"]
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=recorded["content"]))],
+        usage=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+def chat_client(factory):
+    """
+    OpenAI-compatible client (e.g. Groq) whose chat.completions.create is
+    recorded or replayed.
+
+    :param factory: Creates the real client; not called in replay mode.
+    """
+    if CASSETTE_MODE == "off":
+        return factory()
+    create = None if CASSETTE_MODE == "replay" else factory().chat.completions.create
+    recorded_create = _recorded(
+        "llm", create, _completion_to_record, _completion_from_record
+    )
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=recorded_create))
+    )
+
+
+def _generation_to_record(response):
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": response.text,
+        "usage_metadata": (
+            {
+                "prompt_token_count": usage.prompt_token_count,
+                "candidates_token_count": usage.candidates_token_count,
+            }
+            if usage
+            else None
+        ),
+    }
+
+
+def _generation_from_record(recorded):
+    usage = recorded["usage_metadata"]
+    return SimpleNamespace(
+        text=recorded["text"],
+        usage_metadata=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+def genai_client(factory):
+    """
+    Google GenAI client whose models.generate_content is recorded or replayed.
+
+    :param factory: Creates the real client; not called in replay mode.
+    """
+    if CASSETTE_MODE == "off":
+        return factory()
+    generate = None if CASSETTE_MODE == "replay" else factory().models.generate_content
+    recorded_generate = _recorded(
+        "genai", generate, _generation_to_record, _generation_from_record
+    )
+    return SimpleNamespace(models=SimpleNamespace(generate_content=recorded_generate))
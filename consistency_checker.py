@@ -0,0 +1,259 @@
+"""
+Factual-consistency checks of generated summaries against the hourly data.
+
+The summary guidelines in llm_utils contain hard rules that can be checked
+without another LLM call:
+    - wind_speed: wind words ("light winds", ...) and "X to Y km/h" ranges
+      must match wind_kmh (BoM wind table)
+    - wind_direction: compass words ("northerly", "SW", ...) must match the
+      wind_dir degrees
+    - absent_phenomenon: snow, frost, fog and rain must not be mentioned when
+      they do not occur, and absences ("no frost") must not be stated
+    - time_window: an event placed in a time of day (morning, ...) must occur
+      in that window
+Each summary is split into clauses; the words of a clause are matched
+against the hourly arrays of the day, restricted to the clause's time
+windows, with numpy masks.
+"""
+
+import re
+
+import numpy as np
+
+RULES = ("wind_speed", "wind_direction", "absent_phenomenon", "time_window")
+
+# BoM wind table, km/h
+WIND_WORD_RANGES_KMH = {
+    "light": (0, 19),
+    "moderate": (20, 29),
+    "fresh": (30, 39),
+    "strong": (40, 62),
+    "gale": (63, 87),
+    "storm": (88, 117),
+    "hurricane": (118, np.inf),
+}
+# slack on the km/h bounds, speeds are given in 5 km/h increments
+WIND_TOLERANCE_KMH = 5
+COMPASS_DEGREES = {
+    "north": 0,
+    "northeast": 45,
+    "east": 90,
+    "southeast": 135,
+    "south": 180,
+    "southwest": 225,
+    "west": 270,
+    "northwest": 315,
+}
+COMPASS_ABBREVIATIONS = {
+    "N": "north",
+    "NE": "northeast",
+    "E": "east",
+    "SE": "southeast",
+    "S": "south",
+    "SW": "southwest",
+    "W": "west",
+    "NW": "northwest",
+}
+# half a compass sector plus one neighbouring sector
+DIRECTION_TOLERANCE_DEG = 45
+# [start, end) hours, from the guidelines' definition of time of day
+TIME_WINDOWS = {
+    "early morning": (0, 6),
+    "morning": (6, 12),
+    "afternoon": (12, 18),
+    "evening": (18, 24),
+}
+# fog_prob_cat values with fog possible ("NIL" and missing values have none)
+FOG_PRESENT_CATS = {"LOW", "MODERATE", "HIGH"}
+FROST_ABSENT_CATS = {"NO_FROST"}
+RAIN_ICON_WORDS = ("shower", "rain", "drizzle")
+
+PHENOMENON_PATTERNS = {
+    "fog": re.compile(r"\bfog", re.IGNORECASE),
+    "frost": re.compile(r"\bfrost", re.IGNORECASE),
+    "snow": re.compile(r"\bsnow", re.IGNORECASE),
+    "rain": re.compile(r"\b(?:rain|showers?|drizzle)\b", re.IGNORECASE),
+}
+NEGATION_PATTERN = re.compile(
+    r"\bno (?:significant )?(fog|frost|snow|rain|showers?|precipitation|storms?)\b",
+    re.IGNORECASE,
+)
+SPEED_RANGE_PATTERN = re.compile(
+    r"(\d+)\s*(?:to|-|–)\s*(\d+)\s*km/?h", re.IGNORECASE
+)
+WIND_WORD_PATTERN = re.compile(
+    r"\b(light|moderate|fresh|strong|gale|storm|hurricane)(?:[- ]force)? winds?\b",
+    re.IGNORECASE,
+)
+COMPASS_PATTERN = re.compile(
+    r"\b((?:north|south)-?(?:east|west)|north|south|east|west)"
+    r"(?:erly|erlies|ernly|ern)?\b",
+    re.IGNORECASE,
+)
+COMPASS_ABBREVIATION_PATTERN = re.compile(r"\b(N|NE|E|SE|S|SW|W|NW)\b")
+TIME_WINDOW_PATTERN = re.compile(
+    r"\b(early morning|morning|afternoon|evening)\b", re.IGNORECASE
+)
+CLAUSE_SPLIT_PATTERN = re.compile(
+    r"[.;,]|\b(?:becoming|increasing|decreasing|tending|easing|then)\b",
+    re.IGNORECASE,
+)
+
+
+class DayArrays:
+    """
+    Hourly values of one forecast day as numpy arrays.
+
+    :param hourly_data: Dictionary of {"HH:MM": {var: value, ...}, ...}, as
+                        returned per date by utils.get_daily_forecasts.
+    """
+
+    def __init__(self, hourly_data):
+        times = sorted(hourly_data)
+        hours = [hourly_data[time] for time in times]
+
+        def floats(var):
+            return np.array(
+                [float(hour.get(var) or 0) for hour in hours], dtype=np.float64
+            )
+
+        self.hour = np.array([int(time.split(":")[0]) for time in times])
+        self.wind_kmh = floats("wind_kmh")
+        self.wind_dir = floats("wind_dir")
+        icons = [str(hour.get("weather_icon_precis") or "").lower() for hour in hours]
+        self.present = {
+            "fog": np.array([hour.get("fog_prob_cat") in FOG_PRESENT_CATS for hour in hours]),
+            "frost": np.array(
+                [hour.get("frost_prob_cat") not in FROST_ABSENT_CATS | {None} for hour in hours]
+            ),
+            "snow": floats("snow") > 0,
+            "rain": (np.maximum(floats("rain"), floats("precip")) > 0)
+            | np.array([any(word in icon for word in RAIN_ICON_WORDS) for icon in icons]),
+        }
+
+    def window_mask(self, windows):
+        """Mask of the hours in any of the named time windows; all hours if none."""
+        if not windows:
+            return np.ones(len(self.hour), dtype=bool)
+        mask = np.zeros(len(self.hour), dtype=bool)
+        for window in windows:
+            start, end = TIME_WINDOWS[window]
+            mask |= (self.hour >= start) & (self.hour < end)
+        return mask
+
+
+def split_clauses(text):
+    """Split a summary into clauses, each with the time windows it mentions."""
+    clauses = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        windows = [w.lower() for w in TIME_WINDOW_PATTERN.findall(sentence)]
+        parts = [part for part in CLAUSE_SPLIT_PATTERN.split(sentence) if part.strip()]
+        for part in parts:
+            part_windows = [w.lower() for w in TIME_WINDOW_PATTERN.findall(part)]
+            # (clause, its time windows, wind sentence?, the sentence's time windows)
+            clauses.append((part, part_windows, "wind" in sentence.lower(), windows))
+    return clauses
+
+
+def _check_wind_speed(clause, mask, day, violations):
+    speeds = day.wind_kmh[mask]
+    if len(speeds) == 0:
+        return
+    claims = [
+        (f"{word.lower()} winds", *WIND_WORD_RANGES_KMH[word.lower()])
+        for word in WIND_WORD_PATTERN.findall(clause)
+    ]
+    claims += [
+        (f"{low} to {high} km/h", int(low), int(high))
+        for low, high in SPEED_RANGE_PATTERN.findall(clause)
+    ]
+    for claim, low, high in claims:
+        supported = (speeds >= low - WIND_TOLERANCE_KMH) & (
+            speeds <= high + WIND_TOLERANCE_KMH
+        )
+        if not supported.any():
+            violations["wind_speed"].append(
+                f"'{claim}' but wind_kmh is {speeds.min():.0f}-{speeds.max():.0f}"
+            )
+
+
+def _check_wind_direction(clause, mask, day, violations):
+    directions = day.wind_dir[mask]
+    if len(directions) == 0:
+        return
+    points = [p.lower().replace("-", "") for p in COMPASS_PATTERN.findall(clause)]
+    points += [
+        COMPASS_ABBREVIATIONS[p] for p in COMPASS_ABBREVIATION_PATTERN.findall(clause)
+    ]
+    for point in points:
+        difference = np.abs((directions - COMPASS_DEGREES[point] + 180) % 360 - 180)
+        if not (difference <= DIRECTION_TOLERANCE_DEG).any():
+            violations["wind_direction"].append(
+                f"'{point}' but wind_dir is never within "
+                f"{DIRECTION_TOLERANCE_DEG} degrees of {COMPASS_DEGREES[point]}"
+            )
+
+
+def check_summary(text, day):
+    """
+    Check one summary against the hourly data of its day.
+
+    :param text: Generated long_form_text.
+    :param day: DayArrays, or the hourly data dictionary of the day.
+    :return: Dictionary of {rule: [violation message, ...]} for every rule in RULES.
+    """
+    if not isinstance(day, DayArrays):
+        day = DayArrays(day)
+    violations = {rule: [] for rule in RULES}
+
+    for match in NEGATION_PATTERN.finditer(text):
+        violations["absent_phenomenon"].append(f"absence stated: '{match.group(0)}'")
+    negated = NEGATION_PATTERN.sub("", text)
+    for phenomenon, pattern in PHENOMENON_PATTERNS.items():
+        if pattern.search(negated) and not day.present[phenomenon].any():
+            violations["absent_phenomenon"].append(
+                f"'{phenomenon}' mentioned but not in the data"
+            )
+
+    for clause, windows, is_wind_sentence, sentence_windows in split_clauses(negated):
+        mask = day.window_mask(windows)
+        for phenomenon, pattern in PHENOMENON_PATTERNS.items():
+            # the time of day of an event may be in another clause:
+            # "Fog patches, mainly in the early morning." uses the sentence's windows
+            event_windows = windows or sentence_windows
+            if not event_windows or not pattern.search(clause):
+                continue
+            present = day.present[phenomenon]
+            if present.any() and not present[day.window_mask(event_windows)].any():
+                violations["time_window"].append(
+                    f"'{phenomenon}' in the {' and '.join(event_windows)} "
+                    f"but it occurs at hours {day.hour[present].tolist()}"
+                )
+        if is_wind_sentence:
+            _check_wind_speed(clause, mask, day, violations)
+            _check_wind_direction(clause, mask, day, violations)
+    return violations
+
+
+def check_summaries(summaries):
+    """
+    Check many (text, hourly data) pairs, building each day's arrays once.
+
+    :param summaries: Iterable of (long_form_text, hourly data dictionary) pairs.
+    :return: List of violation dictionaries, see check_summary.
+    """
+    days = {}
+    results = []
+    for text, hourly_data in summaries:
+        key = id(hourly_data)
+        if key not in days:
+            days[key] = (DayArrays(hourly_data), hourly_data)
+        results.append(check_summary(text, days[key][0]))
+    return results
+
+
+def format_violations(violations):
+    """One line per violated rule, e.g. for a spreadsheet cell; "" if none."""
+    return "\n".join(
+        f"{rule}: {'; '.join(messages)}" for rule, messages in violations.items() if messages
+    )
@@ -0,0 +1,253 @@
+"""
+Embedding runtimes for the RAG pipeline.
+
+load_embeddings() returns the embeddings object used by rag_indexing and
+llm_utils_RAG. The runtime is picked with the EMBEDDING_RUNTIME setting
+(environment or .env):
+    - "torch" (default): HuggingFaceEmbeddings, full-precision PyTorch.
+    - "onnx-int8": the model exported to ONNX with int8 dynamic quantization,
+      run by onnxruntime on CPU with a fast tokenizer and dynamic batching.
+The ONNX runtime needs `pip install onnxruntime tokenizers` (plus torch and
+transformers once, to export the model).
+
+Run this file to export the model and compare the two runtimes:
+    python embedding_runtime.py export
+    python embedding_runtime.py check
+The check exits with status 1 if the int8 embeddings fall below
+MIN_COSINE_AGREEMENT cosine similarity to the fp32 ones.
+"""
+
+import os
+import sys
+import time
+
+import dotenv
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+dotenv.load_dotenv()
+
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch")
+ONNX_MODEL_DIR = "./onnx_models"
+# onnxruntime intra-op threads, 0 lets onnxruntime choose
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# dynamic batching: a batch holds at most this many (padded) tokens
+MAX_BATCH_TOKENS = 8192
+MAX_SEQ_LENGTH = 512
+# lowest cosine similarity of an int8 embedding to its fp32 one that passes the check
+MIN_COSINE_AGREEMENT = 0.99
+
+
+def quantized_model_dir(model_name):
+    """Directory holding the int8 ONNX export of model_name."""
+    return os.path.join(ONNX_MODEL_DIR, f"{model_name.split('/')[-1]}-int8")
+
+
+def export_quantized_model(model_name, output_dir=None):
+    """
+    Export model_name to ONNX and quantize its weights to int8.
+
+    Writes model.onnx and the fast tokenizer files to output_dir.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = output_dir or quantized_model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Exporting {model_name} to {output_dir}...")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)  # tokenizer.json for the fast tokenizer
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["Mostly cloudy. Light winds."], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_type_ids": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(
+        fp32_path, os.path.join(output_dir, "model.onnx"), weight_type=QuantType.QInt8
+    )
+    os.remove(fp32_path)
+    print("Export done.")
+
+
+class OnnxInt8Embeddings(Embeddings):
+    """
+    LangChain embeddings backed by the int8 ONNX export of a bge model.
+
+    Like the sentence-transformers setup of bge-small, the embedding is the
+    normalized [CLS] vector of the last hidden state.
+    """
+
+    def __init__(
+        self, model_name, num_threads=ONNX_THREADS, max_batch_tokens=MAX_BATCH_TOKENS
+    ):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError(
+                "The onnx-int8 embedding runtime needs onnxruntime and tokenizers: "
+                "pip install onnxruntime tokenizers"
+            )
+
+        model_dir = quantized_model_dir(model_name)
+        if not os.path.exists(os.path.join(model_dir, "model.onnx")):
+            export_quantized_model(model_name, model_dir)
+
+        self.max_batch_tokens = max_batch_tokens
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed_batch(self, encodings):
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        attention_mask = np.zeros_like(input_ids)
+        token_type_ids = np.zeros_like(input_ids)
+        for i, encoding in enumerate(encodings):
+            n_tokens = len(encoding.ids)
+            input_ids[i, :n_tokens] = encoding.ids
+            attention_mask[i, :n_tokens] = encoding.attention_mask
+            token_type_ids[i, :n_tokens] = encoding.type_ids
+
+        feeds = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": token_type_ids,
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        cls = hidden[:, 0]
+        return cls / np.maximum(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # same newline handling as HuggingFaceEmbeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        encodings = self.tokenizer.encode_batch(texts)
+
+        # dynamic batching: sort by length so batches need little padding
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        vectors = [None] * len(texts)
+        batch = []
+        for i in order:
+            # order is sorted, so encodings[i] is the longest of the new batch
+            if batch and (len(batch) + 1) * len(encodings[i].ids) > self.max_batch_tokens:
+                for j, vector in zip(batch, self._embed_batch([encodings[j] for j in batch])):
+                    vectors[j] = vector.tolist()
+                batch = []
+            batch.append(i)
+        for j, vector in zip(batch, self._embed_batch([encodings[j] for j in batch])):
+            vectors[j] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_embeddings(model_name, runtime=None):
+    """
+    Return the embeddings object for model_name on the configured runtime.
+
+    :param model_name: Hugging Face model name, e.g. "BAAI/bge-small-en-v1.5".
+    :param runtime: "torch" or "onnx-int8"; defaults to EMBEDDING_RUNTIME.
+    """
+    runtime = runtime or EMBEDDING_RUNTIME
+    if runtime == "onnx-int8":
+        print(f"Loading {model_name} on the onnx-int8 runtime...")
+        return OnnxInt8Embeddings(model_name)
+    if runtime != "torch":
+        print(f"Unknown EMBEDDING_RUNTIME '{runtime}'. Using torch.")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def check_runtimes(model_name, n_repeats=20):
+    """
+    Compare the int8 runtime with the fp32 model.
+
+    Prints the cosine agreement of their embeddings and the throughput
+    (texts/second) of both, after a warm-up call.
+
+    :return: True if every int8 embedding has a cosine similarity of at least
+             MIN_COSINE_AGREEMENT to the fp32 one.
+    """
+    sample_texts = [
+        "Guidelines for writing weather precis and detailed summaries, including "
+        "cloud, precipitation, and wind descriptions.",
+        "How to describe fog and fog patches and their time of day in a forecast.",
+        "Damaging and destructive wind gusts warning wording.",
+        "Showers usually begin and end suddenly and are relatively short-lived.",
+        "Light winds: 19 km/h or less. Moderate winds: 20 - 29 km/h.",
+        "Mostly cloudy. Light rain at times. Winds northerly 15 to 25 km/h.",
+        "Frost in the early morning. Sunny. Light winds.",
+        "Partly cloudy. Possible showers. Light winds.",
+    ]
+    runtimes = {
+        "torch": load_embeddings(model_name, "torch"),
+        "onnx-int8": load_embeddings(model_name, "onnx-int8"),
+    }
+    vectors = {
+        name: np.asarray(embeddings.embed_documents(sample_texts))
+        for name, embeddings in runtimes.items()
+    }
+    fp32, int8 = (
+        vectors[name] / np.linalg.norm(vectors[name], axis=1, keepdims=True)
+        for name in ("torch", "onnx-int8")
+    )
+    cosines = np.sum(fp32 * int8, axis=1)
+    print(f"Cosine agreement: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+
+    # the sample texts were embedded above, so both runtimes are warm
+    texts = sample_texts * n_repeats
+    throughput = {}
+    for name, embeddings in runtimes.items():
+        start = time.perf_counter()
+        embeddings.embed_documents(texts)
+        throughput[name] = len(texts) / (time.perf_counter() - start)
+        print(f"{name}: {throughput[name]:.1f} texts/second")
+    print(f"int8 speed-up: {throughput['onnx-int8'] / throughput['torch']:.2f}x")
+
+    if cosines.min() < MIN_COSINE_AGREEMENT:
+        print(
+            f"FAILED: min cosine agreement {cosines.min():.4f} is below "
+            f"{MIN_COSINE_AGREEMENT}"
+        )
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    MODEL_NAME = "BAAI/bge-small-en-v1.5"
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "export":
+        export_quantized_model(MODEL_NAME)
+    elif not check_runtimes(MODEL_NAME):
+        sys.exit(1)
@@ -0,0 +1,168 @@
+"""
+Hybrid (dense + BM25) retriever for the RAG knowledge base.
+
+Replaces LangChain's EnsembleRetriever on the per-request path: dense and
+sparse candidates are scored with numpy, fused with reciprocal rank fusion
+or weighted score fusion, deduplicated by chunk text and trimmed to a token
+budget. The time spent in each stage of the last search is kept in
+last_timings (milliseconds).
+"""
+
+import time
+
+import numpy as np
+
+# rough tokens-per-character ratio used for the context budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate the number of LLM tokens in text."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def trim_to_token_budget(chunks, token_budget):
+    """
+    Keep chunks, in order, while their estimated tokens fit in token_budget.
+
+    The first chunk is always kept, so a query never ends up with no context.
+    """
+    if not token_budget:
+        return list(chunks)
+    kept = []
+    used = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if kept and used + tokens > token_budget:
+            break
+        kept.append(chunk)
+        used += tokens
+    return kept
+
+
+def fuse(ranked_lists, weights, method="rrf", rrf_c=60):
+    """
+    Fuse ranked (chunk text, score) lists into one deduplicated ranking.
+
+    :param ranked_lists: One list of (text, score) pairs per retriever, best first.
+    :param weights: Weight of each retriever.
+    :param method: "rrf" for weighted reciprocal rank fusion (as in
+                   EnsembleRetriever), or "weighted" for a weighted sum of
+                   min-max normalized scores.
+    :param rrf_c: Rank offset of reciprocal rank fusion.
+    :return: Chunk texts, best first.
+    """
+    texts = list(dict.fromkeys(text for ranked in ranked_lists for text, _ in ranked))
+    position = {text: i for i, text in enumerate(texts)}
+    fused = np.zeros(len(texts))
+    for ranked, weight in zip(ranked_lists, weights):
+        if not ranked:
+            continue
+        rows = np.fromiter((position[text] for text, _ in ranked), dtype=np.int64)
+        if method == "weighted":
+            scores = np.fromiter((score for _, score in ranked), dtype=np.float64)
+            spread = scores.max() - scores.min()
+            normed = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+            np.add.at(fused, rows, weight * normed)
+        else:
+            ranks = np.arange(1, len(ranked) + 1)
+            np.add.at(fused, rows, weight / (ranks + rrf_c))
+    order = np.argsort(-fused, kind="stable")
+    return [texts[i] for i in order]
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 retriever with vectorized scoring and fusion.
+
+    :param embeddings: LangChain embeddings used for the queries.
+    :param config: RETRIEVER_CONFIG of llm_utils_RAG (k values, threshold,
+                   weights, fusion method, rrf_c, context_token_budget).
+    :param flat_index: FlatVectorIndex for dense search, or None to use collection.
+    :param collection: Chroma collection, used when flat_index is None.
+    :param bm25_index: BM25Index for sparse search, or None for dense only.
+    """
+
+    def __init__(self, embeddings, config, flat_index=None, collection=None, bm25_index=None):
+        self.embeddings = embeddings
+        self.config = config
+        self.flat_index = flat_index
+        self.collection = collection
+        self.bm25_index = bm25_index
+        self.last_timings = {}
+
+    def _dense(self, query_vectors):
+        k = self.config["semantic_k"]
+        score_threshold = self.config["score_threshold"]
+        if self.flat_index is not None:
+            return [
+                [(self.flat_index.documents[i].page_content, score) for i, score in hits]
+                for hits in self.flat_index.search(query_vectors, k, score_threshold)
+            ]
+
+        results = self.collection.query(
+            query_embeddings=query_vectors,
+            n_results=k,
+            include=["documents", "distances"],
+        )
+        # cosine relevance as used by the similarity_score_threshold retriever
+        return [
+            [
+                (doc, 1.0 - distance)
+                for doc, distance in zip(docs, distances)
+                if 1.0 - distance >= score_threshold
+            ]
+            for docs, distances in zip(results["documents"], results["distances"])
+        ]
+
+    def _sparse(self, query):
+        return [
+            (self.bm25_index.document(i).page_content, score)
+            for i, score in self.bm25_index.top_k(query, self.config["bm25_k"])
+        ]
+
+    def search_many(self, queries):
+        """
+        Retrieve several queries with one embedding call and one dense search.
+
+        :return: For each query, the fused chunk texts within the token budget.
+        """
+        if not queries:
+            return []
+        timings = {}
+        start = time.perf_counter()
+        query_vectors = self.embeddings.embed_documents(list(queries))
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        dense_results = self._dense(query_vectors)
+        timings["dense_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        sparse_results = (
+            [self._sparse(query) for query in queries]
+            if self.bm25_index is not None
+            else [[] for _ in queries]
+        )
+        timings["sparse_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        results = []
+        for dense, sparse in zip(dense_results, sparse_results):
+            chunks = fuse(
+                [dense, sparse],
+                self.config["weights"],
+                method=self.config["fusion"],
+                rrf_c=self.config["rrf_c"],
+            )
+            results.append(
+                trim_to_token_budget(chunks, self.config["context_token_budget"])
+            )
+        timings["fuse_ms"] = (time.perf_counter() - start) * 1000
+
+        self.last_timings = timings
+        return results
+
+    def search(self, query):
+        """Retrieve one query; see search_many."""
+        return self.search_many([query])[0]
@@ -0,0 +1,110 @@
+"""
+Import-time benchmark of the scripts.
+
+Each module is imported in a fresh interpreter N_RUNS times. The median
+time, less the startup of an empty interpreter, is compared with the
+module's budget in IMPORT_BUDGET_SECONDS. For every module, the direct
+imports that take longest are listed, as measured by python -X importtime.
+These are the imports to defer when a budget is exceeded.
+
+    python import_benchmark.py [module ...]
+
+The exit status is 1 if a module is over its budget, so the check can run
+before a change is merged.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# seconds above the startup of an empty interpreter
+IMPORT_BUDGET_SECONDS = {
+    "llm_daily_overview": 1.5,
+    "llm_daily_overview_RAG": 1.5,
+    "parse_output": 2.0,
+}
+N_RUNS = 5
+# direct imports listed per module
+TOP_IMPORTS = 8
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def median_seconds(code, n_runs=N_RUNS):
+    """Median wall time of running code in a fresh interpreter."""
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        _run_python("-c", code)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_imports(module, top=TOP_IMPORTS):
+    """
+    The direct imports of module that take longest, from python -X importtime.
+
+    :return: List of (imported package, cumulative seconds), slowest first.
+    """
+    result = _run_python("-X", "importtime", "-c", f"import {module}")
+    imports = []
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        # a package is printed after its imports, indented by nesting depth:
+        # " module" is imported by -c, "   package" is one of its imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1e6))
+        elif depth == 0:
+            if name.strip() == module:
+                imports = children
+            children = []
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main(modules):
+    baseline = median_seconds("pass")
+    print(f"Empty interpreter: {baseline:.3f} s")
+    over_budget = []
+    for module in modules:
+        budget = IMPORT_BUDGET_SECONDS.get(module)
+        try:
+            seconds = median_seconds(f"import {module}") - baseline
+            imports = slowest_imports(module)
+        except subprocess.CalledProcessError as e:
+            print(f"{module}: import failed\n{e.stderr.strip().splitlines()[-1]}")
+            over_budget.append(module)
+            continue
+        status = ""
+        if budget is not None:
+            status = "ok" if seconds <= budget else "OVER BUDGET"
+            status = f" (budget {budget:.1f} s, {status})"
+        print(f"{module}: {seconds:.3f} s{status}")
+        for name, cumulative in imports:
+            print(f"    {cumulative:7.3f} s  {name}")
+        if budget is not None and seconds > budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over budget or failed: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or list(IMPORT_BUDGET_SECONDS))
@@ -18,15 +18,28 @@ from utils import (
     convert_to_tabular,
     convert_daily_forecasts_to_tabular,
 )
-from llm_utils import apply_llm
+from llm_utils import (
+    BATCH_FEW_SHOT_EXAMPLE,
+    FEW_SHOT_EXAMPLES,
+    GROQ_MODELS,
+    SUMMARY_GUIDELINES,
+    apply_llm,
+    apply_llm_batched,
+)
 import json
+import os
+import sys
+from functools import partial
 from bom_scrapper import scrape_forecast_texts
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.utils.exceptions import IllegalCharacterError
+from results_store import ResultsStore
+from rag_cache import content_hash
 from datetime import datetime
-from transformers import BertTokenizer, BertModel
-from bert_score import BERTScorer
+from metrics import MetricsEvaluator
+from consistency_checker import check_summary, format_violations
+from pipeline import Stage, run_pipeline
+from accounting import get_account
+from tracing import span, write_trace
 
 dotenv.load_dotenv()
 
@@ -55,6 +68,14 @@ CITY_TO_STATE = {
     "hobart": "tas",
     "darwin": "nt",
 }  #
+# JSON file of {label: {"lat", "lon", "state", ...}} replacing LOCS, e.g. the
+# sites written by synthetic_forecasts.py for a load test
+SITES_FILE = os.getenv("SITES_FILE")
+if SITES_FILE:
+    with open(SITES_FILE) as f:
+        _sites = json.load(f)
+    LOCS = {label: (site["lat"], site["lon"]) for label, site in _sites.items()}
+    CITY_TO_STATE = {label: site["state"] for label, site in _sites.items()}
 
 VARS = [
     "apparent_temp",
@@ -95,230 +116,373 @@ VARS = [
     "wind_kmh",
 ]
 VARS_SET = set(VARS)  # Use a set for efficient O(1) average time complexity lookups
+# Send all the days of a location in one LLM request instead of one request per
+# day; off by default, so runs keep the per-day prompts unless BATCH_DAYS=1
+BATCH_DAYS = os.getenv("BATCH_DAYS", "0") == "1"
+# Export each location of the run from the results store to an xlsx report
+WRITE_XLSX = True
+# worker threads of each pipeline stage, and the capacity of each stage's
+# input queue (a full queue holds back the stage before it)
+STAGE_WORKERS = {
+    "fetch": 2,
+    "scrape": 2,
+    "prompt": 1,
+    "generate": 2,
+    "score": 1,
+    "write": 1,
+}
+STAGE_QUEUE_SIZE = 2
+# BoM forecast days per location, for the usage estimate before a run
+DAYS_PER_LOCATION = 7
 # Prepare the variable definitions
 var_definitions = get_var_definitions(VARS)
 
 
-def bert_scorer(candidate, reference):
+def checkpoint_outputs(store, run_id, location_label, outputs):
     """
-    Calculate BERTScore for the candidate and reference texts.
+    Checkpoint the successful LLM outputs of a location.
+
+    Failed requests are not checkpointed, so a resumed run retries them.
 
-    :param candidate: The generated text from the LLM.
-    :param reference: The original text from BOM.
-    :return: BERTScore F1 score.
+    :param outputs: Dictionary of {date: {model: output dictionary}}.
     """
-    scorer = BERTScorer(model_type="bert-base-uncased")
-    P, R, F1 = scorer.score([candidate], [reference])
+    store.save_outputs(
+        run_id,
+        location_label,
+        {
+            date: {
+                model: output
+                for model, output in model_outputs.items()
+                if not str(output["long_form_text"]).startswith("Error")
+            }
+            for date, model_outputs in outputs.items()
+        },
+    )
+
+
+def fetch_stage(run, location_label):
+    """Fetch the JW hourly data of a location, or load its checkpointed inputs."""
+    checkpoint = run["store"].location_inputs(run["run_id"], location_label)
+    if checkpoint:
+        print(f"Using the checkpointed forecasts of {location_label}...")
+        bom_forecasts, data = checkpoint
+        return [
+            {"location": location_label, "bom_forecasts": bom_forecasts, "data": data}
+        ]
+
+    # get the responses.
+    loc = LOCS[location_label]
+    data = get_daily_forecasts(loc, VARS, jw_model="ai_enhanced")  # ai_enhanced
+    # floc = f"{location_label}_{loc[0]}_{loc[1]}"
+    # data = get_local_data(floc)
 
-    return F1.mean().item()
+    """
+    data is a dictionary with the following structure:
+    "date": { "hour_minute": {var: value, ...}, ... }, ...}
+    """
+    if not data:
+        print(f"No data found for {location_label}. Skipping...")
+        return []
+    return [{"location": location_label, "bom_forecasts": None, "data": data}]
 
 
-def main(comments):
-    for location_label, loc in LOCS.items():
+def scrape_stage(run, unit):
+    """Scrape the BoM daily forecasts of the location and checkpoint the inputs."""
+    if unit["bom_forecasts"] is None:
+        location_label = unit["location"]
         # get the bom daily forecasts for the location
         print(f"Processing daily forecasts for {location_label}...")
         # (state, city)
-        bom_forecasts = scrape_forecast_texts(
-            state=CITY_TO_STATE[location_label], city=location_label
+        with span("bom_scrape"):
+            unit["bom_forecasts"] = scrape_forecast_texts(
+                state=CITY_TO_STATE[location_label], city=location_label
+            )
+        run["store"].save_location_inputs(
+            run["run_id"], location_label, unit["bom_forecasts"], unit["data"]
         )
-
-        # get the responses.
-        data = get_daily_forecasts(loc, VARS, jw_model="ai_enhanced")  # ai_enhanced
-        # floc = f"{location_label}_{loc[0]}_{loc[1]}"
-        # data = get_local_data(floc)
-
-        """
-        data is a dictionary with the following structure:
-        "date": { "hour_minute": {var: value, ...}, ... }, ...}
-        """
-        if not data:
-            print(f"No data found for {location_label}. Skipping...")
+    return [unit]
+
+
+def prompt_stage(run, unit):
+    """Match the BoM days with the JW data and build the hourly table of each day."""
+    data = unit["data"]
+    # Convert the data to tabular format
+    data_df = pd.DataFrame(convert_to_tabular(data))
+    # hourly rows of each date, grouped once
+    day_frames = dict(tuple(data_df.groupby("date", sort=False)))
+
+    # collect the dates in the bom_forecasts that have JW data
+    forecast_days = []
+    for forecast_texts in unit["bom_forecasts"]["daily_forecasts"]:
+        current_day = f"{forecast_texts['day']} {datetime.now().year}"
+        # %A for full weekday name, %d for day of the month, %B for full month name
+
+        date_object = datetime.strptime(current_day, "%A %d %B %Y")
+
+        # make the forecast data key
+        forecast_key = date_object.strftime("%Y-%m-%d")
+        # Check if the date exists in the data
+        if forecast_key not in data:
+            print(f"No data found for {forecast_key}. Skipping...")
             continue
-
-        # Convert the data to tabular format
-        tabdata = convert_to_tabular(data)
-        # Create a DataFrame from the tabular data
-        data_df = pd.DataFrame(tabdata)
-
-        # create a workbook for each location
-        print(f"Processing location: {location_label} at coordinates {loc}...")
-        workbook = Workbook()
-        # Remove the default sheet created
-        if "Sheet" in workbook.sheetnames:
-            workbook.remove(workbook["Sheet"])
-
-        sheet = workbook.create_sheet(title="overview")
-        # Write the forecast text to the sheet
-        sheet["A1"] = "Issued at:"
-        sheet["B1"] = bom_forecasts["issued_at"]
-
-        sheet["A3"] = "Date"
-        # sheet["B3"] = "bom_precis"
-        # sheet["C3"] = "llma_precis"
-        # sheet["D3"] = "bert_score"
-        # sheet["C3"] = "deepseek_precis"
-        # sheet["D3"] = "bert_score"
-        # sheet["G3"] = "mistral_precis"
-        # sheet["H3"] = "bert_score"
-        # sheet["I3"] = "gemini_precis"
-        # sheet["J3"] = "bert_score"
-
-        sheet["B3"] = "bom_long_form"
-        # sheet["M3"] = "llma_long_form"
-        # sheet["N3"] = "bert_score"
-        sheet["C3"] = "deepseek_long_form"
-        sheet["D3"] = "bert_score"
-        # sheet["Q3"] = "mistral_long_form"
-        # sheet["R3"] = "bert_score"
-        # sheet["S3"] = "gemini_long_form"
-        # sheet["T3"] = "bert_score"
-
-        # Add headers for the new columns
-        # sheet["V3"] = "llma_input_tokens"
-        sheet["F3"] = "deepseek_input_tokens"
-        # sheet["X3"] = "mistral_input_tokens"
-        # sheet["Y3"] = "gemini_input_tokens"
-        # sheet["Z3"] = "llma_output_tokens"
-        sheet["G3"] = "deepseek_output_tokens"
-        # sheet["AB3"] = "mistral_output_tokens"
-        # sheet["AC3"] = "gemini_output_tokens"
-        # sheet["AD3"] = "llma_latency"
-        sheet["H3"] = "deepseek_latency"
-        # sheet["AF3"] = "mistral_latency"
-        # sheet["AG3"] = "gemini_latency"
-
-        # token counts and latency
-
-        # iterate for each date in the bom_forecasts
-        row = 4
-        for forecast_texts in bom_forecasts["daily_forecasts"]:
-            current_day = f"{forecast_texts['day']} {datetime.now().year}"
-            # %A for full weekday name, %d for day of the month, %B for full month name
-
-            date_object = datetime.strptime(current_day, "%A %d %B %Y")
-
-            # make the forecast data key
-            forecast_key = date_object.strftime("%Y-%m-%d")
-            # Check if the date exists in the data
-            if forecast_key not in data:
-                print(f"No data found for {forecast_key}. Skipping...")
-                continue
-            # filter the data for the current date
-            hourly_data = data[forecast_key]
-            hourly_tabdata = convert_daily_forecasts_to_tabular(hourly_data)
-
+        forecast_days.append((current_day, forecast_key, forecast_texts))
+
+    unit["forecast_days"] = forecast_days
+    unit["day_frames"] = {
+        key: day_frames[key] for _, key, _ in forecast_days if key in day_frames
+    }
+    # filter the data for each date
+    unit["daily_tables"] = {}
+    for _, forecast_key, _ in forecast_days:
+        with span("table_render", date=forecast_key):
+            unit["daily_tables"][forecast_key] = convert_daily_forecasts_to_tabular(
+                data[forecast_key]
+            )
+    return [unit]
+
+
+def generate_stage(run, unit):
+    """Request the summaries that are not checkpointed yet."""
+    store, run_id, location_label = run["store"], run["run_id"], unit["location"]
+    daily_tables = unit["daily_tables"]
+    # outputs of earlier attempts of this run; only the other days are requested
+    outputs = store.checkpointed_outputs(run_id, location_label)
+    # the models of each day without a checkpointed output
+    missing_models = {
+        forecast_key: [
+            model for model in GROQ_MODELS if model not in outputs.get(forecast_key, {})
+        ]
+        for forecast_key in daily_tables
+    }
+    missing_days = [key for key, models in missing_models.items() if models]
+    if len(missing_days) < len(daily_tables):
+        n_done = len(daily_tables) - len(missing_days)
+        print(f"{n_done} days of {location_label} are already checkpointed.")
+    budget_reason = run["account"].exhausted()
+    if missing_days and budget_reason:
+        # stop dispatching; the location is requested when the run is resumed
+        print(f"Skipping {location_label}: {budget_reason}.")
+        run["skipped_locations"].append(location_label)
+        return []
+    if BATCH_DAYS and missing_days:
+        # one request per model for all the missing days of the location
+        new_outputs = apply_llm_batched(
+            {key: daily_tables[key] for key in missing_days},
+            var_definitions,
+            models_by_date=missing_models,
+        )
+        checkpoint_outputs(store, run_id, location_label, new_outputs)
+        for key, model_outputs in new_outputs.items():
+            outputs[key] = {**model_outputs, **outputs.get(key, {})}
+    else:
+        for key in missing_days:
             # Apply the LLM to generate summaries
-            llm_outputs = apply_llm(
-                hourly_tabdata,
-                var_definitions,
+            with span("generate_day", date=key):
+                model_outputs = apply_llm(
+                    daily_tables[key], var_definitions, models=missing_models[key]
+                )
+            checkpoint_outputs(store, run_id, location_label, {key: model_outputs})
+            outputs[key] = {**model_outputs, **outputs.get(key, {})}
+    if any(
+        str(output["long_form_text"]).startswith("Error")
+        for model_outputs in outputs.values()
+        for output in model_outputs.values()
+    ):
+        # failed outputs are not checkpointed; a resumed run retries them
+        run["failed_locations"].append(location_label)
+    unit["outputs"] = outputs
+    return [unit]
+
+
+def score_stage(run, unit):
+    """Build one result record per date and model, with its scores and rule checks."""
+    records = []
+    for current_day, forecast_key, forecast_texts in unit["forecast_days"]:
+        for model, output in unit["outputs"][forecast_key].items():
+            records.append(
+                {
+                    "location": unit["location"],
+                    "date": forecast_key,
+                    "day_label": current_day,
+                    "issued_at": unit["bom_forecasts"]["issued_at"],
+                    "model": model,
+                    "prompt_hash": run["prompt_hash"],
+                    "bom_long_form": forecast_texts["long_form_text"],
+                    "long_form_text": output["long_form_text"],
+                    "input_tokens": output["input_tokens"],
+                    "output_tokens": output["output_tokens"],
+                    "latency_seconds": output["latency_seconds"],
+                }
             )
+            if str(output["long_form_text"]).startswith("Error"):
+                # failed outputs are stored without scores or rule checks
+                continue
+            # rule checks against the hourly data, no LLM call
+            with span("consistency_check", date=forecast_key, model=model):
+                records[-1]["consistency_violations"] = format_violations(
+                    check_summary(output["long_form_text"], unit["data"][forecast_key])
+                )
+    # score all the successful pairs of the location in batches
+    scored = [
+        record
+        for record in records
+        if not str(record["long_form_text"]).startswith("Error")
+    ]
+    scores = run["evaluator"].score(
+        [record["long_form_text"] for record in scored],
+        [record["bom_long_form"] for record in scored],
+    )
+    for metric, values in scores.items():
+        for record, value in zip(scored, values):
+            record[metric] = value
+    unit["records"] = records
+    return [unit]
+
+
+def write_stage(run, unit):
+    """Store the results and hourly tables of the location and export its report."""
+    store, run_id, location_label = run["store"], run["run_id"], unit["location"]
+    with span("store_results", rows=len(unit["records"])):
+        store.add_results(run_id, unit["records"])
+        store.add_hourly(run_id, location_label, unit["day_frames"])
+    if WRITE_XLSX:
+        output_filename = f"daily_overviews/{location_label}_{run_id}DS_local.xlsx"
+        store.export_xlsx(run_id, location_label, output_filename)
+    return [location_label]
+
+
+def _trace_location(unit):
+    """Span attributes of a pipeline item: a location label or a location's unit."""
+    return {"location": unit if isinstance(unit, str) else unit["location"]}
+
+
+def main(comments, resume_run_id=None, locations=None):
+    """
+    Run the daily overviews of every location in LOCS.
 
-            # Write the date and precis to the sheet
-            sheet[f"A{row}"] = current_day
-            """
-            sheet[f"B{row}"] = forecast_texts["precis"]
-            sheet[f"C{row}"] = llm_outputs["llama-3.1-8b-instant"]["precis"]
-            sheet[f"D{row}"] = bert_scorer(
-                llm_outputs["llama-3.1-8b-instant"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"C{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"]["precis"]
-            sheet[f"D{row}"] = bert_scorer(
-                llm_outputs["deepseek-r1-distill-llama-70b"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"G{row}"] = llm_outputs["mistral-saba-24b"]["precis"]
-            sheet[f"H{row}"] = bert_scorer(
-                llm_outputs["mistral-saba-24b"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"I{row}"] = llm_outputs["gemini-2.0-flash"]["precis"]
-            sheet[f"J{row}"] = bert_scorer(
-                llm_outputs["gemini-2.0-flash"]["precis"],
-                forecast_texts["precis"],
-            )
-            """
-
-            sheet[f"B{row}"] = forecast_texts["long_form_text"]
-            """
-            sheet[f"M{row}"] = llm_outputs["llama-3.1-8b-instant"]["long_form_text"]
-            sheet[f"N{row}"] = bert_scorer(
-                llm_outputs["llama-3.1-8b-instant"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            """
-            sheet[f"C{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "long_form_text"
-            ]
-            sheet[f"D{row}"] = bert_scorer(
-                llm_outputs["deepseek-r1-distill-llama-70b"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            """
-            sheet[f"Q{row}"] = llm_outputs["mistral-saba-24b"]["long_form_text"]
-            sheet[f"R{row}"] = bert_scorer(
-                llm_outputs["mistral-saba-24b"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            sheet[f"S{row}"] = llm_outputs["gemini-2.0-flash"]["long_form_text"]
-            sheet[f"T{row}"] = bert_scorer(
-                llm_outputs["gemini-2.0-flash"]["long_form_text"],
-                forecast_texts["long_form_text"],
+    The locations go through a pipeline of stages (fetch, scrape, prompt,
+    generate, score, write) connected by bounded queues, so scraping,
+    LLM requests and scoring of different locations overlap.
+
+    :param comments: Free text stored with the run and written to the reports.
+    :param resume_run_id: Id of an unfinished run to resume; its checkpointed
+                          inputs and LLM outputs are reused and only the
+                          missing (location, date, model) units are requested.
+    :param locations: Labels of LOCS to run, e.g. ["sydney"]; defaults to all.
+    """
+    locations = list(locations or LOCS)
+    unknown = [label for label in locations if label not in LOCS]
+    if unknown:
+        raise ValueError(f"Unknown locations {unknown}; expected some of {list(LOCS)}")
+    evaluator = MetricsEvaluator()
+    store = ResultsStore()
+    account = get_account()
+    # the prompt of every request: guidelines, variables, examples and batching
+    prompt_hash = content_hash(
+        SUMMARY_GUIDELINES,
+        var_definitions,
+        FEW_SHOT_EXAMPLES,
+        BATCH_FEW_SHOT_EXAMPLE if BATCH_DAYS else "",
+        str(BATCH_DAYS),
+    )
+    if resume_run_id:
+        if store.is_finished(resume_run_id):
+            print(f"Run {resume_run_id} has already finished.")
+            return
+        run_id = resume_run_id
+        print(f"Resuming run {run_id}...")
+        # the usage of the earlier attempts counts against the budgets
+        account.restore(store.usage(run_id))
+    else:
+        forecast = account.forecast(
+            {model: len(locations) * DAYS_PER_LOCATION for model in GROQ_MODELS},
+            store.mean_tokens(prompt_hash),
+        )
+        print(
+            f"Estimated usage: {forecast['tokens']:.0f} tokens, "
+            f"${forecast['cost_usd']:.2f}"
+        )
+        if not forecast["fits"]:
+            print(f"Run not started: {forecast['reason']}.")
+            return
+        run_id = store.start_run(
+            comments,
+            {
+                "models": GROQ_MODELS,
+                "metrics": evaluator.metrics,
+                "vars": VARS,
+                "batch_days": BATCH_DAYS,
+                "prompt_hash": prompt_hash,
+            },
+        )
+
+    # the scoring models load while the first locations are fetched
+    evaluator.warm_up()
+    run = {
+        "account": account,
+        "skipped_locations": [],
+        "failed_locations": [],
+        "store": store,
+        "run_id": run_id,
+        "evaluator": evaluator,
+        "prompt_hash": prompt_hash,
+    }
+    stage_functions = [
+        ("fetch", fetch_stage),
+        ("scrape", scrape_stage),
+        ("prompt", prompt_stage),
+        ("generate", generate_stage),
+        ("score", score_stage),
+        ("write", write_stage),
+    ]
+    locations = run_pipeline(
+        locations,
+        [
+            Stage(
+                name,
+                partial(func, run),
+                STAGE_WORKERS[name],
+                STAGE_QUEUE_SIZE,
+                trace_attributes=_trace_location,
             )
-            """
-            # Write the token counts and latency
-            # sheet[f"V{row}"] = llm_outputs["llama-3.1-8b-instant"]["input_tokens"]
-            sheet[f"F{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "input_tokens"
-            ]
-            # sheet[f"X{row}"] = llm_outputs["mistral-saba-24b"]["input_tokens"]
-            # sheet[f"Y{row}"] = llm_outputs["gemini-2.0-flash"]["input_tokens"]
-            # sheet[f"Z{row}"] = llm_outputs["llama-3.1-8b-instant"]["output_tokens"]
-            sheet[f"G{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "output_tokens"
-            ]
-            # sheet[f"AB{row}"] = llm_outputs["mistral-saba-24b"]["output_tokens"]
-            # sheet[f"AC{row}"] = llm_outputs["gemini-2.0-flash"]["output_tokens"]
-            # sheet[f"AD{row}"] = llm_outputs["llama-3.1-8b-instant"]["latency_seconds"]
-            sheet[f"H{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "latency_seconds"
-            ]
-            # sheet[f"AF{row}"] = llm_outputs["mistral-saba-24b"]["latency_seconds"]
-            # sheet[f"AG{row}"] = llm_outputs["gemini-2.0-flash"]["latency_seconds"]
-
-            # Write the hourly data to a new sheet
-            day_sheet = workbook.create_sheet(title=forecast_key)
-            day_df = data_df[data_df["date"] == forecast_key]
-
-            # Write headers to the new sheet
-            headers = list(day_df.columns)
-            day_sheet.append(headers)
-
-            # Write data rows to the new sheet
-            for r_idx, row_data in enumerate(
-                day_df.values.tolist(), 1
-            ):  # openpyxl is 1-indexed for rows if not using append
-                # day_sheet.append(row_data) # Alternative using append
-                for c_idx, value in enumerate(row_data, 1):
-                    try:
-                        day_sheet.cell(
-                            row=r_idx + 1, column=c_idx, value=value
-                        )  # +1 for r_idx because headers are on row 1
-                    except IllegalCharacterError:
-                        day_sheet.cell(
-                            row=r_idx + 1, column=c_idx, value="[ILLEGAL CHAR]"
-                        )  # Placeholder for illegal chars
-
-            row += 1
-
-        # write comments
-        sheet[f"A{row + 3}"] = comments
-
-        # Save the workbook
-        output_filename = f"daily_overviews/{location_label}_{datetime.now().strftime('%Y_%m_%d_%H_%M')}DS_local.xlsx"
-        workbook.save(output_filename)
+            for name, func in stage_functions
+        ],
+    )
+    account.print_report()
+    store.save_usage(run_id, account.usage())
+    write_trace(run_id)
+    if account.skipped or run["skipped_locations"]:
+        print(
+            f"Run {run_id} stopped at its budget and is not finished; resume it with "
+            f"`python llm_daily_overview.py resume {run_id}`."
+        )
+    elif run["failed_locations"]:
+        print(
+            f"Run {run_id} has failed requests for "
+            f"{', '.join(run['failed_locations'])} and is not finished; retry them "
+            f"with `python llm_daily_overview.py resume {run_id}`."
+        )
+    else:
+        store.finish_run(run_id)
+    print(
+        f"Stored the results of {len(locations)} locations of run {run_id} "
+        f"in {store.db_path}"
+    )
 
 
 if __name__ == "__main__":
+    # python llm_daily_overview.py [location ...]  runs the given locations (default all)
+    # python llm_daily_overview.py resume [run_id]  resumes the last (or the given)
+    # unfinished run
     comments = "deepseek generated prompts."
-    main(comments)
+    if len(sys.argv) > 1 and sys.argv[1] == "resume":
+        if len(sys.argv) > 2:
+            resume_run_id = sys.argv[2]
+        else:
+            resume_run_id = ResultsStore().latest_unfinished_run()
+        if not resume_run_id:
+            print("No unfinished run to resume.")
+            sys.exit()
+        main(comments, resume_run_id)
+    else:
+        main(comments, locations=sys.argv[1:])
@@ -13,15 +13,24 @@ This script does the followings:
 import dotenv
 from var_dictionary import get_var_definitions
 from utils import get_daily_forecasts, convert_to_tabular
-from llm_utils_RAG import apply_llm
+from llm_utils_RAG import (
+    GEMINI_MODEL,
+    GROQ_RAG_MODELS,
+    apply_llm,
+    build_rag_queries,
+    get_retriever,
+    prefetch_contexts,
+)
 import json
+import sys
 from bom_scrapper import scrape_forecast_texts
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.utils.exceptions import IllegalCharacterError
+from workbook_writer import StreamingWorkbook
 from datetime import datetime
-from transformers import BertTokenizer, BertModel
-from bert_score import BERTScorer
+from bert_evaluator import get_bert_evaluator
+from pipeline import start_background
+from accounting import get_account
+from tracing import span, write_trace
 
 
 dotenv.load_dotenv()
@@ -56,7 +65,9 @@ VARS = [
     "cape_srf",
     "chill_stress_idx",
     "dew_pt",
+    "fog_prob_cat",
     "frost_prob_cat",
+    "gust_kmh",
     "tcc",
     "apparent_temp",
     "heat_stress_rating",
@@ -65,12 +76,15 @@ VARS = [
     "precip_conf",
     "precip_prob",
     "pres_msl",
+    "rain",
     "rel_hum",
+    "snow",
     "storm_prob_idx",
     "temp",
     "temp_inv_prob_idx",
     "total_totals_idx",
     "uv_idx_clear",
+    "weather_icon_precis",
     "wind_dir",
     "wind_dir_compass",
     "wind_kmh",
@@ -79,33 +93,96 @@ VARS = [
 VARS_SET = set(VARS)  # Use a set for efficient O(1) average time complexity lookups
 # Prepare the variable definitions
 var_definitions = get_var_definitions(VARS)
-
-
-def bert_scorer(candidate, reference):
+# BoM forecast days per location, for the usage estimate before a run
+DAYS_PER_LOCATION = 7
+# overview sheet columns of each model: (precis, its bert_score, long form,
+# its bert_score, input tokens, output tokens, latency)
+MODEL_COLUMNS = {
+    "llama-3.1-8b-instant": ("C", "D", "M", "N", "V", "Z", "AD"),
+    "deepseek-r1-distill-llama-70b": ("E", "F", "O", "P", "W", "AA", "AE"),
+    "mistral-saba-24b": ("G", "H", "Q", "R", "X", "AB", "AF"),
+    "gemini-2.0-flash": ("I", "J", "S", "T", "Y", "AC", "AG"),
+}
+
+
+def write_model_output(sheet, row, columns, output, forecast_texts, evaluator):
     """
-    Calculate BERTScore for the candidate and reference texts.
+    Write the output of one model to its columns and queue its BERTScores.
 
-    :param candidate: The generated text from the LLM.
-    :param reference: The original text from BOM.
-    :return: BERTScore F1 score.
+    A model that was skipped (e.g. by a budget) or failed has an "Error: ..."
+    long form text; it is written but not scored.
     """
-    scorer = BERTScorer(model_type="bert-base-uncased")
-    P, R, F1 = scorer.score([candidate], [reference])
-
-    return F1.mean().item()
+    (
+        precis,
+        precis_score,
+        long_form,
+        long_form_score,
+        input_tokens,
+        output_tokens,
+        latency,
+    ) = columns
+    sheet[f"{precis}{row}"] = output["precis"]
+    sheet[f"{long_form}{row}"] = output["long_form_text"]
+    if not str(output["long_form_text"]).startswith("Error"):
+        evaluator.add(
+            sheet, f"{precis_score}{row}", output["precis"], forecast_texts["precis"]
+        )
+        evaluator.add(
+            sheet,
+            f"{long_form_score}{row}",
+            output["long_form_text"],
+            forecast_texts["long_form_text"],
+        )
+    # Write the token counts and latency
+    sheet[f"{input_tokens}{row}"] = output["input_tokens"]
+    sheet[f"{output_tokens}{row}"] = output["output_tokens"]
+    sheet[f"{latency}{row}"] = output["latency_seconds"]
 
 
-def main(comments):
-    for location_label, loc in LOCS.items():
-        # get the bom daily forecasts for the location
-        print(f"Processing daily forecasts for {location_label}...")
-        # (state, city)
-        bom_forecasts = scrape_forecast_texts(
-            state=CITY_TO_STATE[location_label], city=location_label
-        )
+def main(comments, locations=None):
+    """
+    Write the daily overview workbook of every location.
 
-        # get the responses.
-        data = get_daily_forecasts(loc, VARS, jw_model="access-g.13km")  # ai_enhanced
+    :param comments: Free text written under the table of each workbook.
+    :param locations: Labels of LOCS to run, e.g. ["sydney"]; defaults to all.
+    """
+    locations = list(locations or LOCS)
+    unknown = [label for label in locations if label not in LOCS]
+    if unknown:
+        raise ValueError(f"Unknown locations {unknown}; expected some of {list(LOCS)}")
+    account = get_account()
+    forecast = account.forecast(
+        {
+            model: len(locations) * DAYS_PER_LOCATION
+            for model in [*GROQ_RAG_MODELS, GEMINI_MODEL]
+        },
+        {},
+    )
+    print(f"Estimated usage: {forecast['tokens']:.0f} tokens, ${forecast['cost_usd']:.2f}")
+    if not forecast["fits"]:
+        print(f"Run not started: {forecast['reason']}.")
+        return
+    evaluator = get_bert_evaluator()
+    # the retriever and BERTScore models load while the locations are fetched
+    start_background("retriever-warm-up", get_retriever)
+    evaluator.warm_up()
+
+    # fetch every location first, so the RAG queries of the whole run can be
+    # embedded and retrieved in one batch
+    fetched = {}
+    for location_label in locations:
+        loc = LOCS[location_label]
+        with span("stage_fetch", location=location_label):
+            # get the bom daily forecasts for the location
+            print(f"Processing daily forecasts for {location_label}...")
+            # (state, city)
+            with span("bom_scrape"):
+                bom_forecasts = scrape_forecast_texts(
+                    state=CITY_TO_STATE[location_label], city=location_label
+                )
+
+            # get the responses.
+            data = get_daily_forecasts(loc, VARS, jw_model="access-g.13km")  # ai_enhanced
 
         """
         data is a dictionary with the following structure:
@@ -114,7 +191,24 @@ def main(comments):
         if not data:
             print(f"No data found for {location_label}. Skipping...")
             continue
-
+        fetched[location_label] = (bom_forecasts, data)
+
+    prefetch_contexts(
+        query
+        for _, data in fetched.values()
+        for hourly_data in data.values()
+        for query in build_rag_queries(hourly_data)
+    )
+
+    skipped_locations = []
+    for location_label, (bom_forecasts, data) in fetched.items():
+        budget_reason = account.exhausted()
+        if budget_reason:
+            # stop dispatching once the run budget is spent
+            print(f"Skipping {location_label}: {budget_reason}.")
+            skipped_locations.append(location_label)
+            continue
+        loc = LOCS[location_label]
         # Convert the data to tabular format
         tabdata = convert_to_tabular(data)
         # Create a DataFrame from the tabular data
@@ -122,12 +216,10 @@ def main(comments):
 
         # create a workbook for each location
         print(f"Processing location: {location_label} at coordinates {loc}...")
-        workbook = Workbook()
-        # Remove the default sheet created
-        if "Sheet" in workbook.sheetnames:
-            workbook.remove(workbook["Sheet"])
-
-        sheet = workbook.create_sheet(title="overview")
+        workbook = StreamingWorkbook(overview_title="overview")
+        sheet = workbook.overview
+        # hourly rows of each date, grouped once
+        day_frames = dict(tuple(data_df.groupby("date", sort=False)))
         # Write the forecast text to the sheet
         sheet["A1"] = "Issued at:"
         sheet["B1"] = bom_forecasts["issued_at"]
@@ -186,115 +278,46 @@ def main(comments):
             # filter the data for the current date
             hourly_data = data[forecast_key]
             # Apply the LLM to generate summaries
-            llm_outputs = apply_llm(
-                hourly_data,
-                var_definitions,
-            )
-
-            # BERTScore calculation
-            scorer = BERTScorer(model_type="bert-base-uncased")
+            with span("generate_day", location=location_label, date=forecast_key):
+                llm_outputs = apply_llm(
+                    hourly_data,
+                    var_definitions,
+                )
 
             # Write the date and precis to the sheet
             sheet[f"A{row}"] = current_day
 
             sheet[f"B{row}"] = forecast_texts["precis"]
-            sheet[f"C{row}"] = llm_outputs["llama-3.1-8b-instant"]["precis"]
-            sheet[f"D{row}"] = bert_scorer(
-                llm_outputs["llama-3.1-8b-instant"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"E{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"]["precis"]
-            sheet[f"F{row}"] = bert_scorer(
-                llm_outputs["deepseek-r1-distill-llama-70b"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"G{row}"] = llm_outputs["mistral-saba-24b"]["precis"]
-            sheet[f"H{row}"] = bert_scorer(
-                llm_outputs["mistral-saba-24b"]["precis"],
-                forecast_texts["precis"],
-            )
-            sheet[f"I{row}"] = llm_outputs["gemini-2.0-flash"]["precis"]
-            sheet[f"J{row}"] = bert_scorer(
-                llm_outputs["gemini-2.0-flash"]["precis"],
-                forecast_texts["precis"],
-            )
-
             sheet[f"L{row}"] = forecast_texts["long_form_text"]
-            sheet[f"M{row}"] = llm_outputs["llama-3.1-8b-instant"]["long_form_text"]
-            sheet[f"N{row}"] = bert_scorer(
-                llm_outputs["llama-3.1-8b-instant"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            sheet[f"O{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "long_form_text"
-            ]
-            sheet[f"P{row}"] = bert_scorer(
-                llm_outputs["deepseek-r1-distill-llama-70b"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            sheet[f"Q{row}"] = llm_outputs["mistral-saba-24b"]["long_form_text"]
-            sheet[f"R{row}"] = bert_scorer(
-                llm_outputs["mistral-saba-24b"]["long_form_text"],
-                forecast_texts["long_form_text"],
+            for model, columns in MODEL_COLUMNS.items():
+                write_model_output(
+                    sheet, row, columns, llm_outputs[model], forecast_texts, evaluator
+                )
+
+            # Write the hourly data to a new sheet, streamed row by row
+            workbook.add_frame_sheet(
+                forecast_key, day_frames.get(forecast_key, data_df.iloc[0:0])
             )
-            sheet[f"S{row}"] = llm_outputs["gemini-2.0-flash"]["long_form_text"]
-            sheet[f"T{row}"] = bert_scorer(
-                llm_outputs["gemini-2.0-flash"]["long_form_text"],
-                forecast_texts["long_form_text"],
-            )
-            # Write the token counts and latency
-            sheet[f"V{row}"] = llm_outputs["llama-3.1-8b-instant"]["input_tokens"]
-            sheet[f"W{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "input_tokens"
-            ]
-            sheet[f"X{row}"] = llm_outputs["mistral-saba-24b"]["input_tokens"]
-            sheet[f"Y{row}"] = llm_outputs["gemini-2.0-flash"]["input_tokens"]
-            sheet[f"Z{row}"] = llm_outputs["llama-3.1-8b-instant"]["output_tokens"]
-            sheet[f"AA{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "output_tokens"
-            ]
-            sheet[f"AB{row}"] = llm_outputs["mistral-saba-24b"]["output_tokens"]
-            sheet[f"AC{row}"] = llm_outputs["gemini-2.0-flash"]["output_tokens"]
-            sheet[f"AD{row}"] = llm_outputs["llama-3.1-8b-instant"]["latency_seconds"]
-            sheet[f"AE{row}"] = llm_outputs["deepseek-r1-distill-llama-70b"][
-                "latency_seconds"
-            ]
-            sheet[f"AF{row}"] = llm_outputs["mistral-saba-24b"]["latency_seconds"]
-            sheet[f"AG{row}"] = llm_outputs["gemini-2.0-flash"]["latency_seconds"]
-
-            # Write the hourly data to a new sheet
-            day_sheet = workbook.create_sheet(title=forecast_key)
-            day_df = data_df[data_df["date"] == forecast_key]
-
-            # Write headers to the new sheet
-            headers = list(day_df.columns)
-            day_sheet.append(headers)
-
-            # Write data rows to the new sheet
-            for r_idx, row_data in enumerate(
-                day_df.values.tolist(), 1
-            ):  # openpyxl is 1-indexed for rows if not using append
-                # day_sheet.append(row_data) # Alternative using append
-                for c_idx, value in enumerate(row_data, 1):
-                    try:
-                        day_sheet.cell(
-                            row=r_idx + 1, column=c_idx, value=value
-                        )  # +1 for r_idx because headers are on row 1
-                    except IllegalCharacterError:
-                        day_sheet.cell(
-                            row=r_idx + 1, column=c_idx, value="[ILLEGAL CHAR]"
-                        )  # Placeholder for illegal chars
 
             row += 1
 
         # write comments
         sheet[f"A{row + 3}"] = comments
 
-        # Save the workbook
+        # score the (candidate, reference) pairs of the location in batches
+        # and save its workbook, so a later failure does not lose it
+        with span("score_bert_score", location=location_label):
+            evaluator.flush()
         output_filename = f"daily_overviews/{location_label}_{datetime.now().strftime('%Y_%m_%d_%H_%M')}_RAG.xlsx"
         workbook.save(output_filename)
 
+    account.print_report()
+    if skipped_locations:
+        print(f"Not generated, the run budget was reached: {', '.join(skipped_locations)}")
+    write_trace(f"{datetime.now().strftime('%Y_%m_%d_%H_%M')}_RAG")
+
 
 if __name__ == "__main__":
+    # python llm_daily_overview_RAG.py [location ...]  runs the given locations (default all)
     comments = "prompt including Jane's comments no BoM data yet"
-    main(comments)
+    main(comments, locations=sys.argv[1:])
@@ -1,11 +1,12 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import time
 import json
-from google import genai
-from pydantic import BaseModel
-from groq import Groq
+from pydantic import BaseModel, ValidationError
+
+import cassette
+from accounting import get_account, usage_tokens
+from tracing import span
 
 
 class LLMResponse(BaseModel):
@@ -13,6 +14,10 @@ class LLMResponse(BaseModel):
     long_form_text: str
 
 
+class DatedLLMResponse(LLMResponse):
+    date: str
+
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -26,20 +31,43 @@ load_dotenv()
 # )
 
 
-def apply_llm(hourly_forecast_data, var_definitions):
-    """
-    Apply the LLM to generate summaries from hourly forecast data.
+# The provider SDKs take seconds to import; they are imported on the first
+# request so that the scripts start (and can warm up models) right away.
+# Both clients are recorded or replayed in cassette mode.
+def groq_client():
+    """Groq client for the GROQ_API_KEY setting."""
 
-    :param hourly_forecast_data: Dictionary containing hourly forecast data.
-    :param var_definitions: definitions of the selected variables.
-    """
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    gclient = genai.Client(api_key=os.getenv("GOOGLE_GENAI_API_KEY"))
+    def create():
+        from groq import Groq
 
-    # create prompts
-    # --- Define the static part of the prompt and combine with file data ---
-    PROMPT = f"""
-Your task is to summarize hourly weather conditions for a given location into a concise summary, aiming 
+        return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    return cassette.chat_client(create)
+
+
+def genai_client():
+    """Google GenAI client for the GOOGLE_GENAI_API_KEY setting."""
+
+    def create():
+        from google import genai
+
+        return genai.Client(api_key=os.getenv("GOOGLE_GENAI_API_KEY"))
+
+    return cassette.genai_client(create)
+
+# Groq models queried for every forecast day
+GROQ_MODELS = [
+    # "deepseek/deepseek-chat-v3-0324:free",
+    # "meta-llama/llama-4-maverick:free",
+    # "mistralai/mistral-small-24b-instruct-2501:free",
+    # "llama-3.1-8b-instant",
+    "deepseek-r1-distill-llama-70b",
+    # "mistral-saba-24b",
+]
+
+
+# Shared guideline text that prefixes every summarisation prompt.
+SUMMARY_GUIDELINES = """Your task is to summarize hourly weather conditions for a given location into a concise summary, aiming 
 for approximately 20 words.You must adhere to the following guidelines derived from meteorological 
 definitions and common forecast terminology:
 
@@ -200,21 +228,10 @@ Southeast, Southwest, West, Northwest, Easterly, Westernly etc.
     
 ---
 
-### Input Data:
-{hourly_forecast_data}
-
-### Variable Definitions:
-{var_definitions}
-
-### Output Format:
-**Your output MUST be a valid JSON object ONLY, with no additional text or explanations.**
-{{
-    ""long_form_text": "Detailed summary here."
-}}
-
----
+"""
 
-### Examples:
+# Worked examples appended after the per-request input data.
+FEW_SHOT_EXAMPLES = """### Examples:
 
 <input_data id=1>
 time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind_dir	wind_kmh
@@ -245,9 +262,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=1>
-{{
+{
   "long_form_text": "Mostly cloudy. Possible showers in the late afternoon and evening. Winds northeasterly 10 to 25 km/h increasing to northerly 25 to 35 km/h in the afternoon."
-}}
+}
 </assistant_response>
 
 <input_data id=2>
@@ -279,9 +296,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=2>
-{{
+{
   "long_form_text": "Mostly cloudy. Light rain at times. Winds northerly 15 to 25 km/h."
-}}
+}
 </assistant_response>
 
 <input_data id=3>
@@ -313,9 +330,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=3>
-{{
+{
   "long_form_text": "Mostly cloudy. Light rain at times. Winds northwesterly 10 to 20 km/h tending southwesterly in the afternoon."
-}}
+}
 </assistant_response>
 
 <input_data id=4>
@@ -347,9 +364,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=4>
-{{
+{
   "long_form_text": "Mostly cloudy. Light rain at times. Light winds west to southwesterly 10 to 20 km/h."
-}}
+}
 </assistant_response>
 
 <input_data id=5>
@@ -381,9 +398,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=5>
-{{
+{
   "long_form_text": "Mostly cloudy. Possible showers tending to light rain at times. Light winds tending west to southwesterly 10 to 15 km/h."
-}}
+}
 </assistant_response>
 
 <input_data id=6>
@@ -415,9 +432,9 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon_precis	wind
 </input_data>
 
 <assistant_response id=6>
-{{
+{
   "long_form_text": "Mostly cloudy. Possible showers tending to light rain at times. Light winds."
-}}
+}
 </assistant_response>
 
 <input_data id=7>
@@ -449,55 +466,124 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon	wind_dir	wi
 </input_data>
 
 <assistant_response id=7>
-{{
+{
   "long_form_text": "Partly cloudy. Possible showers. Light winds."
-}}
+}
+</assistant_response>
+"""
+
+# Batched form of the worked examples, appended after them in batched prompts
+BATCH_FEW_SHOT_EXAMPLE = """### Batched example:
+
+If the tables of examples 1 and 2 were given as the days 2025-01-01 and
+2025-01-02 of one request, the response would be:
+
+<assistant_response id=batch>
+{
+  "days": [
+    {
+      "date": "2025-01-01",
+      "long_form_text": "Mostly cloudy. Possible showers in the late afternoon and evening. Winds northeasterly 10 to 25 km/h increasing to northerly 25 to 35 km/h in the afternoon."
+    },
+    {
+      "date": "2025-01-02",
+      "long_form_text": "Mostly cloudy. Light rain at times. Winds northerly 15 to 25 km/h."
+    }
+  ]
+}
 </assistant_response>
 """
+
+
+def apply_llm(hourly_forecast_data, var_definitions, models=None):
+    """
+    Apply the LLM to generate summaries from hourly forecast data.
+
+    :param hourly_forecast_data: Dictionary containing hourly forecast data.
+    :param var_definitions: definitions of the selected variables.
+    :param models: GROQ_MODELS to request, e.g. the ones without a
+                   checkpointed output; defaults to all.
+    """
+    client = groq_client()
+
+    # create prompts
+    # --- Define the static part of the prompt and combine with file data ---
+    PROMPT = f"""
+{SUMMARY_GUIDELINES}### Input Data:
+{hourly_forecast_data}
+
+### Variable Definitions:
+{var_definitions}
+
+### Output Format:
+**Your output MUST be a valid JSON object ONLY, with no additional text or explanations.**
+{{
+    ""long_form_text": "Detailed summary here."
+}}
+
+---
+
+{FEW_SHOT_EXAMPLES}"""
     model_outputs = {}
-    for model in [
-        # "deepseek/deepseek-chat-v3-0324:free",
-        # "meta-llama/llama-4-maverick:free",
-        # "mistralai/mistral-small-24b-instruct-2501:free",
-        # "llama-3.1-8b-instant",
-        "deepseek-r1-distill-llama-70b",
-        # "mistral-saba-24b",
-    ]:
+    for model in GROQ_MODELS if models is None else models:
+        budget_reason = get_account().check(model)
+        if budget_reason:
+            print(f"Model {model}: not requested, {budget_reason}.")
+            get_account().record_skipped(model)
+            model_outputs[model] = {
+                "long_form_text": f"Error: {budget_reason}.",
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "latency_seconds": 0.0,
+            }
+            continue
+
         # Record start time
         start_time = time.time()
+        completion = None
         response_content = "Error: No response."
+        # stays an "Error: ..." text unless the response parses
+        long_form_text = response_content
         input_tokens = "N/A"
         output_tokens = "N/A"
         latency_seconds = 0.0  # Initialize latency
 
         try:
-            completion = client.chat.completions.create(
-                # completion = CLIENT.beta.chat.completions.parse(
-                extra_body={},
-                model=model,  # Simplified
-                messages=[
-                    {
-                        "role": "user",
-                        "content": PROMPT,
-                    }
-                ],
-                # response_format=LLMResponse,
-                response_format={"type": "json_object"},
-                temperature=0.0,  # Set temperature to 0 for deterministic output
-            )
-            response_content = completion.choices[0].message.content
+            with span("llm_call", model=model) as attributes:
+                completion = client.chat.completions.create(
+                    # completion = CLIENT.beta.chat.completions.parse(
+                    extra_body={},
+                    model=model,  # Simplified
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": PROMPT,
+                        }
+                    ],
+                    # response_format=LLMResponse,
+                    response_format={"type": "json_object"},
+                    temperature=0.0,  # Set temperature to 0 for deterministic output
+                )
+                response_content = completion.choices[0].message.content
+                attributes["input_tokens"], attributes["output_tokens"] = usage_tokens(
+                    completion
+                )
 
             # Try to parse as JSON
             try:
-                output_data = LLMResponse.model_validate_json(response_content)
+                with span("json_parse", model=model):
+                    output_data = LLMResponse.model_validate_json(response_content)
                 # parsed_output_str = output_data.model_dump_json(indent=2)
                 print(f"\nModel {model}: Successfully parsed and validated JSON.")
                 print("\nSuccessfully parsed as JSON!")
-            except json.JSONDecodeError:
+                long_form_text = output_data.long_form_text
+            except ValidationError as e:
                 print("\nFailed to parse as JSON. Response is not valid JSON.")
+                long_form_text = f"Error: invalid response from model {model}: {e}"
 
         except Exception as e:
             response_content = f"Error during API call for model {model}: {e}"
+            long_form_text = response_content
             print(response_content)
 
         # Record end time
@@ -505,11 +591,14 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon	wind_dir	wi
         # Calculate latency
         latency_seconds = end_time - start_time
         # Extract token usage
-        input_tokens = 0
-        output_tokens = 0
-        if completion.usage:
-            input_tokens = completion.usage.prompt_tokens
-            output_tokens = completion.usage.completion_tokens
+        input_tokens, output_tokens = usage_tokens(completion)
+        get_account().record(
+            model,
+            input_tokens,
+            output_tokens,
+            latency_seconds,
+            failed=long_form_text.startswith("Error"),
+        )
 
         # Print to console (optional, but good for live feedback)
         print(f"Response: {response_content}")
@@ -519,7 +608,7 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon	wind_dir	wi
 
         model_outputs[model] = {
             # "precis": output_data.precis,
-            "long_form_text": output_data.long_form_text,
+            "long_form_text": long_form_text,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
             "latency_seconds": latency_seconds,
@@ -527,6 +616,7 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon	wind_dir	wi
 
     """
     # Apply gemini model
+    gclient = genai_client()
     start_time = time.time()
     gemini_input_tokens = 0
     gemini_output_tokens = 0
@@ -563,3 +653,185 @@ time	fog_prob_cat	frost_prob_cat	gust_kmh	rain	snow	tcc	weather_icon	wind_dir	wi
 
     # Return the model outputs
     return model_outputs
+
+
+def build_batch_prompt(daily_tables, var_definitions):
+    """
+    Build one prompt covering several forecast days of a location.
+
+    The guidelines and examples are included once, followed by one table per day.
+
+    :param daily_tables: Dictionary of {date: hourly table} for one location.
+    :param var_definitions: definitions of the selected variables.
+    """
+    day_sections = "\n\n".join(
+        f'<input_data date="{date}">\n{table}\n</input_data>'
+        for date, table in daily_tables.items()
+    )
+    return f"""
+{SUMMARY_GUIDELINES}### Input Data:
+Each table below is a separate forecast day. Summarize every day independently.
+
+{day_sections}
+
+### Variable Definitions:
+{var_definitions}
+
+### Output Format:
+**Your output MUST be a valid JSON object ONLY, with no additional text or explanations.**
+Return one entry per input day, using the date exactly as given:
+{{
+    "days": [
+        {{"date": "YYYY-MM-DD", "long_form_text": "Detailed summary here."}}
+    ]
+}}
+
+---
+
+{FEW_SHOT_EXAMPLES}
+{BATCH_FEW_SHOT_EXAMPLE}"""
+
+
+def _request_batch(client, model, daily_tables, var_definitions):
+    """
+    Send one batched request and validate each returned day on its own.
+
+    :return: ({date: long_form_text} for the valid days, input_tokens,
+             output_tokens, latency_seconds)
+    """
+    start_time = time.time()
+    valid_days = {}
+    input_tokens = 0
+    output_tokens = 0
+
+    try:
+        with span("llm_call", model=model, dates=list(daily_tables)) as attributes:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": build_batch_prompt(daily_tables, var_definitions),
+                    }
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.0,
+            )
+            response_content = completion.choices[0].message.content
+            input_tokens, output_tokens = usage_tokens(completion)
+            attributes["input_tokens"] = input_tokens
+            attributes["output_tokens"] = output_tokens
+
+        with span("json_parse", model=model) as attributes:
+            days = json.loads(response_content).get("days", [])
+            for day in days:
+                # A malformed entry only fails its own day, not the whole batch
+                try:
+                    output_data = DatedLLMResponse.model_validate(day)
+                except ValidationError as e:
+                    print(f"Model {model}: invalid day entry {day}: {e}")
+                    continue
+                if (
+                    output_data.date in daily_tables
+                    and output_data.long_form_text.strip()
+                ):
+                    valid_days[output_data.date] = output_data.long_form_text
+            attributes["valid_days"] = len(valid_days)
+    except json.JSONDecodeError:
+        print(f"\nModel {model}: batched response is not valid JSON.")
+    except Exception as e:
+        print(f"Error during batched API call for model {model}: {e}")
+
+    latency_seconds = time.time() - start_time
+    get_account().record(
+        model, input_tokens, output_tokens, latency_seconds, failed=not valid_days
+    )
+    print(
+        f"Model {model}: {len(valid_days)}/{len(daily_tables)} days valid, "
+        f"{input_tokens} input / {output_tokens} output tokens, "
+        f"{latency_seconds:.4f} seconds"
+    )
+    return valid_days, input_tokens, output_tokens, latency_seconds
+
+
+def _split_tokens(tokens, n_days):
+    """Split a token count into n_days whole counts, the remainder on the first."""
+    share, remainder = divmod(tokens, n_days)
+    return [share + remainder] + [share] * (n_days - 1)
+
+
+def apply_llm_batched(
+    daily_tables, var_definitions, max_retries=1, models_by_date=None
+):
+    """
+    Apply the LLM to all forecast days of a location with one request per model.
+
+    Days that are missing from the response or fail validation are re-sent
+    together in one follow-up request per model, up to max_retries times.
+    Token counts and latency of each request are split evenly across the
+    days it covered; the token counts are split in whole tokens, with the
+    remainder on the first day, so the days add up to the request.
+
+    :param daily_tables: Dictionary of {date: hourly table} for one location.
+    :param var_definitions: definitions of the selected variables.
+    :param max_retries: Number of follow-up requests for the failed days.
+    :param models_by_date: Dictionary of {date: GROQ_MODELS to request}, e.g.
+                           the ones without a checkpointed output; defaults
+                           to all models for every day.
+    :return: Dictionary of {date: {model: output}} of the requested (date,
+             model) pairs, where each output has the same keys as the ones
+             returned by apply_llm.
+    """
+    client = groq_client()
+
+    outputs = {date: {} for date in daily_tables}
+    for model in GROQ_MODELS:
+        # only the days this model has to summarize go into its requests
+        pending = {
+            date: table
+            for date, table in daily_tables.items()
+            if models_by_date is None or model in models_by_date.get(date, ())
+        }
+        for date in pending:
+            outputs[date][model] = {
+                "long_form_text": "Error: No response.",
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "latency_seconds": 0.0,
+            }
+
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                print(f"Model {model}: retrying {len(pending)} failed day(s)...")
+            budget_reason = get_account().check(model)
+            if budget_reason:
+                print(f"Model {model}: not requested, {budget_reason}.")
+                get_account().record_skipped(model)
+                for date in pending:
+                    outputs[date][model]["long_form_text"] = f"Error: {budget_reason}."
+                break
+
+            valid_days, input_tokens, output_tokens, latency_seconds = (
+                _request_batch(client, model, pending, var_definitions)
+            )
+            n_days = len(pending)
+            input_shares = _split_tokens(input_tokens, n_days)
+            output_shares = _split_tokens(output_tokens, n_days)
+            for i, date in enumerate(pending):
+                model_output = outputs[date][model]
+                model_output["input_tokens"] += input_shares[i]
+                model_output["output_tokens"] += output_shares[i]
+                model_output["latency_seconds"] += latency_seconds / n_days
+                if date in valid_days:
+                    model_output["long_form_text"] = valid_days[date]
+
+            pending = {
+                date: table for date, table in pending.items() if date not in valid_days
+            }
+
+        if pending:
+            print(f"Model {model}: no valid summary for {sorted(pending)}.")
+
+    return outputs
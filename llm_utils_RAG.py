@@ -1,15 +1,15 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import time
-import json
-from google import genai
-from pydantic import BaseModel
-from groq import Groq
-from langchain.retrievers import BM25Retriever, EnsembleRetriever
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
+import threading
+from functools import partial
+from pydantic import BaseModel, ValidationError
+from hybrid_retriever import HybridRetriever, trim_to_token_budget
+from llm_utils import genai_client, groq_client
+from rag_cache import RetrievalCache, read_index_version, retrieval_cache_key
+from accounting import get_account, usage_tokens
+from consistency_checker import FOG_PRESENT_CATS
+from tracing import span
 
 
 class LLMResponse(BaseModel):
@@ -30,86 +30,382 @@ load_dotenv()
 # )
 
 CHROMA_DB_PATH = "./chroma_db"
+# collection written by rag_indexing
+CHROMA_COLLECTION_NAME = "langchain"
 # EMBEDDING_MODEL_NAME = "dwzhu/e5-base-4k"
 EMBEDDING_MODEL_NAME = (
     "BAAI/bge-small-en-v1.5"  # Good default, balance of speed/accuracy
 )
+# "chroma", or "flat" for the memory-mapped exact-search index written by
+# rag_indexing (falls back to Chroma when it is missing)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+# the EMBEDDING_RUNTIME setting of embedding_runtime, read here so that
+# importing this module does not import LangChain
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch")
+# Retriever settings, also part of the retrieval cache key
+RETRIEVER_CONFIG = {
+    "embedding_model": EMBEDDING_MODEL_NAME,
+    "embedding_runtime": EMBEDDING_RUNTIME,
+    "semantic_k": 5,
+    "score_threshold": 0.25,
+    "bm25_k": 3,
+    "weights": [0.7, 0.3],
+    "vector_store_backend": VECTOR_STORE_BACKEND,
+    # "rrf" (reciprocal rank fusion) or "weighted" (normalized score sum)
+    "fusion": "rrf",
+    "rrf_c": 60,
+    # estimated tokens of retrieved context per query / per prompt
+    "context_token_budget": 1500,
+}
 
 
-def apply_llm(hourly_forecast_data, var_definitions):
+# Always-on query, extended per day by the feature queries below
+BASE_RAG_QUERY = (
+    "Guidelines for writing weather precis and detailed "
+    "summaries, including cloud, precipitation, and wind descriptions "
+    "and definitions of common weather terms."
+)
+# A condition must hold for this many hours before its query is added,
+# matching the "at least two hourly timesteps" rule of the prompt guidelines
+MIN_FEATURE_HOURS = 2
+GUST_QUERY_THRESHOLD_KMH = 60
+STRONG_WIND_THRESHOLD_KMH = 40
+RAIN_THRESHOLD_MM = 0.2
+# (test on one hour of data, query added when the test holds)
+FEATURE_QUERIES = [
+    (
+        lambda hour: hour.get("fog_prob_cat") in FOG_PRESENT_CATS,
+        "How to describe fog and fog patches and their time of day in a forecast.",
+    ),
+    (
+        lambda hour: hour.get("frost_prob_cat") not in (None, "NO_FROST"),
+        "Definition of frost and how to phrase frost in a weather forecast.",
+    ),
+    (
+        lambda hour: (hour.get("snow") or 0) > 0,
+        "Snow and snow showers wording in weather forecasts.",
+    ),
+    (
+        lambda hour: (hour.get("gust_kmh") or hour.get("wind_gust") or 0)
+        >= GUST_QUERY_THRESHOLD_KMH,
+        "Damaging and destructive wind gusts warning wording.",
+    ),
+    (
+        lambda hour: (hour.get("wind_kmh") or 0) >= STRONG_WIND_THRESHOLD_KMH,
+        "Strong winds, gale and windy definitions in the wind table.",
+    ),
+    (
+        lambda hour: max(hour.get("rain") or 0, hour.get("precip") or 0)
+        >= RAIN_THRESHOLD_MM,
+        "Precipitation words: showers, rain, drizzle, their duration and likelihood.",
+    ),
+    (
+        lambda hour: "storm"
+        in str(hour.get("weather_icon_precis") or hour.get("weather_icon") or "").lower(),
+        "Thunderstorm wording, risk of thunderstorms and severe thunderstorm attributes.",
+    ),
+]
+# Upper bound on the chunks put into one prompt
+MAX_CONTEXT_CHUNKS = 6
+# Groq models of the daily overviews; GEMINI_MODEL is requested after them
+GROQ_RAG_MODELS = [
+    # "deepseek/deepseek-chat-v3-0324:free",
+    # "meta-llama/llama-4-maverick:free",
+    # "mistralai/mistral-small-24b-instruct-2501:free",
+    "llama-3.1-8b-instant",
+    "deepseek-r1-distill-llama-70b",
+    "mistral-saba-24b",
+]
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Retriever components shared by every apply_llm call, built on first use
+_RAG_COMPONENTS = None
+_RAG_COMPONENTS_VERSION = None
+_RETRIEVER_LOCK = threading.Lock()
+_RETRIEVAL_CACHE = RetrievalCache(CHROMA_DB_PATH)
+
+
+def get_retriever():
     """
-    Apply the LLM to generate summaries from hourly forecast data.
+    Return the HybridRetriever (semantic + BM25) over the knowledge base.
 
-    :param hourly_forecast_data: Dictionary containing hourly forecast data.
-    :param var_definitions: definitions of the selected variables.
+    The embedding model, vector store and BM25 index are loaded once per
+    process, on the first call, and reused for every location and day. They
+    are reloaded if rag_indexing has rebuilt the store since.
     """
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    gclient = genai.Client(api_key=os.getenv("GOOGLE_GENAI_API_KEY"))
+    return _get_rag_components()["retriever"]
+
+
+def _get_rag_components():
+    global _RAG_COMPONENTS, _RAG_COMPONENTS_VERSION
+    with _RETRIEVER_LOCK:
+        index_version = read_index_version(CHROMA_DB_PATH)
+        if _RAG_COMPONENTS is None or _RAG_COMPONENTS_VERSION != index_version:
+            _RAG_COMPONENTS = _build_rag_components(index_version)
+            _RAG_COMPONENTS_VERSION = index_version
+    return _RAG_COMPONENTS
+
+
+def _build_rag_components(index_version):
+    # LangChain, Chroma and the embedding model are imported with the retriever
+    import chromadb
+    from langchain_core.documents import Document
+
+    from bm25_index import BM25Index, load_bm25_index
+    from embedding_runtime import load_embeddings
+    from flat_index import load_flat_index
 
-    ## Setting up the retriever
     print("Setting up RAG pipeline...")
-    embeddings_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    embeddings_model = load_embeddings(EMBEDDING_MODEL_NAME)
 
     # vector store initialization
-    # Load Chroma Vector Store
-    print(f"Loading Chroma DB from: {CHROMA_DB_PATH}")
-    vector_store = Chroma(
-        persist_directory=CHROMA_DB_PATH, embedding_function=embeddings_model
-    )
-    print("Chroma DB loaded.")
-
-    # Create semantic retriever
-    semantic_retriever = vector_store.as_retriever(
-        search_type="similarity_score_threshold",
-        search_kwargs={"k": 5, "score_threshold": 0.25},
-    )
-    # 4. BM25 Retriever
-    # Fetch all documents from Chroma to build the BM25 index.
-    # This could be slow if the DB is very large.
-    print("Fetching documents for BM25 retriever...")
-    retrieved_docs_for_bm25_dict = vector_store.get(include=["documents", "metadatas"])
-    documents_for_bm25 = []
-    if retrieved_docs_for_bm25_dict and retrieved_docs_for_bm25_dict.get("documents"):
-        for doc_content, meta in zip(
-            retrieved_docs_for_bm25_dict["documents"],
-            retrieved_docs_for_bm25_dict["metadatas"],
-        ):
-            documents_for_bm25.append(Document(page_content=doc_content, metadata=meta))
-        print(f"Retrieved {len(documents_for_bm25)} documents for BM25.")
+    flat_index = None
+    collection = None
+    if VECTOR_STORE_BACKEND == "flat":
+        flat_index = load_flat_index(CHROMA_DB_PATH, index_version)
+        if flat_index is None:
+            print("Flat vector index not available. Falling back to Chroma.")
+        else:
+            print(f"Loaded flat vector index ({len(flat_index.documents)} chunks).")
 
-    if documents_for_bm25:
-        bm25_retriever = BM25Retriever.from_documents(
-            documents=documents_for_bm25,
-            k=3,  # k=3 for BM25 part of ensemble
-        )
-        # Ensemble Retriever
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[semantic_retriever, bm25_retriever], weights=[0.7, 0.3]
+    if flat_index is None:
+        # Load Chroma Vector Store
+        print(f"Loading Chroma DB from: {CHROMA_DB_PATH}")
+        collection = chromadb.PersistentClient(path=CHROMA_DB_PATH).get_collection(
+            CHROMA_COLLECTION_NAME
         )
-        print("Ensemble retriever created.")
+        print("Chroma DB loaded.")
+
+    # 4. BM25 index
+    # Use the index persisted by rag_indexing if it matches the store.
+    bm25_index = load_bm25_index(CHROMA_DB_PATH, index_version)
+    if bm25_index is not None:
+        print(f"Loaded persisted BM25 index ({bm25_index.n_docs} chunks).")
     else:
+        # Fetch all documents from the vector store to build the BM25 index.
+        # This could be slow if the DB is very large.
+        print("Fetching documents for BM25 index...")
+        if flat_index is not None:
+            documents_for_bm25 = flat_index.documents
+        else:
+            stored = collection.get(include=["documents", "metadatas"])
+            documents_for_bm25 = [
+                Document(page_content=doc_content, metadata=meta)
+                for doc_content, meta in zip(stored["documents"], stored["metadatas"])
+            ]
+        print(f"Retrieved {len(documents_for_bm25)} documents for BM25.")
+        if documents_for_bm25:
+            bm25_index = BM25Index.from_documents(documents_for_bm25, index_version)
+    if bm25_index is None or not bm25_index.n_docs:
         print(
-            "Warning: BM25Retriever could not be initialized (no documents found). Falling back to semantic retriever."
+            "Warning: BM25 index could not be initialized (no documents found). Falling back to semantic retrieval."
+        )
+        bm25_index = None
+
+    retriever = HybridRetriever(
+        embeddings_model,
+        RETRIEVER_CONFIG,
+        flat_index=flat_index,
+        collection=collection,
+        bm25_index=bm25_index,
+    )
+    print("Hybrid retriever created.")
+    return {"embeddings": embeddings_model, "retriever": retriever}
+
+
+def build_rag_queries(hourly_forecast_data):
+    """
+    Derive the RAG queries for one forecast day from its hourly data.
+
+    :param hourly_forecast_data: Dictionary of {time: {var: value}} for one day.
+    :return: BASE_RAG_QUERY followed by the queries of the conditions that
+             hold for at least MIN_FEATURE_HOURS hours.
+    """
+    queries = [BASE_RAG_QUERY]
+    hours = list(hourly_forecast_data.values())
+    for test, query in FEATURE_QUERIES:
+        if sum(1 for hour in hours if test(hour)) >= MIN_FEATURE_HOURS:
+            queries.append(query)
+    return queries
+
+
+def prefetch_contexts(queries):
+    """
+    Retrieve every query that is not cached yet, in bulk.
+
+    All the missing queries are embedded in one call and searched in the
+    vector store in bulk. The results land in the retrieval cache, so later
+    retrieve_chunks calls for these queries do not touch the models.
+
+    :param queries: Query texts for all locations and days of a run.
+    """
+    index_version = read_index_version(CHROMA_DB_PATH)
+    missing = [
+        query
+        for query in dict.fromkeys(queries)
+        if _RETRIEVAL_CACHE.get(
+            retrieval_cache_key(query, RETRIEVER_CONFIG, index_version)
+        )
+        is None
+    ]
+    if not missing:
+        return
+
+    print(f"Prefetching RAG context for {len(missing)} queries...")
+    retriever = get_retriever()
+    with span("retrieval", queries=len(missing)):
+        results = retriever.search_many(missing)
+    for query, chunks in zip(missing, results):
+        _RETRIEVAL_CACHE.put(
+            retrieval_cache_key(query, RETRIEVER_CONFIG, index_version), chunks
         )
-        ensemble_retriever = semantic_retriever  # Fallback
+    print(f"Retrieval timings: {_format_timings(retriever.last_timings)}")
+
+
+def _format_timings(timings):
+    return ", ".join(f"{stage} {ms:.1f}" for stage, ms in timings.items())
+
+
+def retrieve_chunks(rag_query):
+    """
+    Retrieve the RAG chunks for a query.
+
+    Results are cached by (query, RETRIEVER_CONFIG, index version), so the
+    embedding and hybrid search run once per query and index version.
+
+    :param rag_query: The query text sent to the retriever.
+    :return: List of retrieved chunk texts, best first.
+    """
+    index_version = read_index_version(CHROMA_DB_PATH)
+    cache_key = retrieval_cache_key(rag_query, RETRIEVER_CONFIG, index_version)
+    chunks = _RETRIEVAL_CACHE.get(cache_key)
+    if chunks is not None:
+        return chunks
+
+    retriever = get_retriever()
+    with span("retrieval", cached=False):
+        chunks = retriever.search(rag_query)
+    print(f"Retrieval timings: {_format_timings(retriever.last_timings)}")
+    _RETRIEVAL_CACHE.put(cache_key, chunks)
+    return chunks
+
+
+def retrieve_context(rag_queries):
+    """
+    Build the RAG context for a forecast day from its queries.
+
+    Chunks are taken round-robin across the queries, deduplicated, capped
+    at MAX_CONTEXT_CHUNKS and trimmed to the context token budget.
+
+    :param rag_queries: Query texts, e.g. from build_rag_queries.
+    :return: The retrieved chunks joined by separators.
+    """
+    ranked_lists = [retrieve_chunks(query) for query in rag_queries]
+    selected = []
+    for rank in range(max((len(chunks) for chunks in ranked_lists), default=0)):
+        for chunks in ranked_lists:
+            if rank < len(chunks) and chunks[rank] not in selected:
+                selected.append(chunks[rank])
+    selected = trim_to_token_budget(
+        selected[:MAX_CONTEXT_CHUNKS], RETRIEVER_CONFIG["context_token_budget"]
+    )
+    return "\n\n---\n\n".join(selected)
+
+
+def _skipped_output(reason):
+    """Output dictionary of a model that was not requested or failed."""
+    return {
+        "precis": "",
+        "long_form_text": f"Error: {reason}",
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "latency_seconds": 0.0,
+    }
+
+
+def _request_summaries(model, send):
+    """
+    Request the summaries of a day from one model, within the run budgets.
+
+    :param send: Sends the request; returns (response, response text).
+    :return: Dictionary with "precis", "long_form_text", "input_tokens",
+             "output_tokens" and "latency_seconds". A skipped or failed
+             request has an empty precis and an "Error: ..." long_form_text.
+    """
+    budget_reason = get_account().check(model)
+    if budget_reason:
+        print(f"Model {model}: not requested, {budget_reason}.")
+        get_account().record_skipped(model)
+        return _skipped_output(f"{budget_reason}.")
+
+    # Record start time
+    start_time = time.time()
+    response = None
+    output = _skipped_output("No response.")
+    try:
+        with span("llm_call", model=model) as attributes:
+            response, response_content = send()
+            attributes["input_tokens"], attributes["output_tokens"] = usage_tokens(
+                response
+            )
+        print(f"Response: {response_content}")
+
+        # Try to parse as JSON
+        try:
+            with span("json_parse", model=model):
+                output_data = LLMResponse.model_validate_json(response_content)
+            output["precis"] = output_data.precis
+            output["long_form_text"] = output_data.long_form_text
+            print(f"\nModel {model}: Successfully parsed and validated JSON.")
+        except ValidationError as e:
+            output["long_form_text"] = f"Error: invalid JSON from model {model}: {e}"
+            print("\nFailed to parse as JSON. Response is not valid JSON.")
+
+    except Exception as e:
+        output["long_form_text"] = f"Error during API call for model {model}: {e}"
+        print(output["long_form_text"])
+
+    # Calculate latency
+    output["latency_seconds"] = time.time() - start_time
+    # Extract token usage
+    output["input_tokens"], output["output_tokens"] = usage_tokens(response)
+    get_account().record(
+        model,
+        output["input_tokens"],
+        output["output_tokens"],
+        output["latency_seconds"],
+        failed=output["long_form_text"].startswith("Error"),
+    )
+
+    # Print to console (optional, but good for live feedback)
+    print(f"Input Tokens: {output['input_tokens']}")
+    print(f"Output Tokens: {output['output_tokens']}")
+    print(f"Latency: {output['latency_seconds']:.4f} seconds")
+    return output
+
+
+def apply_llm(hourly_forecast_data, var_definitions, rag_queries=None):
+    """
+    Apply the LLM to generate summaries from hourly forecast data.
+
+    :param hourly_forecast_data: Dictionary containing hourly forecast data.
+    :param var_definitions: definitions of the selected variables.
+    :param rag_queries: RAG queries for the day; derived from
+                        hourly_forecast_data when not given.
+    """
+    client = groq_client()
 
     # Combine both retrievers
     # ensemble_retriever = EnsembleRetriever(
     #    retrievers=[semantic_retriever, text_retriever], weights=[0.7, 0.3]
     # )
-    # Formulate Query for RAG
-    rag_query = (
-        "Guidelines for writing weather precis and detailed "
-        "summaries, including cloud, precipitation, and wind descriptions "
-        "and definitions of common weather terms."
-    )
-    print(f"RAG Query: {rag_query}")
+    # Formulate Queries for RAG
+    if rag_queries is None:
+        rag_queries = build_rag_queries(hourly_forecast_data)
+    print(f"RAG Queries: {rag_queries}")
 
     # Retrieve and Format Context
-    retrieved_rag_docs = ensemble_retriever.invoke(rag_query)
-    formatted_rag_context = "\n\n---\n\n".join(
-        [doc.page_content for doc in retrieved_rag_docs]
-    )
+    formatted_rag_context = retrieve_context(rag_queries)
     # print(
     #    f"Retrieved RAG context: {formatted_rag_context}..."
     # )  # Print start of context
@@ -153,108 +449,39 @@ def apply_llm(hourly_forecast_data, var_definitions):
     {hourly_forecast_data}
     """
 
-    model_outputs = {}
-    for model in [
-        # "deepseek/deepseek-chat-v3-0324:free",
-        # "meta-llama/llama-4-maverick:free",
-        # "mistralai/mistral-small-24b-instruct-2501:free",
-        "llama-3.1-8b-instant",
-        "deepseek-r1-distill-llama-70b",
-        "mistral-saba-24b",
-    ]:
-        # Record start time
-        start_time = time.time()
-        response_content = "Error: No response."
-        input_tokens = "N/A"
-        output_tokens = "N/A"
-        latency_seconds = 0.0  # Initialize latency
-
-        try:
-            completion = client.chat.completions.create(
-                # completion = CLIENT.beta.chat.completions.parse(
-                extra_body={},
-                model=model,  # Simplified
-                messages=[
-                    {
-                        "role": "user",
-                        "content": PROMPT,
-                    }
-                ],
-                # response_format=LLMResponse,
-                response_format={"type": "json_object"},
-            )
-            response_content = completion.choices[0].message.content
+    def ask_groq(model):
+        completion = client.chat.completions.create(
+            # completion = CLIENT.beta.chat.completions.parse(
+            extra_body={},
+            model=model,  # Simplified
+            messages=[
+                {
+                    "role": "user",
+                    "content": PROMPT,
+                }
+            ],
+            # response_format=LLMResponse,
+            response_format={"type": "json_object"},
+        )
+        return completion, completion.choices[0].message.content
 
-            # Try to parse as JSON
-            try:
-                output_data = LLMResponse.model_validate_json(response_content)
-                parsed_output_str = output_data.model_dump_json(indent=2)
-                print(f"\nModel {model}: Successfully parsed and validated JSON.")
-                print("\nSuccessfully parsed as JSON!")
-            except json.JSONDecodeError:
-                print("\nFailed to parse as JSON. Response is not valid JSON.")
-
-        except Exception as e:
-            response_content = f"Error during API call for model {model}: {e}"
-            print(response_content)
-
-        # Record end time
-        end_time = time.time()
-        # Calculate latency
-        latency_seconds = end_time - start_time
-        # Extract token usage
-        input_tokens = 0
-        output_tokens = 0
-        if completion.usage:
-            input_tokens = completion.usage.prompt_tokens
-            output_tokens = completion.usage.completion_tokens
-
-        # Print to console (optional, but good for live feedback)
-        print(f"Response: {response_content}")
-        print(f"Input Tokens: {input_tokens}")
-        print(f"Output Tokens: {output_tokens}")
-        print(f"Latency: {latency_seconds:.4f} seconds")
-
-        model_outputs[model] = {
-            "precis": output_data.precis,
-            "long_form_text": output_data.long_form_text,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "latency_seconds": latency_seconds,
-        }
+    def ask_gemini():
+        # the client is only built when Gemini is requested
+        response = genai_client().models.generate_content(
+            model=GEMINI_MODEL,
+            contents=PROMPT,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": LLMResponse,
+            },
+        )
+        return response, response.text
 
+    model_outputs = {}
+    for model in GROQ_RAG_MODELS:
+        model_outputs[model] = _request_summaries(model, partial(ask_groq, model))
     # Apply gemini model
-    start_time = time.time()
-    gemini_input_tokens = 0
-    gemini_output_tokens = 0
-
-    response = gclient.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=PROMPT,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": LLMResponse,
-        },
-    )
-    gemini_response = response.text
-    # gemini_output = LLMResponse.model_validate_json(gemini_response)
-    end_time = time.time()
-    latency_seconds = end_time - start_time
-    print(f"Gemini Response: {gemini_response}")
-    print(f"Gemini Latency: {latency_seconds:.4f} seconds")
-
-    if hasattr(response, "usage_metadata") and response.usage_metadata:
-        gemini_input_tokens = response.usage_metadata.prompt_token_count
-        gemini_output_tokens = response.usage_metadata.candidates_token_count
-
-    gemini_output_data = LLMResponse.model_validate_json(gemini_response)
-    model_outputs["gemini-2.0-flash"] = {
-        "precis": gemini_output_data.precis,
-        "long_form_text": gemini_output_data.long_form_text,
-        "input_tokens": gemini_input_tokens,
-        "output_tokens": gemini_output_tokens,
-        "latency_seconds": latency_seconds,
-    }
+    model_outputs[GEMINI_MODEL] = _request_summaries(GEMINI_MODEL, ask_gemini)
 
     # Return the model outputs
     return model_outputs
@@ -0,0 +1,234 @@
+"""
+Similarity metrics between generated and BoM forecast texts.
+
+Cheap, batched metrics that can run on every row:
+    - token_f1: F1 of the overlapping word tokens (bag of words)
+    - rouge_l: ROUGE-L F1, from the longest common token subsequence
+    - embedding_cosine: cosine similarity of the bge-small embeddings also
+      used by the RAG pipeline
+and BERTScore F1 (bert_score), which is much slower on CPU.
+
+METRIC_MODES selects which metrics run. The mode is set with the
+METRICS_MODE setting (environment or .env): "iterate" gives scores in
+seconds while working on prompts, "report" adds BERTScore for final runs.
+"""
+
+import os
+import re
+import threading
+
+import dotenv
+import numpy as np
+
+from bert_evaluator import get_bert_evaluator
+from pipeline import start_background
+from tracing import span
+
+dotenv.load_dotenv()
+
+METRIC_MODES = {
+    "iterate": ["token_f1", "rouge_l", "embedding_cosine"],
+    "report": ["token_f1", "rouge_l", "embedding_cosine", "bert_score"],
+}
+METRICS_MODE = os.getenv("METRICS_MODE", "report")
+# same embedding model as the RAG knowledge base
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+TOKEN_REGEX = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase word tokens of text, punctuation removed."""
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def _count_matrices(candidate_tokens, reference_tokens):
+    """Token count matrices of shape (n_pairs, vocab size) over a shared vocabulary."""
+    vocab = {}
+    rows = []
+    for tokens in candidate_tokens + reference_tokens:
+        rows.append([vocab.setdefault(token, len(vocab)) for token in tokens])
+    counts = np.zeros((len(rows), max(len(vocab), 1)), dtype=np.int32)
+    for i, ids in enumerate(rows):
+        np.add.at(counts[i], ids, 1)
+    n_pairs = len(candidate_tokens)
+    return counts[:n_pairs], counts[n_pairs:]
+
+
+def _f1(overlap, candidate_lengths, reference_lengths):
+    """F1 of precision overlap / candidate length and recall overlap / reference length."""
+    overlap = np.asarray(overlap, dtype=np.float64)
+    precision = np.divide(
+        overlap, candidate_lengths, out=np.zeros_like(overlap), where=candidate_lengths > 0
+    )
+    recall = np.divide(
+        overlap, reference_lengths, out=np.zeros_like(overlap), where=reference_lengths > 0
+    )
+    total = precision + recall
+    return np.divide(
+        2 * precision * recall, total, out=np.zeros_like(overlap), where=total > 0
+    )
+
+
+def token_f1(candidates, references):
+    """
+    Token overlap F1 of each (candidate, reference) pair.
+
+    :return: numpy array of scores, one per pair.
+    """
+    candidate_counts, reference_counts = _count_matrices(
+        [tokenize(text) for text in candidates], [tokenize(text) for text in references]
+    )
+    overlap = np.minimum(candidate_counts, reference_counts).sum(axis=1)
+    return _f1(overlap, candidate_counts.sum(axis=1), reference_counts.sum(axis=1))
+
+
+def lcs_length(a, b):
+    """
+    Length of the longest common subsequence of token lists a and b.
+
+    Bit-parallel (Hyyrö): each bit of v is one position of b, so a row of
+    the dynamic programming table is updated with a few integer operations.
+    """
+    if not a or not b:
+        return 0
+    matches = {}
+    for i, token in enumerate(b):
+        matches[token] = matches.get(token, 0) | (1 << i)
+    mask = (1 << len(b)) - 1
+    v = mask
+    for token in a:
+        u = v & matches.get(token, 0)
+        v = ((v + u) | (v - u)) & mask
+    return len(b) - bin(v).count("1")
+
+
+def rouge_l(candidates, references):
+    """
+    ROUGE-L F1 of each (candidate, reference) pair.
+
+    :return: numpy array of scores, one per pair.
+    """
+    candidate_tokens = [tokenize(text) for text in candidates]
+    reference_tokens = [tokenize(text) for text in references]
+    overlap = [lcs_length(c, r) for c, r in zip(candidate_tokens, reference_tokens)]
+    return _f1(
+        overlap,
+        np.array([len(tokens) for tokens in candidate_tokens]),
+        np.array([len(tokens) for tokens in reference_tokens]),
+    )
+
+
+def embedding_cosine(candidates, references, embeddings):
+    """
+    Cosine similarity of the embeddings of each (candidate, reference) pair.
+
+    All texts are embedded in one embed_documents call.
+
+    :param embeddings: LangChain embeddings, see embedding_runtime.load_embeddings.
+    :return: numpy array of scores, one per pair.
+    """
+    candidates = list(candidates)
+    vectors = np.asarray(
+        embeddings.embed_documents(candidates + list(references)), dtype=np.float32
+    )
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    n_pairs = len(candidates)
+    return np.sum(vectors[:n_pairs] * vectors[n_pairs:], axis=1)
+
+
+class MetricsEvaluator:
+    """
+    Batched evaluation of queued (candidate, reference) pairs.
+
+    :param mode: Key of METRIC_MODES; defaults to METRICS_MODE.
+    :param metrics: List of metric names, overrides mode.
+    """
+
+    def __init__(self, mode=None, metrics=None):
+        self.metrics = metrics or METRIC_MODES[mode or METRICS_MODE]
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+        self._pending = []  # (sheet, {metric: cell}, candidate, reference)
+
+    @property
+    def embeddings(self):
+        """The bge-small embeddings, loaded on first use."""
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                from embedding_runtime import load_embeddings
+
+                self._embeddings = load_embeddings(EMBEDDING_MODEL_NAME)
+            return self._embeddings
+
+    def warm_up(self):
+        """
+        Load the models of the selected metrics in a background thread.
+
+        Called at the start of a run, so the models load while the forecasts
+        are fetched; a score() call during the warm-up waits for it.
+
+        :return: The started thread, or None if no metric needs a model.
+        """
+        loaders = []
+        if "embedding_cosine" in self.metrics:
+            loaders.append(lambda: self.embeddings)
+        if "bert_score" in self.metrics:
+            loaders.append(lambda: get_bert_evaluator().scorer)
+        if not loaders:
+            return None
+        return start_background(
+            "metrics-warm-up", lambda: [load() for load in loaders]
+        )
+
+    def score(self, candidates, references):
+        """
+        Calculate the selected metrics for pairs of candidate and reference texts.
+
+        :param candidates: The generated texts from the LLM.
+        :param references: The original texts from BOM.
+        :return: Dictionary of {metric: list of scores, one per pair}.
+        """
+        candidates = list(candidates)
+        references = list(references)
+        if not candidates:
+            return {metric: [] for metric in self.metrics}
+        scores = {}
+        for metric in self.metrics:
+            with span(f"score_{metric}", pairs=len(candidates)):
+                if metric == "token_f1":
+                    scores[metric] = token_f1(candidates, references).tolist()
+                elif metric == "rouge_l":
+                    scores[metric] = rouge_l(candidates, references).tolist()
+                elif metric == "embedding_cosine":
+                    scores[metric] = embedding_cosine(
+                        candidates, references, self.embeddings
+                    ).tolist()
+                elif metric == "bert_score":
+                    scores[metric] = get_bert_evaluator().score(candidates, references)
+                else:
+                    raise ValueError(f"Unknown metric: {metric}")
+        return scores
+
+    def add(self, sheet, cells, candidate, reference):
+        """
+        Queue a pair; flush() writes each selected metric to its cell.
+
+        :param sheet: Worksheet, or any mapping, the scores are written to.
+        :param cells: Dictionary of {metric: cell coordinate or key}, e.g. {"rouge_l": "I4"}.
+        """
+        self._pending.append((sheet, cells, candidate, reference))
+
+    def flush(self):
+        """Score every queued pair in batches and write the scores to their cells."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        print(f"Scoring {len(pending)} pairs with {', '.join(self.metrics)}...")
+        scores = self.score(
+            [candidate for _, _, candidate, _ in pending],
+            [reference for _, _, _, reference in pending],
+        )
+        for i, (sheet, cells, _, _) in enumerate(pending):
+            for metric, values in scores.items():
+                if metric in cells:
+                    sheet[cells[metric]] = values[i]
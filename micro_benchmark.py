@@ -0,0 +1,342 @@
+"""
+Micro-benchmarks of the data-shaping functions run for every location-day.
+
+Each benchmark runs one function over the fixtures of n distinct sites, for
+every n in SITE_COUNTS (or the counts given with --sites). The fixtures are
+synthetic sites (synthetic_forecasts, seeded, dated FIXTURE_DATE), so the
+inputs are the same from run to run.
+They are generated BLOCK_SITES sites at a time, every benchmark is run on the
+block and the block is dropped, so memory does not grow with n; generating
+them is not timed. parse_forecast_page parses the BoM page of each fixture.
+fetch_forecast_page replays the page from the cassettes written once to
+FIXTURE_DIR, which hold the first FIXTURE_SITES sites, so it is only run up
+to that many sites.
+
+For each function and n the time summed over the blocks (each the median of
+N_RUNS runs, one run from LARGE_SITES sites up) and the peak traced memory of
+one more run over the first block are reported and compared with
+BASELINE_FILE:
+
+    python micro_benchmark.py --save        # store the baselines
+    python micro_benchmark.py [function ...]  # compare with them
+    python micro_benchmark.py --sites=10000   # other site counts
+    python micro_benchmark.py --sites=saved   # the site counts with a baseline
+
+SITE_COUNTS stops at 1,000 sites so that a default run takes a few minutes;
+10,000 sites take about a quarter of an hour, most of it in
+convert_daily_forecasts_to_tabular and in generating the fixtures, and are
+run with --sites=10000 (or --sites=saved once their baselines are saved).
+Saving merges the measured site counts into the baselines of the others.
+A comparison lists the measurements without a baseline and the baselines
+that were not measured, so a partial run is not mistaken for a full one.
+
+A function more than TIME_TOLERANCE slower or MEMORY_TOLERANCE larger than
+its baseline (and by more than the noise slack) is a regression, and the
+exit status is 1. Baselines depend on the machine, so save them on the
+machine the comparison runs on.
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date
+
+FIXTURE_DIR = "benchmarks/fixtures"
+BASELINE_FILE = "benchmarks/micro_baseline.json"
+# the fixtures are replayed, and the spans of the benchmarked functions are not kept
+os.environ["CASSETTE_MODE"] = "replay"
+os.environ["CASSETTE_DIR"] = FIXTURE_DIR
+os.environ["TRACING"] = "0"
+
+from bom_scrapper import (  # noqa: E402
+    BOM_FORECAST_URL,
+    REQUEST_HEADERS,
+    parse_forecast_page,
+)
+from cassette import http_get  # noqa: E402
+from llm_daily_overview import VARS  # noqa: E402
+from synthetic_forecasts import make_sites, site_forecasts, write_cassette  # noqa: E402
+from utils import (  # noqa: E402
+    convert_daily_forecasts_to_tabular,
+    convert_to_tabular,
+    split_json_by_date,
+)
+from var_dictionary import get_var_definitions  # noqa: E402
+
+SITE_COUNTS = (1, 100, 1000)
+FIXTURE_DATE = date(2025, 6, 2)
+# sites with recorded cassettes
+FIXTURE_SITES = 100
+# sites generated, benchmarked and dropped at a time
+BLOCK_SITES = 100
+N_RUNS = 3
+# site counts from which the time of each block is of a single run
+LARGE_SITES = 1000
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+# differences below these are noise, whatever the tolerance
+TIME_SLACK_SECONDS = 0.005
+MEMORY_SLACK_MIB = 0.1
+
+
+def write_fixtures():
+    """Write the cassettes of the first FIXTURE_SITES sites, if missing."""
+    if not os.path.exists(os.path.join(FIXTURE_DIR, "sites.json")):
+        print(f"Writing the fixtures to {FIXTURE_DIR}")
+        write_cassette(make_sites(FIXTURE_SITES), FIXTURE_DIR, start_date=FIXTURE_DATE)
+
+
+def iter_fixture_blocks(n_sites):
+    """
+    The fixtures of n_sites distinct sites, BLOCK_SITES at a time.
+
+    :return: Iterator of lists of dictionaries with the site "label", "state"
+             and BoM page "url", its JW "payload", its "data" split by date
+             and its BoM page "html".
+    """
+    sites = list(make_sites(n_sites).items())
+    for start in range(0, n_sites, BLOCK_SITES):
+        block = []
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            for label, site in sites[start : start + BLOCK_SITES]:
+                payload, html = site_forecasts(label, site, FIXTURE_DATE)
+                block.append(
+                    {
+                        "label": label,
+                        "state": site["state"],
+                        "url": BOM_FORECAST_URL.format(state=site["state"], city=label),
+                        "payload": payload,
+                        "data": split_json_by_date(payload, VARS),
+                        "html": html,
+                    }
+                )
+        yield block
+
+
+def bench_split_json_by_date(fixture):
+    split_json_by_date(fixture["payload"], VARS)
+
+
+def bench_convert_to_tabular(fixture):
+    convert_to_tabular(fixture["data"])
+
+
+def bench_convert_daily_forecasts_to_tabular(fixture):
+    for hours in fixture["data"].values():
+        convert_daily_forecasts_to_tabular(hours)
+
+
+def bench_get_var_definitions(fixture):
+    # once per location-day, like the prompts
+    for _ in fixture["data"]:
+        get_var_definitions(VARS)
+
+
+def bench_fetch_forecast_page(fixture):
+    http_get(fixture["url"], headers=REQUEST_HEADERS, timeout=10)
+
+
+def bench_parse_forecast_page(fixture):
+    parse_forecast_page(fixture["html"])
+
+
+BENCHMARKS = {
+    "split_json_by_date": bench_split_json_by_date,
+    "convert_to_tabular": bench_convert_to_tabular,
+    "convert_daily_forecasts_to_tabular": bench_convert_daily_forecasts_to_tabular,
+    "get_var_definitions": bench_get_var_definitions,
+    "fetch_forecast_page": bench_fetch_forecast_page,
+    "parse_forecast_page": bench_parse_forecast_page,
+}
+# benchmarks that replay the cassettes, run up to FIXTURE_SITES sites
+RECORDED_BENCHMARKS = {"fetch_forecast_page"}
+
+
+def _run(bench, fixtures):
+    # the functions print progress, which is not part of the measurement
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for fixture in fixtures:
+            bench(fixture)
+
+
+def time_block(bench, fixtures, n_runs):
+    """Median seconds of n_runs runs of bench over the fixtures."""
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        _run(bench, fixtures)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def peak_memory(bench, fixtures):
+    """Peak MiB traced in a run of bench over the fixtures, above the memory in use before it."""
+    # a separate run, tracemalloc slows allocations down
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        _run(bench, fixtures)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - baseline) / 2**20
+
+
+def measure(names, n_sites):
+    """
+    Time and peak memory of the benchmarks over n_sites fixtures.
+
+    :return: Dictionary of {name: {"seconds", "peak_mib"}}.
+    """
+    names = [
+        name
+        for name in names
+        if name not in RECORDED_BENCHMARKS or n_sites <= FIXTURE_SITES
+    ]
+    n_runs = 1 if n_sites >= LARGE_SITES else N_RUNS
+    results = {name: {"seconds": 0.0} for name in names}
+    for block in iter_fixture_blocks(n_sites):
+        for name in names:
+            results[name]["seconds"] += time_block(BENCHMARKS[name], block, n_runs)
+            if "peak_mib" not in results[name]:
+                results[name]["peak_mib"] = peak_memory(BENCHMARKS[name], block)
+    return results
+
+
+def regressions(results, baselines):
+    """
+    The measurements over their baseline tolerance.
+
+    :return: List of "function at n sites: reason" strings.
+    """
+    found = []
+    for name, by_sites in results.items():
+        for n_sites, result in by_sites.items():
+            baseline = baselines.get(name, {}).get(n_sites)
+            if baseline is None:
+                continue
+            if result["seconds"] > max(
+                baseline["seconds"] * (1 + TIME_TOLERANCE),
+                baseline["seconds"] + TIME_SLACK_SECONDS,
+            ):
+                found.append(
+                    f"{name} at {n_sites} sites: {result['seconds']:.3f} s, "
+                    f"baseline {baseline['seconds']:.3f} s"
+                )
+            if result["peak_mib"] > max(
+                baseline["peak_mib"] * (1 + MEMORY_TOLERANCE),
+                baseline["peak_mib"] + MEMORY_SLACK_MIB,
+            ):
+                found.append(
+                    f"{name} at {n_sites} sites: {result['peak_mib']:.1f} MiB, "
+                    f"baseline {baseline['peak_mib']:.1f} MiB"
+                )
+    return found
+
+
+def unmatched(results, baselines):
+    """
+    The measurements without a baseline, and the baselines not measured.
+
+    :return: (list of "function at n sites" without a baseline, list of
+             "function at n sites" with a baseline but not measured), for
+             the functions of results.
+    """
+    without_baseline = [
+        f"{name} at {n_sites} sites"
+        for name, by_sites in results.items()
+        for n_sites in by_sites
+        if n_sites not in baselines.get(name, {})
+    ]
+    not_measured = [
+        f"{name} at {n_sites} sites"
+        for name in results
+        for n_sites in baselines.get(name, {})
+        if n_sites not in results[name]
+    ]
+    return without_baseline, not_measured
+
+
+def main(names, save=False, site_counts=SITE_COUNTS):
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}; expected some of {list(BENCHMARKS)}")
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    if site_counts == "saved":
+        site_counts = sorted(
+            {int(n_sites) for name in names for n_sites in baselines.get(name, {})}
+        )
+        if not site_counts:
+            raise ValueError(f"No saved baselines in {BASELINE_FILE} for {names}")
+
+    write_fixtures()
+    results = {name: {} for name in names}
+    for n_sites in site_counts:
+        print(f"Measuring {n_sites} sites...")
+        # JSON keys, so the results compare with the saved baselines
+        for name, result in measure(names, n_sites).items():
+            results[name][str(n_sites)] = result
+
+    print(
+        f"{'function':<36}{'sites':>7}{'seconds':>10}{'µs/site':>10}"
+        f"{'peak MiB':>10}{'baseline s':>12}"
+    )
+    for name, by_sites in results.items():
+        for n_sites, result in by_sites.items():
+            baseline = baselines.get(name, {}).get(n_sites)
+            baseline_text = f"{baseline['seconds']:>12.3f}" if baseline else f"{'-':>12}"
+            print(
+                f"{name:<36}{n_sites:>7}{result['seconds']:>10.3f}"
+                f"{1e6 * result['seconds'] / int(n_sites):>10.0f}"
+                f"{result['peak_mib']:>10.2f}{baseline_text}"
+            )
+
+    if save:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(
+                {
+                    **baselines,
+                    **{
+                        name: {**baselines.get(name, {}), **by_sites}
+                        for name, by_sites in results.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+        print(f"Baselines saved to {BASELINE_FILE}")
+        return
+
+    without_baseline, not_measured = unmatched(results, baselines)
+    if without_baseline:
+        print(f"Without a baseline: {', '.join(without_baseline)}")
+    if not_measured:
+        print(f"Baselines not measured in this run: {', '.join(not_measured)}")
+    found = regressions(results, baselines)
+    if found:
+        print("Regressions:")
+        for regression in found:
+            print(f"    {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    save = "--save" in args
+    site_counts = SITE_COUNTS
+    for arg in args:
+        if arg == "--sites=saved":
+            site_counts = "saved"
+        elif arg.startswith("--sites="):
+            site_counts = [int(n) for n in arg[len("--sites="):].split(",")]
+    names = [arg for arg in args if not arg.startswith("--")]
+    main(names or list(BENCHMARKS), save=save, site_counts=site_counts)
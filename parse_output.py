@@ -1,7 +1,34 @@
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import openpyxl
 from typing import List, Any, Optional
 import pandas as pd
 
+from metrics import METRIC_MODES, METRICS_MODE, MetricsEvaluator
+
+OVERVIEW_GLOB = "daily_overviews/*.xlsx"
+OVERVIEW_SHEET = "overview"
+# row of the column headers in the overview sheet, the days follow it
+OVERVIEW_HEADER_ROW = 3
+EVALUATION_PATH = "daily_overviews/evaluation.csv"
+# text columns of the BoM forecasts; the generated texts end with the same suffix
+REFERENCE_COLUMNS = {"_long_form": "bom_long_form", "_precis": "bom_precis"}
+# <location>_<YYYY_MM_DD_HH_MM[_SS]><suffix>.xlsx; locations may contain "_"
+OVERVIEW_FILE_PATTERN = re.compile(r"(.+)_\d{4}(?:_\d{2}){4,5}")
+
+
+def overview_location(file_path: str) -> str:
+    """
+    The location label of an overview workbook, the text before its run timestamp.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    match = OVERVIEW_FILE_PATTERN.match(name)
+    return match.group(1) if match else name
+
 
 def read_first_sheet_with_openpyxl(
     file_path: str,
@@ -100,25 +127,167 @@ def read_first_sheet_to_dataframe(file_path: str) -> Optional[pd.DataFrame]:
         return None
 
 
+def _overview_columns(header):
+    """
+    Unique column names for the header row of an overview sheet.
+
+    Metric columns (e.g. the several "bert_score" columns) are named after
+    the generated text column on their left: "deepseek_long_form_bert_score".
+    """
+    metric_names = {m for metrics in METRIC_MODES.values() for m in metrics}
+    columns = []
+    text_column = None
+    for i, column in enumerate(header):
+        if column is None:
+            column = f"column_{i}"
+        elif column in metric_names and text_column:
+            column = f"{text_column}_{column}"
+        elif column.endswith(tuple(REFERENCE_COLUMNS)) and not column.startswith("bom_"):
+            text_column = column
+        if column in columns:
+            column = f"{column}_{i}"
+        columns.append(column)
+    return columns
+
+
+def read_overview_sheet(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Reads the day rows of the "overview" sheet of a daily overview workbook.
+
+    The workbook is opened read-only and its rows are streamed; the hourly
+    day sheets are never loaded.
+
+    Args:
+        file_path: The path to the .xlsx file.
+
+    Returns:
+        A DataFrame with one row per day and the sheet's columns, plus
+        source_file, location and issued_at. Returns None if the file
+        cannot be read.
+    """
+    try:
+        workbook = openpyxl.load_workbook(filename=file_path, read_only=True)
+    except Exception as e:
+        print(f"An error occurred while opening '{file_path}': {e}")
+        return None
+    try:
+        if OVERVIEW_SHEET not in workbook.sheetnames:
+            print(f"Error: No '{OVERVIEW_SHEET}' sheet in '{file_path}'.")
+            return None
+        rows = workbook[OVERVIEW_SHEET].iter_rows(values_only=True)
+        issued_at = None
+        header = None
+        data_rows = []
+        for row_number, values in enumerate(rows, 1):
+            if row_number == 1:
+                issued_at = values[1] if len(values) > 1 else None
+            elif row_number == OVERVIEW_HEADER_ROW:
+                header = _overview_columns(values)
+            elif row_number > OVERVIEW_HEADER_ROW:
+                # the days end at the first empty row, the comments follow it
+                if not values or values[0] is None:
+                    break
+                data_rows.append(values)
+    finally:
+        workbook.close()
+
+    if header is None:
+        print(f"Sheet '{OVERVIEW_SHEET}' in '{file_path}' has no header row.")
+        return pd.DataFrame()
+    df = pd.DataFrame([row[: len(header)] for row in data_rows], columns=header)
+    df = df.loc[:, ~df.columns.str.startswith("column_")]
+    df.insert(0, "source_file", os.path.basename(file_path))
+    df.insert(1, "location", overview_location(file_path))
+    df.insert(2, "issued_at", issued_at)
+    return df
+
+
+def read_overviews(pattern: str = OVERVIEW_GLOB, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reads the overview sheets of all archived workbooks into one table.
+
+    Args:
+        pattern: Glob pattern of the workbooks.
+        workers: Number of worker processes; defaults to the number of CPUs.
+
+    Returns:
+        A DataFrame with the day rows of every workbook that could be read.
+    """
+    file_paths = sorted(glob.glob(pattern))
+    print(f"Reading {len(file_paths)} workbooks matching '{pattern}'...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frames = [
+            df
+            for df in executor.map(read_overview_sheet, file_paths, chunksize=8)
+            if df is not None and not df.empty
+        ]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def rescore_overviews(df: pd.DataFrame, mode: Optional[str] = None) -> pd.DataFrame:
+    """
+    Recomputes the metrics of every generated text against its BoM text.
+
+    Every column ending in "_long_form" or "_precis" (other than the BoM
+    ones) is scored against bom_long_form or bom_precis. All pairs of all
+    workbooks are scored in one batch, no LLM is called.
+
+    Args:
+        df: Table returned by read_overviews.
+        mode: Metrics mode, see metrics.METRIC_MODES; defaults to METRICS_MODE.
+
+    Returns:
+        The table with a "<text column>_<metric>" column per text column and metric.
+    """
+    evaluator = MetricsEvaluator(mode)
+    pairs = []  # (row index, candidate column, candidate, reference)
+    for suffix, reference_column in REFERENCE_COLUMNS.items():
+        if reference_column not in df.columns:
+            continue
+        candidate_columns = [
+            column
+            for column in df.columns
+            if column.endswith(suffix) and column != reference_column
+        ]
+        for column in candidate_columns:
+            for index, candidate, reference in zip(
+                df.index, df[column], df[reference_column]
+            ):
+                if isinstance(candidate, str) and isinstance(reference, str):
+                    pairs.append((index, column, candidate, reference))
+
+    print(f"Scoring {len(pairs)} pairs with {', '.join(evaluator.metrics)}...")
+    scores = evaluator.score([p[2] for p in pairs], [p[3] for p in pairs])
+    score_columns = {}
+    for metric, values in scores.items():
+        for (index, column, _, _), value in zip(pairs, values):
+            score_columns.setdefault(f"{column}_{metric}", {})[index] = value
+    df = df.copy()
+    for name, values in score_columns.items():
+        df[name] = pd.Series(values, dtype="float64")
+    return df
+
+
 # --- Example of how to use the function ---
 if __name__ == "__main__":
-    # Replace "your_excel_file.xlsx" with the actual path to your file.
-    # For instance, you could use one of the files from your provided context:
-    # example_file_path = "melbourne_2025_06_04_09_47DS.xlsx"
-
-    # For demonstration, let's assume you have a file named "sample.xlsx"
-    # in the same directory as your script.
-    # You'll need to create this file or change the path.
-
-    files_toparse = [
-        "daily_overviews/melbourne_2025_06_04_09_47DS.xlsx",
-        "daily_overviews/sydney_2025_06_04_09_48DS.xlsx",
-        "daily_overviews/canberra_2025_06_04_09_48DS.xlsx",
-        "daily_overviews/adelaide_2025_06_04_09_49DS.xlsx",
-    ]
+    # Re-score all archived overviews:
+    #     python parse_output.py [iterate|report] [glob pattern]
+    mode = sys.argv[1] if len(sys.argv) > 1 else METRICS_MODE
+    pattern = sys.argv[2] if len(sys.argv) > 2 else OVERVIEW_GLOB
 
-    # Create a dummy sample.xlsx for the example to run
-    sheet_content = read_first_sheet_with_openpyxl(files_toparse[0])
+    overviews = read_overviews(pattern)
+    if overviews.empty:
+        print(f"No overview rows found in '{pattern}'.")
+        sys.exit()
+    evaluation = rescore_overviews(overviews, mode)
+    evaluation.to_csv(EVALUATION_PATH, index=False)
+    print(f"Evaluation of {len(evaluation)} days written to {EVALUATION_PATH}")
 
-    print(f"\nData from '{files_toparse[0]}':")
-    print(sheet_content)
+    score_columns = [
+        column
+        for column in evaluation.columns
+        if any(column.endswith(f"_{metric}") for metric in MetricsEvaluator(mode).metrics)
+    ]
+    print(evaluation.groupby("location")[score_columns].mean())
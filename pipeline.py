@@ -0,0 +1,173 @@
+"""
+Staged producer/consumer pipeline on threads.
+
+Every stage has its own worker threads and a bounded input queue. A worker
+takes an item from its queue, calls the stage function and puts the
+returned items on the next stage's queue. When that queue is full the
+worker blocks, so a slow stage holds back the stage before it
+(backpressure). Network-bound stages (fetching, LLM requests) then
+overlap with CPU-bound ones (scoring), and the run takes about as long as
+its slowest stage rather than the sum of all stages.
+"""
+
+import queue
+import threading
+import time
+
+from tracing import span
+
+# marks the end of a stage's input
+_DONE = object()
+# seconds between checks for a failed stage while blocked on a queue
+_POLL_SECONDS = 0.1
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    :param name: Name used in the timing summary.
+    :param func: Called with one input item; returns a list of output items
+                 (empty to drop the item).
+    :param workers: Number of threads running func.
+    :param queue_size: Capacity of the stage's input queue.
+    :param trace_attributes: Called with an input item; returns the
+                             attributes of the item's "stage_<name>" span,
+                             e.g. {"location": "sydney"}.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=2, trace_attributes=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.trace_attributes = trace_attributes
+        self.items = 0
+        self.busy_seconds = 0.0
+
+
+def run_pipeline(items, stages):
+    """
+    Push items through the stages.
+
+    The first error raised by a stage stops the pipeline and is re-raised.
+
+    :param items: Iterable of inputs of the first stage.
+    :param stages: List of Stage, in order.
+    :return: List of the items returned by the last stage.
+    """
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    remaining_workers = [stage.workers for stage in stages]
+    results = []
+    errors = []
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def put(q, item):
+        while not failed.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        while not failed.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def feed():
+        for item in items:
+            if failed.is_set():
+                return
+            put(queues[0], item)
+        for _ in range(stages[0].workers):
+            put(queues[0], _DONE)
+
+    def work(i):
+        stage = stages[i]
+        output = queues[i + 1] if i + 1 < len(stages) else None
+        while True:
+            item = get(queues[i])
+            if item is _DONE:
+                break
+            try:
+                start = time.perf_counter()
+                attributes = {}
+                if stage.trace_attributes:
+                    attributes = stage.trace_attributes(item)
+                with span(f"stage_{stage.name}", **attributes):
+                    outputs = stage.func(item)
+                with lock:
+                    stage.items += 1
+                    stage.busy_seconds += time.perf_counter() - start
+            except (Exception, SystemExit) as e:
+                # SystemExit too: a stage calling exit() must not hang the pipeline
+                print(f"Pipeline stage '{stage.name}' failed: {e!r}")
+                with lock:
+                    errors.append(e)
+                failed.set()
+                break
+            for result in outputs:
+                if output is None:
+                    with lock:
+                        results.append(result)
+                else:
+                    put(output, result)
+
+        # the last worker of a stage closes the next stage's input
+        with lock:
+            remaining_workers[i] -= 1
+            last = remaining_workers[i] == 0
+        if last and output is not None:
+            for _ in range(stages[i + 1].workers):
+                put(output, _DONE)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for i, stage in enumerate(stages):
+        threads += [
+            threading.Thread(target=work, args=(i,), name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start
+    print(f"Pipeline finished in {elapsed:.1f} s:")
+    for stage in stages:
+        print(
+            f"  {stage.name}: {stage.items} items, {stage.busy_seconds:.1f} s busy "
+            f"({stage.workers} workers)"
+        )
+    return results
+
+
+def start_background(name, func):
+    """
+    Run func() in a daemon thread, e.g. to load a model while the network
+    stages are busy. An error is printed, not raised: the model is then
+    loaded on first use instead.
+
+    :return: The started thread.
+    """
+
+    def run():
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print(f"Background task '{name}' failed: {e!r}")
+            return
+        print(f"Background task '{name}' finished in {time.perf_counter() - start:.1f} s")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
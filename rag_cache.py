@@ -0,0 +1,122 @@
+"""
+Index versioning and retrieval caching for the RAG pipeline.
+
+rag_indexing records the index version in the Chroma directory every time
+the store changes. llm_utils_RAG keys its cached retrieval results by
+(query text, retriever config, index version), so a changed index never
+serves context from the previous one.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+INDEX_MANIFEST_NAME = "manifest.json"
+RETRIEVAL_CACHE_NAME = "retrieval_cache.json"
+
+
+def read_index_manifest(db_path):
+    """
+    Read the manifest written next to the vector store.
+
+    :param db_path: Path of the Chroma persist directory.
+    :return: The manifest dictionary, or an empty dictionary if there is none.
+    """
+    manifest_path = os.path.join(db_path, INDEX_MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_index_manifest(db_path, manifest):
+    """
+    Write the manifest next to the vector store.
+
+    The persisted retrieval cache is dropped when the index version changes.
+
+    :param db_path: Path of the Chroma persist directory.
+    :param manifest: Dictionary to store; must contain "index_version".
+    """
+    previous_version = read_index_version(db_path)
+    os.makedirs(db_path, exist_ok=True)
+    manifest_path = os.path.join(db_path, INDEX_MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    # cached contexts belong to the previous index version
+    cache_path = os.path.join(db_path, RETRIEVAL_CACHE_NAME)
+    if manifest["index_version"] != previous_version and os.path.exists(cache_path):
+        os.remove(cache_path)
+
+
+def content_hash(*parts):
+    """Return the sha256 hex digest of the given strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def read_index_version(db_path):
+    """
+    Return the current index version of the store at db_path.
+
+    Stores built before versioning was added report "unversioned".
+    """
+    return read_index_manifest(db_path).get("index_version", "unversioned")
+
+
+def retrieval_cache_key(query, retriever_config, index_version):
+    """
+    Build the cache key for a retrieval.
+
+    :param query: The query text sent to the retriever.
+    :param retriever_config: Dictionary describing how the retriever is set up.
+    :param index_version: Version of the index the retriever reads from.
+    """
+    config_json = json.dumps(retriever_config, sort_keys=True)
+    return content_hash(query, config_json, index_version)
+
+
+class RetrievalCache:
+    """
+    Retrieved context keyed by retrieval_cache_key, persisted in the store directory.
+
+    Entries are held in memory and written to db_path/retrieval_cache.json so
+    later runs against the same index version reuse them.
+    """
+
+    def __init__(self, db_path):
+        self.cache_path = os.path.join(db_path, RETRIEVAL_CACHE_NAME)
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            entries = self._load()
+            entries[key] = value
+            if not os.path.isdir(os.path.dirname(self.cache_path)):
+                return  # no store on disk, keep the entry in memory only
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.cache_path)
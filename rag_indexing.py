@@ -1,88 +1,450 @@
-from langchain.document_loaders import PyPDFLoader, UnstructuredMarkdownLoader
+import glob
+import hashlib
+import itertools
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chromadb
+import numpy as np
+from pypdf import PdfReader
+from langchain.document_loaders import UnstructuredMarkdownLoader
 from langchain.text_splitter import MarkdownTextSplitter, RecursiveCharacterTextSplitter
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_huggingface import HuggingFaceEmbeddings  # Updated import
-from langchain_community.vectorstores import Chroma
+from embedding_runtime import load_embeddings
 from langchain_core.documents import Document
+from rag_cache import content_hash, read_index_manifest, write_index_manifest
+from bm25_index import load_bm25_index, write_bm25_index
+from flat_index import write_flat_index
 
 # from langchain_community.document_loaders import PyPDFLoader
 # from langchain_community.document_loaders import UnstructuredMarkdownLoader
 
 # --- Configuration ---
-PDF_PATH = "adfdUserGuide.pdf"
-MARKUP_PATH = "bom_terms.md"
+# every *.pdf and *.md under this directory is indexed
+# (currently adfdUserGuide.pdf and bom_terms.md)
+KB_DIR = "bom_kb"
+# loader worker processes and PDF pages extracted per task
+LOADER_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+PAGES_PER_TASK = 16
 
 CHROMA_DB_PATH = "./chroma_db"
+# LangChain's default collection name, so stores it wrote still open
+CHROMA_COLLECTION_NAME = "langchain"
 # EMBEDDING_MODEL_NAME = "dwzhu/e5-base-4k"
 EMBEDDING_MODEL_NAME = (
     "BAAI/bge-small-en-v1.5"  # Good default, balance of speed/accuracy
 )
 # LLM_MODEL_NAME = "gemini-1.5-flash-latest"  # Or "gpt-4o", "llama2"
 
+# Semantic chunking, same rules as SemanticChunker(breakpoint_threshold_type="percentile")
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+"
+SENTENCE_BUFFER = 1  # neighbouring sentences embedded with each sentence
+BREAKPOINT_PERCENTILE = 0.4  # Lower = more chunks
+# Sentences per embed_documents call
+EMBED_BATCH_SIZE = 64
+# "pool": chunk vectors are the mean of their sentence window vectors
+# "reembed": embed each new chunk text again (exact, slower)
+CHUNK_EMBEDDING_MODE = "pool"
+# dtype of the memory-mapped flat vector index ("float32" or "float16")
+FLAT_INDEX_DTYPE = "float32"
+
 
 # --- 1. Ingestion & Parsing ---
-def load_documents(pdf_path, markup_path):
-    print(f"Loading PDF from: {pdf_path}")
-    # Load PDF
-    pdf_loader = PyPDFLoader(f"bom_kb/{pdf_path}")
-    pdf_pages = pdf_loader.load_and_split()  # Automatically splits by page
+def _load_pdf_pages(pdf_path, start, end):
+    """
+    Extract pages [start, end) of a PDF; runs in a loader worker process.
+
+    Pages are split like PyPDFLoader.load_and_split() does.
+    """
+    reader = PdfReader(pdf_path)
+    pages = [
+        Document(
+            page_content=reader.pages[i].extract_text(),
+            metadata={"source": pdf_path, "page": i},
+        )
+        for i in range(start, end)
+    ]
+    return RecursiveCharacterTextSplitter().split_documents(pages)
 
-    # Load Markdown
-    md_loader = UnstructuredMarkdownLoader(f"bom_kb/{markup_path}")
-    md_docs = md_loader.load()  # Loads entire MD file
 
-    # return {"pdf": pdf_pages, "md": md_docs}
-    return pdf_pages + md_docs
+def _pdf_page_ranges(pdf_paths, pages_per_task):
+    for pdf_path in pdf_paths:
+        n_pages = len(PdfReader(pdf_path).pages)
+        print(f"Loading PDF from: {pdf_path} ({n_pages} pages)")
+        for start in range(0, n_pages, pages_per_task):
+            yield pdf_path, start, min(start + pages_per_task, n_pages)
+
+
+def iter_documents(kb_dir=KB_DIR, workers=LOADER_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    Stream the pages of every PDF and Markdown file under kb_dir.
+
+    PDF pages are extracted in parallel worker processes, pages_per_task
+    pages per task. At most 2 * workers tasks are in flight, and pages are
+    yielded in file and page order, so memory stays bounded however large
+    the manuals are.
+
+    :return: Generator of Documents, consecutive per source file.
+    """
+    pdf_paths = sorted(glob.glob(os.path.join(kb_dir, "**", "*.pdf"), recursive=True))
+    md_paths = sorted(glob.glob(os.path.join(kb_dir, "**", "*.md"), recursive=True))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for task in _pdf_page_ranges(pdf_paths, pages_per_task):
+            in_flight.append(executor.submit(_load_pdf_pages, *task))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+    for md_path in md_paths:
+        print(f"Loading Markdown from: {md_path}")
+        # Loads entire MD file
+        yield from UnstructuredMarkdownLoader(md_path).load()
 
 
 # --- 2. Chunking & 3. Embedding (Handled by LangChain/Chroma with embedding model) ---
+def _chunk_metadata(doc):
+    # Preserve existing metadata
+    metadata = doc.metadata.copy()
+
+    # Add document-specific enhancements
+    if "source" not in metadata:
+        metadata["source"] = "unknown"
+
+    # Special handling for Markdown
+    if doc.metadata.get("source", "").endswith(".md"):
+        metadata["doc_type"] = "markdown"
+        # Extract first header if exists
+        if "# " in doc.page_content[:100]:
+            metadata["section"] = doc.page_content.split("# ")[1].split("\n")[0]
+    return metadata
+
+
+def split_sentences(text):
+    """Split text into sentences the same way SemanticChunker does."""
+    return [s for s in re.split(SENTENCE_SPLIT_REGEX, text.strip()) if s]
+
+
+def embed_in_batches(embeddings_model, texts, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed texts in batches of batch_size.
+
+    :return: float32 array of shape (len(texts), dim).
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings_model.embed_documents(texts[start : start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _semantic_breaks(window_vectors):
+    """
+    Return the (start, end) sentence ranges of each chunk.
+
+    Same rule as SemanticChunker with the "percentile" threshold: a chunk
+    ends where the cosine distance between consecutive sentence windows is
+    above the BREAKPOINT_PERCENTILE percentile of all distances.
+    """
+    n_sentences = len(window_vectors)
+    if n_sentences <= 1:
+        return [(0, n_sentences)]
+    normed = _normalize(window_vectors)
+    distances = 1.0 - np.sum(normed[:-1] * normed[1:], axis=1)
+    threshold = np.percentile(distances, BREAKPOINT_PERCENTILE)
+    ranges = []
+    start = 0
+    for index in np.flatnonzero(distances > threshold):
+        ranges.append((start, index + 1))
+        start = index + 1
+    if start < n_sentences:
+        ranges.append((start, n_sentences))
+    return ranges
+
+
+def chunk_and_embed(documents, embeddings_model, batch_size=EMBED_BATCH_SIZE):
+    """
+    Semantically chunk documents and compute chunk vectors in one embedding pass.
+
+    The sentence windows of all documents are embedded together, in batches
+    of batch_size. Each chunk vector is the normalized mean of the windows
+    of its sentences, so chunks are not embedded a second time. With
+    CHUNK_EMBEDDING_MODE = "reembed" the vectors are left as None and
+    create_vector_store embeds only the chunks it actually adds.
+
+    :return: One list of (chunk_id, Document, vector) per document; chunk
+             ids are content hashes, so re-indexing unchanged text gives
+             the same ids.
+    """
+    doc_sentences = [split_sentences(doc.page_content) for doc in documents]
+
+    # sentence windows (sentence with its neighbours), embedded once each
+    doc_windows = []
+    for sentences in doc_sentences:
+        doc_windows.append(
+            [
+                " ".join(sentences[max(0, i - SENTENCE_BUFFER) : i + SENTENCE_BUFFER + 1])
+                for i in range(len(sentences))
+            ]
+        )
+    unique_windows = list(dict.fromkeys(w for windows in doc_windows for w in windows))
+    print(f"Embedding {len(unique_windows)} sentence windows...")
+    window_vectors = embed_in_batches(embeddings_model, unique_windows, batch_size)
+    window_index = {window: i for i, window in enumerate(unique_windows)}
+
+    doc_chunks = []
+    for doc, sentences, windows in zip(documents, doc_sentences, doc_windows):
+        chunks = []
+        doc_chunks.append(chunks)
+        if not sentences:
+            continue
+        metadata = _chunk_metadata(doc)
+        vectors = window_vectors[[window_index[w] for w in windows]]
+        for i, (start, end) in enumerate(_semantic_breaks(vectors)):
+            chunk = " ".join(sentences[start:end])
+            chunk_metadata = metadata.copy()
+            chunk_metadata["chunk_index"] = i
+            chunk_id = content_hash(
+                metadata["source"], str(metadata.get("page", "")), str(i), chunk
+            )
+            vector = None
+            if CHUNK_EMBEDDING_MODE == "pool":
+                vector = _normalize(vectors[start:end].mean(axis=0)).tolist()
+            chunks.append(
+                (chunk_id, Document(page_content=chunk, metadata=chunk_metadata), vector)
+            )
+    return doc_chunks
+
+
+def iter_sources(documents):
+    """
+    Group a stream of documents (e.g. PDF pages) by their source file.
+
+    The documents of one source must be consecutive, as iter_documents
+    yields them. Each source's documents are streamed, not collected, so
+    they must be consumed before the next source is requested.
+
+    :return: Generator of (source, iterator of its Documents).
+    """
+    seen = set()
+    for source, docs in itertools.groupby(
+        documents, key=lambda doc: doc.metadata.get("source", "unknown")
+    ):
+        if source in seen:
+            raise ValueError(f"Documents of {source} are not consecutive.")
+        seen.add(source)
+        yield source, docs
+
+
+def page_key(doc):
+    """Manifest key of a page: a hash of its source, page number and text."""
+    return content_hash(
+        doc.metadata.get("source", "unknown"),
+        str(doc.metadata.get("page", "")),
+        doc.page_content,
+    )
+
+
+def _update_store(
+    vector_store, embeddings_model, ids_to_delete, ids_to_add, chunks_to_add, vectors_to_add
+):
+    """Delete stale chunks and write new ones, with their vectors, to the store."""
+    if ids_to_delete:
+        vector_store.delete(ids=ids_to_delete)
+    if chunks_to_add:
+        if CHUNK_EMBEDDING_MODE != "pool":
+            vectors_to_add = embed_in_batches(
+                embeddings_model, [chunk.page_content for chunk in chunks_to_add]
+            ).tolist()
+        vector_store.upsert(
+            ids=ids_to_add,
+            embeddings=vectors_to_add,
+            documents=[chunk.page_content for chunk in chunks_to_add],
+            metadatas=[chunk.metadata for chunk in chunks_to_add],
+        )
+
+
+def _index_pages(vector_store, embeddings_model, pending, old_ids, added_ids):
+    """
+    Chunk a block of changed pages and write their new chunks to the store.
+
+    :param pending: List of (page key, Document).
+    :param old_ids: Chunk ids already in the store; not written again.
+    :param added_ids: Chunk ids written so far for the source; updated.
+    :return: Dictionary of {page key: chunk ids of the page}.
+    """
+    # Step 3: Split the pages with semantic awareness, in one batched
+    # embedding pass
+    ids_to_add = []
+    chunks_to_add = []
+    vectors_to_add = []
+    pages = {}
+    doc_chunks = chunk_and_embed([doc for _, doc in pending], embeddings_model)
+    for (key, _), chunks in zip(pending, doc_chunks):
+        pages[key] = [chunk_id for chunk_id, _, _ in chunks]
+        for chunk_id, chunk, vector in chunks:
+            if chunk_id not in old_ids and chunk_id not in added_ids:
+                added_ids.add(chunk_id)
+                ids_to_add.append(chunk_id)
+                chunks_to_add.append(chunk)
+                vectors_to_add.append(vector)
+    # Step 4: Update the vector store, writing the vectors directly
+    _update_store(
+        vector_store, embeddings_model, [], ids_to_add, chunks_to_add, vectors_to_add
+    )
+    return pages
+
+
 def create_vector_store(documents, db_path, embedding_model_name):
+    """
+    Create or incrementally update the Chroma store for the documents.
+
+    documents may be a generator (see iter_documents); it is streamed page
+    by page, so only PAGES_PER_TASK changed pages are held at a time. Pages
+    whose key (source, page number and text) is in the manifest are
+    skipped. Changed pages are re-chunked in blocks and their new chunks
+    written right away; the stale chunks of a source, and the chunks of
+    sources that disappeared, are deleted. The manifest records the
+    per-source hashes, page keys, chunk ids and the resulting index version;
+    a manifest without page keys re-chunks every page once.
+    """
+    manifest = read_index_manifest(db_path)
+    full_rebuild = (
+        "sources" not in manifest
+        or manifest.get("embedding_model") != embedding_model_name
+        or manifest.get("chunk_embedding_mode") != CHUNK_EMBEDDING_MODE
+    )
+
+    # Initialize embedding model
+    embeddings_model = load_embeddings(embedding_model_name)
+    # the chunk vectors are computed here, so the collection is used directly
+    client = chromadb.PersistentClient(path=db_path)
+    vector_store = client.get_or_create_collection(
+        CHROMA_COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"},  # Optimize for similarity
+    )
+    if full_rebuild:
+        # stores without a manifest have random chunk ids, start again
+        print("No usable manifest found. Rebuilding the vector store...")
+        client.delete_collection(CHROMA_COLLECTION_NAME)
+        vector_store = client.create_collection(
+            CHROMA_COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+        )
+        manifest = {"sources": {}}
+
     # chunking
     print("Chunking documents...")
-    # Initialize embedding model
-    embeddings_model = HuggingFaceEmbeddings(model_name=embedding_model_name)
+    old_sources = manifest["sources"]
+    new_sources = {}
+    n_added = 0
+    n_deleted = 0
+    for source, source_docs in iter_sources(documents):
+        old_entry = old_sources.get(source) or {}
+        # pages of the previous manifest: page key -> chunk ids
+        old_pages = old_entry.get("pages", {})
+        old_ids = set(old_entry.get("chunk_ids", []))
+        # same digest as content_hash(*page texts), without holding the pages
+        source_digest = hashlib.sha256()
+        pages = {}
+        added_ids = set()
+        pending = []
+        n_changed = 0
+        for doc in source_docs:
+            source_digest.update(doc.page_content.encode("utf-8"))
+            source_digest.update(b"\0")
+            key = page_key(doc)
+            if key in old_pages:
+                pages[key] = old_pages[key]
+                continue
+            pending.append((key, doc))
+            n_changed += 1
+            if len(pending) >= PAGES_PER_TASK:
+                pages.update(
+                    _index_pages(
+                        vector_store, embeddings_model, pending, old_ids, added_ids
+                    )
+                )
+                pending = []
+        if pending:
+            pages.update(
+                _index_pages(vector_store, embeddings_model, pending, old_ids, added_ids)
+            )
 
-    semantic_splitter = SemanticChunker(
-        embeddings_model,
-        breakpoint_threshold_type="percentile",  # "standard_deviation" also works
-        breakpoint_threshold_amount=0.4,  # Lower = more chunks
-        add_start_index=True,  # Preserve positional info
-    )
+        chunk_ids = list(
+            dict.fromkeys(chunk_id for ids in pages.values() for chunk_id in ids)
+        )
+        ids_to_delete = list(old_ids - set(chunk_ids))
+        if ids_to_delete:
+            vector_store.delete(ids=ids_to_delete)
+        print(
+            f"{'Changed' if n_changed else 'Unchanged'}: {source} "
+            f"({n_changed} pages re-chunked)"
+        )
+        n_added += len(added_ids)
+        n_deleted += len(ids_to_delete)
+        new_sources[source] = {
+            "hash": source_digest.hexdigest(),
+            "chunk_ids": chunk_ids,
+            "pages": pages,
+        }
 
-    # Step 3: Split documents with semantic awareness
-    chunks = []
-    for doc in documents:
-        # Preserve existing metadata
-        metadata = doc.metadata.copy()
+    for source, old_entry in old_sources.items():
+        if source not in new_sources:
+            print(f"Removed source: {source}")
+            if old_entry["chunk_ids"]:
+                vector_store.delete(ids=old_entry["chunk_ids"])
+            n_deleted += len(old_entry["chunk_ids"])
 
-        # Add document-specific enhancements
-        if "source" not in metadata:
-            metadata["source"] = "unknown"
+    print(f"Added {n_added} chunks, deleted {n_deleted} chunks.")
 
-        # Special handling for Markdown
-        if doc.metadata.get("source", "").endswith(".md"):
-            metadata["doc_type"] = "markdown"
-            # Extract first header if exists
-            if "# " in doc.page_content[:100]:
-                metadata["section"] = doc.page_content.split("# ")[1].split("\n")[0]
+    all_chunk_ids = sorted(
+        chunk_id for entry in new_sources.values() for chunk_id in entry["chunk_ids"]
+    )
+    index_version = content_hash(
+        embedding_model_name, CHUNK_EMBEDDING_MODE, *all_chunk_ids
+    )
+    # an index written in an older format is rewritten even if the store is unchanged
+    if (
+        index_version == manifest.get("index_version")
+        and load_bm25_index(db_path, index_version) is not None
+    ):
+        print(f"Vector store unchanged at index version {index_version}")
+        return
 
-        # Process with semantic splitter
-        doc_chunks = semantic_splitter.split_text(doc.page_content)
+    # Step 5: Persist the BM25 and flat vector indexes for all chunks in the store
+    stored = vector_store.get(include=["documents", "metadatas", "embeddings"])
+    all_chunks = [
+        Document(page_content=text, metadata=meta)
+        for text, meta in zip(stored["documents"], stored["metadatas"])
+    ]
+    write_bm25_index(all_chunks, db_path, index_version)
+    write_flat_index(
+        stored["ids"],
+        all_chunks,
+        stored["embeddings"],
+        db_path,
+        index_version,
+        dtype=FLAT_INDEX_DTYPE,
+    )
 
-        for i, chunk in enumerate(doc_chunks):
-            chunk_metadata = metadata.copy()
-            chunk_metadata["chunk_index"] = i
-            # chunks.append({"page_content": chunk, "metadata": chunk_metadata})
-            chunks.append(Document(page_content=chunk, metadata=chunk_metadata))
-
-    # Step 4: Create vector store
-    vector_store = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings_model,
-        persist_directory=db_path,
-        collection_metadata={"hnsw:space": "cosine"},  # Optimize for similarity
+    # the manifest is written last, it invalidates retrieval caches
+    write_index_manifest(
+        db_path,
+        {
+            "index_version": index_version,
+            "embedding_model": embedding_model_name,
+            "chunk_embedding_mode": CHUNK_EMBEDDING_MODE,
+            "sources": new_sources,
+        },
     )
-    vector_store.persist()
+    print(f"Vector store written with index version {index_version}")
 
 
 """
@@ -127,8 +489,8 @@ def setup_rag_chain(vector_store_collection, embeddings_model, llm_model_name):
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    # 1. Load and parse documents
-    all_documents = load_documents(PDF_PATH, MARKUP_PATH)
+    # 1. Load and parse documents (streamed, one source file at a time)
+    all_documents = iter_documents(KB_DIR)
     # print(all_documents)
 
     # 2. Create vector store (chunks documents, embeds them, and stores)
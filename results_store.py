@@ -0,0 +1,439 @@
+"""
+Append-only results store of the daily overview runs.
+
+Every run appends to one SQLite database (daily_overviews/results.sqlite):
+    - runs: one row per run (start time, comments, settings)
+    - results: one row per (run, location, date, model) with the prompt hash,
+      BoM and generated texts, token counts, latency, consistency violations
+      and one column per metric
+    - hourly: the hourly input table of each (run, location, date)
+Rows are keyed and indexed by run and location, so analyses across runs
+are SQL queries instead of opening every workbook. The xlsx reports are
+an export of a run (export_xlsx).
+
+While a run is in progress, its inputs and LLM outputs are checkpointed:
+    - location_inputs: the scraped BoM forecasts and the hourly data of a location
+    - checkpoints: the LLM output of each (run, location, date, model)
+Each checkpoint is committed as soon as it exists, so a crashed run can be
+resumed without repeating completed requests. The run is marked finished
+once the results of all its locations are stored.
+
+The usage table holds the LLM requests, tokens and cost of each (run,
+model), see accounting.RunAccount.
+"""
+
+import functools
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from io import StringIO
+
+import pandas as pd
+
+# e.g. a separate store for replayed benchmark runs
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "daily_overviews/results.sqlite")
+# metric columns of the results table, see metrics.METRIC_MODES
+SCORE_COLUMNS = ["token_f1", "rouge_l", "embedding_cosine", "bert_score"]
+RESULT_COLUMNS = [
+    "run_id",
+    "location",
+    "date",
+    "day_label",
+    "issued_at",
+    "model",
+    "prompt_hash",
+    "bom_long_form",
+    "long_form_text",
+    "input_tokens",
+    "output_tokens",
+    "latency_seconds",
+    "consistency_violations",
+] + SCORE_COLUMNS
+
+# counters of the usage table, see accounting.RunAccount.usage
+USAGE_COLUMNS = [
+    "requests",
+    "failed",
+    "skipped",
+    "input_tokens",
+    "output_tokens",
+    "latency_seconds",
+    "cost_usd",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    comments TEXT,
+    settings TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    day_label TEXT,
+    issued_at TEXT,
+    model TEXT NOT NULL,
+    prompt_hash TEXT,
+    bom_long_form TEXT,
+    long_form_text TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    latency_seconds REAL,
+    consistency_violations TEXT,
+    {", ".join(f"{column} REAL" for column in SCORE_COLUMNS)},
+    PRIMARY KEY (run_id, location, date, model)
+);
+CREATE INDEX IF NOT EXISTS results_location_date ON results (location, date);
+CREATE INDEX IF NOT EXISTS results_model ON results (model, prompt_hash);
+CREATE TABLE IF NOT EXISTS hourly (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, location, date)
+);
+CREATE TABLE IF NOT EXISTS location_inputs (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    location TEXT NOT NULL,
+    bom_forecasts TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, location)
+);
+CREATE TABLE IF NOT EXISTS usage (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    model TEXT NOT NULL,
+    requests INTEGER,
+    failed INTEGER,
+    skipped INTEGER,
+    input_tokens REAL,
+    output_tokens REAL,
+    latency_seconds REAL,
+    cost_usd REAL,
+    PRIMARY KEY (run_id, model)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    model TEXT NOT NULL,
+    output TEXT NOT NULL,
+    PRIMARY KEY (run_id, location, date, model)
+);
+"""
+
+
+def _synchronized(method):
+    """Run the method under the store's lock; the connection is shared by threads."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class ResultsStore:
+    """
+    SQLite results store of the daily overview runs.
+
+    A store can be used from several threads; its calls are serialized.
+
+    :param db_path: Path of the SQLite file, created if missing.
+    """
+
+    def __init__(self, db_path=RESULTS_DB_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.connection.executescript(SCHEMA)
+        # stores created before runs could be resumed
+        run_columns = [row[1] for row in self.connection.execute("PRAGMA table_info(runs)")]
+        if "finished_at" not in run_columns:
+            self.connection.execute("ALTER TABLE runs ADD COLUMN finished_at TEXT")
+
+    @_synchronized
+    def start_run(self, comments="", settings=None):
+        """
+        Register a new run.
+
+        :param comments: Free text describing the run.
+        :param settings: JSON-serializable dictionary (models, metrics, ...).
+        :return: The run id, e.g. "2025_06_04_09_47_12".
+        """
+        started_at = datetime.now()
+        run_id = started_at.strftime("%Y_%m_%d_%H_%M_%S")
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO runs (run_id, started_at, comments, settings) VALUES (?, ?, ?, ?)",
+                (run_id, started_at.isoformat(), comments, json.dumps(settings or {})),
+            )
+        return run_id
+
+    @_synchronized
+    def latest_unfinished_run(self):
+        """Return the id of the most recent run that did not finish, or None."""
+        row = self.connection.execute(
+            "SELECT run_id FROM runs WHERE finished_at IS NULL ORDER BY started_at DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    @_synchronized
+    def is_finished(self, run_id):
+        """Return True if the run finished; raises ValueError for unknown runs."""
+        row = self.connection.execute(
+            "SELECT finished_at FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown run: {run_id}")
+        return row[0] is not None
+
+    @_synchronized
+    def save_location_inputs(self, run_id, location, bom_forecasts, data):
+        """Checkpoint the scraped BoM forecasts and the hourly data of a location."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO location_inputs VALUES (?, ?, ?, ?)",
+                (run_id, location, json.dumps(bom_forecasts), json.dumps(data)),
+            )
+
+    @_synchronized
+    def location_inputs(self, run_id, location):
+        """Return the checkpointed (bom_forecasts, data) of a location, or None."""
+        row = self.connection.execute(
+            "SELECT bom_forecasts, data FROM location_inputs WHERE run_id = ? AND location = ?",
+            (run_id, location),
+        ).fetchone()
+        return (json.loads(row[0]), json.loads(row[1])) if row else None
+
+    @_synchronized
+    def save_outputs(self, run_id, location, outputs):
+        """
+        Checkpoint LLM outputs, committed immediately.
+
+        :param outputs: Dictionary of {date: {model: output dictionary}}.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, location, date, model, json.dumps(output))
+                    for date, model_outputs in outputs.items()
+                    for model, output in model_outputs.items()
+                ],
+            )
+
+    @_synchronized
+    def checkpointed_outputs(self, run_id, location):
+        """Return the checkpointed outputs of a location as {date: {model: output}}."""
+        outputs = {}
+        for date, model, output in self.connection.execute(
+            "SELECT date, model, output FROM checkpoints WHERE run_id = ? AND location = ?",
+            (run_id, location),
+        ):
+            outputs.setdefault(date, {})[model] = json.loads(output)
+        return outputs
+
+    def _insert_results(self, run_id, records):
+        columns = ", ".join(RESULT_COLUMNS)
+        placeholders = ", ".join("?" for _ in RESULT_COLUMNS)
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO results ({columns}) VALUES ({placeholders})",
+            [
+                [run_id] + [record.get(column) for column in RESULT_COLUMNS[1:]]
+                for record in records
+            ],
+        )
+
+    @_synchronized
+    def add_results(self, run_id, records):
+        """
+        Append result rows in one transaction.
+
+        Rows of a (run, location, date, model) already stored, e.g. by an
+        interrupted attempt of a resumed run, are replaced.
+
+        :param records: Dictionaries with keys from RESULT_COLUMNS (run_id is
+                        filled in); missing keys are stored as NULL.
+        """
+        with self.connection:
+            self._insert_results(run_id, records)
+
+    @_synchronized
+    def finish_run(self, run_id, records=()):
+        """Append the last results of a run and mark it finished, in one transaction."""
+        with self.connection:
+            self._insert_results(run_id, records)
+            self.connection.execute(
+                "UPDATE runs SET finished_at = ? WHERE run_id = ?",
+                (datetime.now().isoformat(), run_id),
+            )
+
+    @_synchronized
+    def add_hourly(self, run_id, location, day_frames):
+        """
+        Append the hourly input tables of a location.
+
+        :param day_frames: Dictionary of {date: DataFrame of the hourly rows}.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO hourly VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, location, date, df.to_json(orient="split", index=False))
+                    for date, df in day_frames.items()
+                ],
+            )
+
+    @_synchronized
+    def save_usage(self, run_id, usage):
+        """
+        Store the LLM usage of a run, replacing the usage of earlier attempts.
+
+        :param usage: Dictionary of {model: counters}, see RunAccount.usage.
+        """
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO usage (run_id, model, {', '.join(USAGE_COLUMNS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(USAGE_COLUMNS))})",
+                [
+                    (run_id, model, *(counters[column] for column in USAGE_COLUMNS))
+                    for model, counters in usage.items()
+                ],
+            )
+
+    @_synchronized
+    def usage(self, run_id):
+        """Dictionary of {model: counters} of a run, see save_usage."""
+        rows = self.connection.execute(
+            f"SELECT model, {', '.join(USAGE_COLUMNS)} FROM usage WHERE run_id = ?",
+            (run_id,),
+        ).fetchall()
+        return {row[0]: dict(zip(USAGE_COLUMNS, row[1:])) for row in rows}
+
+    @_synchronized
+    def mean_tokens(self, prompt_hash=None):
+        """
+        Mean (input, output) tokens per forecast day of each model.
+
+        Results of the same prompt are used when there are any, else all results.
+
+        :return: Dictionary of {model: (mean input tokens, mean output tokens)}.
+        """
+        sql = (
+            "SELECT model, AVG(input_tokens), AVG(output_tokens) FROM results "
+            "WHERE input_tokens > 0 {} GROUP BY model"
+        )
+        rows = []
+        if prompt_hash:
+            rows = self.connection.execute(
+                sql.format("AND prompt_hash = ?"), (prompt_hash,)
+            ).fetchall()
+        if not rows:
+            rows = self.connection.execute(sql.format("")).fetchall()
+        return {model: (mean_input, mean_output) for model, mean_input, mean_output in rows}
+
+    @_synchronized
+    def query(self, sql, params=()):
+        """Run a SELECT and return the rows as a DataFrame."""
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    @_synchronized
+    def results(self, run_id=None, location=None):
+        """Result rows, optionally of one run and/or location."""
+        conditions = []
+        params = []
+        if run_id:
+            conditions.append("run_id = ?")
+            params.append(run_id)
+        if location:
+            conditions.append("location = ?")
+            params.append(location)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.query(
+            f"SELECT * FROM results {where} ORDER BY run_id, location, date, model",
+            params,
+        )
+
+    @_synchronized
+    def hourly(self, run_id, location):
+        """Dictionary of {date: DataFrame} of the hourly input tables of a location."""
+        rows = self.connection.execute(
+            "SELECT date, data FROM hourly WHERE run_id = ? AND location = ? ORDER BY date",
+            (run_id, location),
+        ).fetchall()
+        return {
+            date: pd.read_json(
+                StringIO(data), orient="split", dtype=False, convert_dates=False
+            )
+            for date, data in rows
+        }
+
+    @_synchronized
+    def export_xlsx(self, run_id, location, filename, metrics=None, comments=None):
+        """
+        Write the overview workbook of one location of a run.
+
+        The overview sheet has one row per date: the BoM text, then for every
+        model its text, scores, token counts, latency and consistency
+        violations. Every date also gets its hourly sheet.
+
+        :param metrics: Score columns to include; defaults to the non-empty ones.
+        :param comments: Written under the table; defaults to the run's comments.
+        """
+        results = self.results(run_id, location)
+        if results.empty:
+            print(f"No results for {location} in run {run_id}.")
+            return
+        if metrics is None:
+            metrics = [c for c in SCORE_COLUMNS if results[c].notna().any()]
+        if comments is None:
+            comments = self.connection.execute(
+                "SELECT comments FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+
+        # openpyxl is only imported when a report is written
+        from workbook_writer import StreamingWorkbook
+
+        workbook = StreamingWorkbook(overview_title="overview")
+        sheet = workbook.overview
+        sheet["A1"] = "Issued at:"
+        sheet["B1"] = results["issued_at"].iloc[0]
+
+        models = list(dict.fromkeys(results["model"]))
+        header = ["Date", "bom_long_form"]
+        for model in models:
+            label = model.split("-")[0]
+            header += [f"{label}_long_form", *[f"{label}_{m}" for m in metrics]]
+            header += [f"{label}_input_tokens", f"{label}_output_tokens", f"{label}_latency"]
+            header += [f"{label}_consistency_violations"]
+        rows = [header]
+        for date, day in results.groupby("date", sort=True):
+            by_model = day.set_index("model")
+            row = [day["day_label"].iloc[0] or date, day["bom_long_form"].iloc[0]]
+            for model in models:
+                if model not in by_model.index:
+                    row += [None] * (len(metrics) + 5)
+                    continue
+                result = by_model.loc[model]
+                row += [result["long_form_text"], *[result[m] for m in metrics]]
+                row += [result["input_tokens"], result["output_tokens"]]
+                row += [result["latency_seconds"], result["consistency_violations"]]
+            rows.append(row)
+        for row_number, values in enumerate(rows, 3):
+            for column_number, value in enumerate(values, 1):
+                sheet.cells[(row_number, column_number)] = (
+                    None if pd.isna(value) else value
+                )
+        sheet[f"A{len(rows) + 6}"] = comments
+
+        for date, df in self.hourly(run_id, location).items():
+            workbook.add_frame_sheet(date, df)
+        workbook.save(filename)
+        print(f"Exported {location} of run {run_id} to {filename}")
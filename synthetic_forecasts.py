@@ -0,0 +1,593 @@
+"""
+Synthetic JW forecasts and BoM pages for load tests at national scale.
+
+make_sites() spreads any number of synthetic sites over the Australian time
+zones. For each site, jw_payload() builds a JW-shaped forecast response:
+    - metadata.loc with the site's coordinates and time zone
+    - data_1h: one entry per hour (epoch "time" and "time_local") with every
+      variable of var_dictionary, plus the fog, icon and rain fields read by
+      consistency_checker
+    - data_1d_local: one entry per local day
+Every day follows a weather regime (fair, frost, fog, storm or gale) drawn
+with seasonal, latitude-dependent weights (SEASONAL_REGIME_WEIGHTS), and
+bom_page() writes a matching BoM forecast page for the same days.
+
+write_cassette() stores both as replay cassettes (see cassette.py) and the
+sites as a sites file, so the unchanged driver runs over thousands of
+sites offline:
+
+    python synthetic_forecasts.py generate 2000 cassettes/synthetic
+    SITES_FILE=cassettes/synthetic/sites.json CASSETTE_MODE=replay \\
+        CASSETTE_DIR=cassettes/synthetic RESULTS_DB_PATH=/tmp/load.sqlite \\
+        python llm_daily_overview.py
+
+The LLM requests of such a run are not recorded, so they fail fast
+(CassetteMiss). measure_scaling() times the parsing, prompt building and
+workbook writing on the synthetic payloads in process:
+
+    python synthetic_forecasts.py scale 10 100 1000
+"""
+
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from bom_scrapper import BOM_FORECAST_URL, REQUEST_HEADERS
+from cassette import http_request, save_interaction
+from utils import JW_FORECAST_URL, jw_forecast_params
+from var_dictionary import var_dictionary
+
+N_DAYS = 7
+JW_MODEL = "ai_enhanced"
+# (time zone, state, (lat min, lat max), (lon min, lon max)) of each region
+REGIONS = [
+    ("Australia/Perth", "wa", (-35.0, -14.0), (114.0, 126.0)),
+    ("Australia/Eucla", "wa", (-32.5, -31.0), (125.5, 129.0)),
+    ("Australia/Darwin", "nt", (-26.0, -11.0), (129.0, 138.0)),
+    ("Australia/Adelaide", "sa", (-38.0, -26.0), (129.0, 141.0)),
+    ("Australia/Broken_Hill", "nsw", (-33.0, -31.0), (141.0, 142.0)),
+    ("Australia/Brisbane", "qld", (-29.0, -10.5), (138.0, 153.5)),
+    ("Australia/Sydney", "nsw", (-37.5, -28.2), (141.0, 153.6)),
+    ("Australia/Lord_Howe", "nsw", (-31.6, -31.5), (159.0, 159.1)),
+    ("Australia/Melbourne", "vic", (-39.0, -34.0), (141.0, 150.0)),
+    ("Australia/Hobart", "tas", (-43.6, -40.6), (144.5, 148.5)),
+]
+REGIMES = ("fair", "frost", "fog", "storm", "gale")
+# weights of the regimes of a day, by (climate, season)
+SEASONAL_REGIME_WEIGHTS = {
+    ("tropical", "summer"): {"fair": 0.45, "fog": 0.02, "storm": 0.45, "gale": 0.08},
+    ("tropical", "autumn"): {"fair": 0.6, "fog": 0.05, "storm": 0.3, "gale": 0.05},
+    ("tropical", "winter"): {"fair": 0.85, "fog": 0.1, "storm": 0.05},
+    ("tropical", "spring"): {"fair": 0.7, "fog": 0.05, "storm": 0.25},
+    ("temperate", "summer"): {"fair": 0.6, "fog": 0.05, "storm": 0.25, "gale": 0.1},
+    ("temperate", "autumn"): {
+        "fair": 0.5, "frost": 0.1, "fog": 0.2, "storm": 0.1, "gale": 0.1
+    },
+    ("temperate", "winter"): {
+        "fair": 0.4, "frost": 0.25, "fog": 0.15, "storm": 0.05, "gale": 0.15
+    },
+    ("temperate", "spring"): {
+        "fair": 0.5, "frost": 0.1, "fog": 0.05, "storm": 0.15, "gale": 0.2
+    },
+}
+SEASONS = {
+    12: "summer", 1: "summer", 2: "summer",
+    3: "autumn", 4: "autumn", 5: "autumn",
+    6: "winter", 7: "winter", 8: "winter",
+    9: "spring", 10: "spring", 11: "spring",
+}
+TROPIC_LATITUDE = -23.4
+# daily temperature range (degC), mean wind (km/h), wind direction (deg),
+# total cloud cover (%) of each regime
+REGIME_WEATHER = {
+    "fair": {"range": 11, "wind": 14, "wind_dir": None, "cloud": 20},
+    "frost": {"range": 16, "wind": 5, "wind_dir": None, "cloud": 5},
+    "fog": {"range": 9, "wind": 4, "wind_dir": None, "cloud": 35},
+    "storm": {"range": 8, "wind": 18, "wind_dir": 330, "cloud": 55},
+    "gale": {"range": 6, "wind": 55, "wind_dir": 250, "cloud": 70},
+}
+# recorded latency of the synthetic responses, used by CASSETTE_LATENCY_SCALE
+JW_LATENCY_SECONDS = 0.4
+BOM_LATENCY_SECONDS = 0.3
+COMPASS_POINTS = [
+    "N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+    "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW",
+]
+COMPASS_WORDS = [
+    "northerly", "northeasterly", "easterly", "southeasterly",
+    "southerly", "southwesterly", "westerly", "northwesterly",
+]
+
+
+def make_sites(n_sites, seed=0):
+    """
+    Synthetic sites spread over the REGIONS.
+
+    :return: Dictionary of {label: {"lat", "lon", "state", "tz"}}, with the
+             coordinates as strings like in the drivers' LOCS.
+    """
+    rng = random.Random(seed)
+    sites = {}
+    for i in range(n_sites):
+        tz, state, (lat_min, lat_max), (lon_min, lon_max) = REGIONS[i % len(REGIONS)]
+        sites[f"synthetic_{i:05d}"] = {
+            "lat": f"{rng.uniform(lat_min, lat_max):.4f}",
+            "lon": f"{rng.uniform(lon_min, lon_max):.4f}",
+            "state": state,
+            "tz": tz,
+        }
+    return sites
+
+
+def _daily_regimes(rng, lat, start_date, n_days):
+    climate = "tropical" if lat > TROPIC_LATITUDE else "temperate"
+    weights = SEASONAL_REGIME_WEIGHTS[(climate, SEASONS[start_date.month])]
+    return rng.choices(list(weights), weights=list(weights.values()), k=n_days)
+
+
+def _mean_temperature(lat, day):
+    """Daily mean temperature (degC) of a latitude, warmest in mid-January."""
+    annual_mean = 29 - 0.55 * (abs(lat) - 10)
+    amplitude = 2 + 0.3 * (abs(lat) - 10)
+    return annual_mean + amplitude * math.cos(
+        2 * math.pi * (day.timetuple().tm_yday - 15) / 365
+    )
+
+
+def _diurnal(hour, peak_hour=15, trough_hour=6):
+    """0 at trough_hour, 1 at peak_hour, a smooth curve in between."""
+    if trough_hour <= hour <= peak_hour:
+        phase = (hour - trough_hour) / (peak_hour - trough_hour)
+    else:
+        phase = 1 - ((hour - peak_hour) % 24) / (24 - peak_hour + trough_hour)
+    return (1 - math.cos(math.pi * phase)) / 2
+
+
+def _vapour_pressure(temp):
+    """Saturated vapour pressure (hPa) at temp (degC), Magnus formula."""
+    return 6.112 * math.exp(17.62 * temp / (243.12 + temp))
+
+
+def _compass(degrees, points=COMPASS_POINTS):
+    return points[round(degrees % 360 / (360 / len(points))) % len(points)]
+
+
+def _frost_category(temp):
+    if temp <= -2:
+        return "SEVERE_FROST"
+    if temp <= 1:
+        return "FROST_LIKELY"
+    if temp <= 3:
+        return "CHANCE_FROST"
+    return "NO_FROST"
+
+
+def _heat_stress(wbgt):
+    if wbgt >= 30:
+        return "DANGEROUS"
+    if wbgt >= 29:
+        return "MODERATE"
+    if wbgt >= 27:
+        return "LOW"
+    return "NEGLIGIBLE"
+
+
+def _hour_entry(rng, regime, day_weather, lat, local_dt):
+    """Every variable of one hour, for the regime of its day."""
+    hour = local_dt.hour
+    weather = REGIME_WEATHER[regime]
+    diurnal = _diurnal(hour)
+    temp = day_weather["temp_min"] + diurnal * (
+        day_weather["temp_max"] - day_weather["temp_min"]
+    )
+    night = hour < 6 or hour >= 19
+    afternoon = 12 <= hour < 19
+
+    dew_spread = {"fog": 0.5, "frost": 3, "storm": 4, "gale": 6}.get(regime, 8)
+    dew_pt = temp - dew_spread * (0.3 + diurnal) - rng.uniform(0, 1)
+    if regime == "fog" and hour < 9:
+        dew_pt = temp - rng.uniform(0, 0.4)
+    sat_vap_pres = _vapour_pressure(temp)
+    actual_vap_pres = min(_vapour_pressure(dew_pt), sat_vap_pres)
+    rel_hum = 100 * actual_vap_pres / sat_vap_pres
+
+    wind_kmh = max(
+        0.0,
+        weather["wind"] * (0.6 + 0.8 * diurnal if regime != "gale" else 1.0)
+        + rng.gauss(0, 2),
+    )
+    wind_dir = (day_weather["wind_dir"] + rng.gauss(0, 15)) % 360
+    gust_kmh = wind_kmh * rng.uniform(1.3, 1.6)
+
+    precip = 0.0
+    if regime == "storm" and afternoon and rng.random() < 0.6:
+        precip = rng.uniform(0.5, 8)
+    elif regime == "gale" and rng.random() < 0.4:
+        precip = rng.uniform(0.2, 1.5)
+    cloud = weather["cloud"] + (35 if regime == "storm" and afternoon else 0)
+    tcc = min(100.0, max(0.0, cloud + rng.gauss(0, 10)))
+    lcc = 95.0 if regime == "fog" and hour < 9 else tcc * 0.5
+    storm_hours = regime == "storm" and afternoon
+
+    sun = max(0.0, math.sin(math.pi * (hour - 6) / 13)) if 6 <= hour <= 19 else 0.0
+    uv_peak = 4 + 8 * (day_weather["temp_max"] > 25)
+    pres_msl = day_weather["pres_msl"] + rng.gauss(0, 0.5)
+    geo_height_1000 = (pres_msl - 1000) * 8.3
+    geo_height_500 = 5580 + 8 * (temp - 15)
+    wind_ms = wind_kmh / 3.6
+    if temp > 25:
+        hli = 8.62 + 0.38 * rel_hum + 1.55 * temp - 0.5 * wind_ms + math.exp(2.4 - wind_ms)
+    else:
+        hli = 10.66 + 0.28 * rel_hum + 1.3 * temp - wind_ms
+    wbgt = 0.567 * temp + 0.393 * actual_vap_pres + 3.94
+
+    if regime == "storm" and afternoon:
+        icon = "Thunderstorm" if precip else "Possible thunderstorm"
+    elif regime == "gale":
+        icon = "Showers windy" if precip else "Windy"
+    elif regime == "fog" and hour < 9:
+        icon = "Fog"
+    elif regime == "frost" and hour < 9:
+        icon = "Frost"
+    elif night:
+        icon = "Clear" if tcc < 40 else "Mostly cloudy"
+    else:
+        icon = "Sunny" if tcc < 30 else "Partly cloudy" if tcc < 70 else "Cloudy"
+
+    values = {
+        "actual_vap_pres": actual_vap_pres,
+        "bulk_shear_300_1000": rng.uniform(15, 35) if storm_hours else rng.uniform(5, 20),
+        "bulk_shear_500_1000": rng.uniform(10, 25) if storm_hours else rng.uniform(3, 15),
+        "bulk_shear_850_1000": rng.uniform(5, 15) if regime == "gale" else rng.uniform(1, 8),
+        "cape_srf": rng.uniform(1500, 3000) if storm_hours else rng.uniform(0, 200),
+        "chill_stress_idx": (11.7 + 3.1 * math.sqrt(wind_ms)) * (40 - temp)
+        + 481
+        + 418 * (1 - math.exp(-0.04 * precip)),
+        "dew_pt": dew_pt,
+        "frost_prob_cat": _frost_category(temp) if regime == "frost" else "NO_FROST",
+        "geo_height_1000": geo_height_1000,
+        "geo_height_500": geo_height_500,
+        "ghi": 3.6 * sun * (1 - 0.75 * tcc / 100),
+        "gust_kmh": gust_kmh,
+        "hcc": tcc * 0.4,
+        "lcc": lcc,
+        "mcc": tcc * 0.6,
+        "tcc": tcc,
+        "apparent_temp": temp + 0.33 * actual_vap_pres - 0.7 * wind_ms - 4,
+        "heat_stress_rating": _heat_stress(wbgt),
+        "hli": hli,
+        "hli_max": max(hli, day_weather["hli_max"]),
+        "k_idx": rng.uniform(32, 40) if storm_hours else rng.uniform(5, 25),
+        "lifted_idx": rng.uniform(-7, -3) if storm_hours else rng.uniform(1, 6),
+        "precip": precip,
+        "precip_conf": "HIGH" if precip > 2 else "MEDIUM" if precip else "LOW",
+        "precip_prob": min(100.0, 20 + 15 * precip) if precip else rng.uniform(0, 15),
+        "pres_msl": pres_msl,
+        "rel_hum": rel_hum,
+        "sat_vap_pres": sat_vap_pres,
+        "soil_moisture_0_1": day_weather["soil_moisture"] * 0.1 + precip * 0.2,
+        "soil_moisture_0_10": day_weather["soil_moisture"],
+        "soil_moisture_10_28": day_weather["soil_moisture"] * 1.8,
+        "soil_moisture_28_100": day_weather["soil_moisture"] * 7,
+        "soil_moisture_100_289": day_weather["soil_moisture"] * 18,
+        "soil_temp": temp + 2 * sun,
+        "soil_temp_0_10": temp + sun,
+        "soil_temp_10_28": day_weather["temp_mean"],
+        "soil_temp_28_100": day_weather["temp_mean"] + 1,
+        "soil_temp_100_289": _mean_temperature(lat, local_dt.date()) + 2,
+        "storm_prob_idx": rng.uniform(60, 90) if storm_hours else rng.uniform(0, 10),
+        "temp": temp,
+        "temp_850": temp - 10 + rng.gauss(0, 1),
+        "temp_inv_prob_idx": rng.uniform(60, 90)
+        if night and regime in ("frost", "fog")
+        else rng.uniform(0, 30),
+        "thickness": geo_height_500 - geo_height_1000,
+        "total_totals_idx": rng.uniform(50, 56) if storm_hours else rng.uniform(38, 46),
+        "uv_idx_clear": uv_peak * sun,
+        "vap_pres_deficit": sat_vap_pres - actual_vap_pres,
+        "wbgt": wbgt,
+        "wind_850": wind_ms * 1.5,
+        "wind_dir": wind_dir,
+        "wind_dir_compass": _compass(wind_dir),
+        "wind_gust": gust_kmh,
+        "wind_kmh": wind_kmh,
+        # not in var_dictionary, read by consistency_checker
+        "fog_prob_cat": "HIGH" if regime == "fog" and hour < 9 else "NIL",
+        "weather_icon": icon.lower().replace(" ", "_"),
+        "weather_icon_precis": icon,
+        "rain": precip,
+        "snow": 0.0,
+    }
+    return {
+        name: round(value, 1) if isinstance(value, float) else value
+        for name, value in values.items()
+    }
+
+
+def jw_payload(site, start_date, n_days=N_DAYS, seed=0):
+    """
+    JW-shaped forecast response of a site.
+
+    :param site: Dictionary with "lat", "lon" and "tz", see make_sites.
+    :param start_date: First local date of the forecast.
+    :return: (payload, regimes): the response dictionary and the regime of each day.
+    """
+    lat = float(site["lat"])
+    rng = random.Random(f"{seed}:{site['lat']}:{site['lon']}:{start_date}")
+    tz = ZoneInfo(site["tz"])
+    regimes = _daily_regimes(rng, lat, start_date, n_days)
+
+    days = []
+    for i, regime in enumerate(regimes):
+        day = start_date + timedelta(days=i)
+        weather = REGIME_WEATHER[regime]
+        temp_mean = _mean_temperature(lat, day) + {
+            "gale": -3, "storm": 1, "fog": -1
+        }.get(regime, 0) + rng.gauss(0, 1.5)
+        day_range = weather["range"] + rng.gauss(0, 1)
+        if regime == "frost":
+            # the dawn minimum of a frost day is in a frost category
+            temp_mean = rng.uniform(-3, 1) + day_range / 2
+        days.append(
+            {
+                "date": day,
+                "regime": regime,
+                "temp_mean": temp_mean,
+                "temp_min": temp_mean - day_range / 2,
+                "temp_max": temp_mean + day_range / 2,
+                "wind_dir": weather["wind_dir"]
+                if weather["wind_dir"] is not None
+                else rng.uniform(0, 360),
+                "pres_msl": 996 if regime == "gale" else 1008 if regime == "storm" else 1020,
+                "soil_moisture": rng.uniform(1, 4),
+                "hli_max": 0.0,
+            }
+        )
+
+    hourly = []
+    start = datetime.combine(start_date, datetime.min.time(), tz).astimezone(timezone.utc)
+    end = datetime.combine(start_date + timedelta(days=n_days), datetime.min.time(), tz)
+    utc_dt = start
+    while utc_dt < end:
+        local_dt = utc_dt.astimezone(tz)
+        day_weather = days[(local_dt.date() - start_date).days]
+        entry = _hour_entry(rng, day_weather["regime"], day_weather, lat, local_dt)
+        day_weather["hli_max"] = max(day_weather["hli_max"], entry["hli"])
+        hourly.append(
+            {
+                "time": int(utc_dt.timestamp()),
+                "time_local": local_dt.isoformat(),
+                "time_utc": utc_dt.isoformat(),
+                **entry,
+            }
+        )
+        utc_dt += timedelta(hours=1)
+
+    daily = []
+    for day_weather in days:
+        day = day_weather["date"]
+        hours = [
+            entry for entry in hourly if entry["time_local"].startswith(day.isoformat())
+        ]
+        daily.append(
+            {
+                "date": day.isoformat(),
+                "time_local": datetime.combine(day, datetime.min.time(), tz).isoformat(),
+                "temp_min": min(entry["temp"] for entry in hours),
+                "temp_max": max(entry["temp"] for entry in hours),
+                "precip": round(sum(entry["precip"] for entry in hours), 1),
+                "precip_prob": max(entry["precip_prob"] for entry in hours),
+                "wind_kmh_max": max(entry["wind_kmh"] for entry in hours),
+            }
+        )
+
+    payload = {
+        "metadata": {
+            "loc": {"lat": site["lat"], "lon": site["lon"], "tz": site["tz"]},
+            "model": JW_MODEL,
+            "synthetic": True,
+        },
+        "data_1h": hourly,
+        "data_1d_local": daily,
+    }
+    return payload, regimes
+
+
+def _wind_text(hours):
+    """BoM-style wind phrase of the daytime hours of a day."""
+    speeds = [entry["wind_kmh"] for entry in hours if 9 <= int(entry["time_local"][11:13]) < 18]
+    mean_speed = sum(speeds) / len(speeds)
+    if mean_speed < 15:
+        return "Light winds."
+    directions = [entry["wind_dir"] for entry in hours]
+    x = sum(math.sin(math.radians(d)) for d in directions)
+    y = sum(math.cos(math.radians(d)) for d in directions)
+    word = _compass(math.degrees(math.atan2(x, y)), COMPASS_WORDS)
+    low = 5 * int(min(speeds) // 5)
+    high = 5 * math.ceil(max(speeds) / 5)
+    return f"Winds {word} {low} to {high} km/h."
+
+
+def _forecast_texts(regime, hours):
+    """(precis, long form text) of a day in the style of the BoM pages."""
+    wind = _wind_text(hours)
+    if regime == "frost":
+        return "Frosty start. Sunny.", f"Frost in the early morning. Sunny. {wind}"
+    if regime == "fog":
+        return (
+            "Morning fog then sunny.",
+            f"Fog patches in the early morning, then mostly sunny. {wind}",
+        )
+    if regime == "storm":
+        return (
+            "Possible storm.",
+            "Partly cloudy. High chance of showers, most likely in the afternoon "
+            f"and evening. The chance of a thunderstorm in the afternoon. {wind}",
+        )
+    if regime == "gale":
+        return (
+            "Showers. Windy.",
+            f"Cloudy. Medium chance of showers. Damaging winds possible. {wind}",
+        )
+    return "Sunny.", f"Sunny. {wind}"
+
+
+def bom_page(payload, regimes, issued_at):
+    """
+    BoM forecast page of a site, matching its JW payload.
+
+    :param issued_at: Local issue time (datetime with tzinfo) on the first day.
+    :return: HTML text in the structure read by bom_scrapper.scrape_forecast_texts.
+    """
+    days = []
+    for i, (daily, regime) in enumerate(zip(payload["data_1d_local"], regimes)):
+        day = date.fromisoformat(daily["date"])
+        hours = [
+            entry for entry in payload["data_1h"] if entry["time_local"].startswith(daily["date"])
+        ]
+        precis, long_form_text = _forecast_texts(regime, hours)
+        title = (
+            f"Forecast for the rest of {day:%A}"
+            if i == 0
+            else f"{day:%A} {day.day} {day:%B}"
+        )
+        day_class = "day main" if i == 0 else "day"
+        days.append(
+            f'<div class="{day_class}"><h2>{title}</h2><div class="forecast">'
+            f'<dl><dd class="summary">{precis}</dd></dl><p>{long_form_text}</p>'
+            "</div></div>"
+        )
+    issued = (
+        f"Forecast issued at {issued_at.hour % 12 or 12}:{issued_at:%M} "
+        f"{'am' if issued_at.hour < 12 else 'pm'} {issued_at.tzname()} on "
+        f"{issued_at:%A} {issued_at.day} {issued_at:%B %Y}."
+    )
+    return (
+        "<html><body><div class=\"forecasts\">"
+        f'<p class="date">{issued}</p>{"".join(days)}'
+        "</div></body></html>"
+    )
+
+
+def site_forecasts(label, site, start_date=None, seed=0):
+    """
+    JW payload and BoM page of one site.
+
+    :param start_date: First forecast date; today in the site's time zone by default.
+    :return: (payload, html)
+    """
+    tz = ZoneInfo(site["tz"])
+    start_date = start_date or datetime.now(tz).date()
+    payload, regimes = jw_payload(site, start_date, seed=seed)
+    issued_at = datetime.combine(start_date, datetime.min.time(), tz) + timedelta(
+        hours=4, minutes=20
+    )
+    return payload, bom_page(payload, regimes, issued_at)
+
+
+def write_cassette(sites, cassette_dir, jw_model=JW_MODEL, start_date=None, seed=0):
+    """
+    Write the JW and BoM responses of the sites as replay cassettes, and the
+    sites as <cassette_dir>/sites.json (the drivers' SITES_FILE).
+
+    :return: The sites filename.
+    """
+    for label, site in sites.items():
+        payload, html = site_forecasts(label, site, start_date, seed)
+        jw_url = JW_FORECAST_URL
+        save_interaction(
+            "http",
+            http_request(jw_url, params=jw_forecast_params((site["lat"], site["lon"]), jw_model)),
+            {"url": jw_url, "status_code": 200, "text": json.dumps(payload), "encoding": "utf-8"},
+            JW_LATENCY_SECONDS,
+            cassette_dir,
+        )
+        bom_url = BOM_FORECAST_URL.format(state=site["state"], city=label)
+        save_interaction(
+            "http",
+            http_request(bom_url, headers=REQUEST_HEADERS),
+            {"url": bom_url, "status_code": 200, "text": html, "encoding": "utf-8"},
+            BOM_LATENCY_SECONDS,
+            cassette_dir,
+        )
+    sites_file = os.path.join(cassette_dir, "sites.json")
+    with open(sites_file, "w") as f:
+        json.dump(sites, f, indent=1)
+    return sites_file
+
+
+def measure_scaling(site_counts, seed=0):
+    """
+    Time parsing, prompt building and workbook writing against the number of sites.
+
+    Per site: split_json_by_date of its JW payload (parse), the hourly table
+    and batch prompt of every day (prompt), and a workbook with one sheet per
+    day (write, to a temporary file).
+    """
+    import tempfile
+
+    import pandas as pd
+
+    from llm_utils import build_batch_prompt
+    from utils import (
+        convert_daily_forecasts_to_tabular,
+        convert_to_tabular,
+        split_json_by_date,
+    )
+    from var_dictionary import get_var_definitions
+    from workbook_writer import StreamingWorkbook
+
+    var_definitions = get_var_definitions(list(var_dictionary))
+    print(f"{'sites':>7}{'parse s':>10}{'prompt s':>10}{'write s':>10}{'ms/site':>10}")
+    for n_sites in site_counts:
+        sites = make_sites(n_sites, seed)
+        payloads = [site_forecasts(label, site, seed=seed)[0] for label, site in sites.items()]
+        timings = {"parse": 0.0, "prompt": 0.0, "write": 0.0}
+        with tempfile.TemporaryDirectory() as output_dir:
+            for i, payload in enumerate(payloads):
+                start = time.perf_counter()
+                data = split_json_by_date(payload, var_dictionary)
+                timings["parse"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                daily_tables = {
+                    key: convert_daily_forecasts_to_tabular(hours)
+                    for key, hours in data.items()
+                }
+                build_batch_prompt(daily_tables, var_definitions)
+                timings["prompt"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                data_df = pd.DataFrame(convert_to_tabular(data))
+                workbook = StreamingWorkbook()
+                for key, day_df in data_df.groupby("date", sort=False):
+                    workbook.add_frame_sheet(key, day_df)
+                workbook.save(os.path.join(output_dir, f"{i}.xlsx"))
+                timings["write"] += time.perf_counter() - start
+        total = sum(timings.values())
+        print(
+            f"{n_sites:>7}{timings['parse']:>10.2f}{timings['prompt']:>10.2f}"
+            f"{timings['write']:>10.2f}{1000 * total / n_sites:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    # python synthetic_forecasts.py generate N_SITES [cassette_dir]
+    # python synthetic_forecasts.py scale N_SITES [N_SITES ...]
+    if len(sys.argv) > 2 and sys.argv[1] == "generate":
+        cassette_dir = sys.argv[3] if len(sys.argv) > 3 else "cassettes/synthetic"
+        sites_file = write_cassette(make_sites(int(sys.argv[2])), cassette_dir)
+        print(f"Wrote {sys.argv[2]} synthetic sites to {cassette_dir}; replay them with")
+        print(
+            f"SITES_FILE={sites_file} CASSETTE_MODE=replay CASSETTE_DIR={cassette_dir} "
+            "python llm_daily_overview.py"
+        )
+    elif len(sys.argv) > 2 and sys.argv[1] == "scale":
+        measure_scaling([int(n) for n in sys.argv[2:]])
+    else:
+        print(__doc__)
@@ -0,0 +1,187 @@
+"""
+Lightweight tracing of the daily overview runs.
+
+Timed blocks are wrapped in spans:
+
+    with span("llm_call", model=model) as attributes:
+        completion = client.chat.completions.create(...)
+        attributes["input_tokens"] = completion.usage.prompt_tokens
+
+A span inherits the location, date and model attributes of the span it is
+nested in (on the same thread), so the spans of library code are
+attributed to the location a pipeline stage is working on. Finished spans
+are kept in memory; write_trace() saves them in the Chrome trace event
+format (open the file in https://ui.perfetto.dev or chrome://tracing) and
+prints the p50/p95/p99 duration of every span name.
+
+Set TRACING=0 (environment or .env) to turn spans into no-ops.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import dotenv
+
+dotenv.load_dotenv()
+
+TRACING = os.getenv("TRACING", "1") != "0"
+TRACE_DIR = "daily_overviews/traces"
+PERCENTILES = (50, 95, 99)
+# attributes passed on from a span to the spans nested in it
+INHERITED_ATTRIBUTES = ("location", "date", "model")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank p-th percentile of a sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * p // 100))  # ceil
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Tracer:
+    """Collects the finished spans of a process."""
+
+    def __init__(self):
+        self.spans = []  # (name, start, duration, thread id, thread name, attributes)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the enclosed block as one span.
+
+        :param name: Span name, e.g. "jw_fetch"; the summary groups by name.
+        :param attributes: Span attributes, e.g. location="sydney".
+        :return: Context manager yielding the attributes dictionary, which
+                 the block may extend (e.g. with token counts).
+        """
+        stack = self._local.__dict__.setdefault("stack", [])
+        if stack:
+            parent = stack[-1]
+            attributes = {
+                **{key: parent[key] for key in INHERITED_ATTRIBUTES if key in parent},
+                **attributes,
+            }
+        stack.append(attributes)
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            thread = threading.current_thread()
+            with self._lock:
+                self.spans.append(
+                    (
+                        name,
+                        start - self._origin,
+                        duration,
+                        thread.ident,
+                        thread.name,
+                        attributes,
+                    )
+                )
+
+    def summary(self):
+        """
+        Duration statistics of every span name, in order of first appearance.
+
+        :return: Dictionary of {name: {"count", "total", "p50", "p95", "p99"}},
+                 durations in seconds.
+        """
+        durations = {}
+        with self._lock:
+            for name, _, duration, _, _, _ in self.spans:
+                durations.setdefault(name, []).append(duration)
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[name] = {"count": len(values), "total": sum(values)}
+            for p in PERCENTILES:
+                summary[name][f"p{p}"] = percentile(values, p)
+        return summary
+
+    def print_summary(self):
+        """Print the summary as a table."""
+        summary = self.summary()
+        if not summary:
+            return
+        width = max(len(name) for name in summary)
+        header = "".join(f"{f'p{p}':>10}" for p in PERCENTILES)
+        print(f"{'span':<{width}}{'count':>8}{'total s':>10}{header}")
+        for name, stats in summary.items():
+            row = "".join(f"{stats[f'p{p}']:>10.3f}" for p in PERCENTILES)
+            print(f"{name:<{width}}{stats['count']:>8}{stats['total']:>10.1f}{row}")
+
+    def export(self, filename):
+        """Write the spans as Chrome trace events (complete events, times in µs)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        thread_names = {}
+        for name, start, duration, thread_id, thread_name, attributes in spans:
+            thread_names[thread_id] = thread_name
+            events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": round(start * 1e6),
+                    "dur": round(duration * 1e6),
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": attributes,
+                }
+            )
+        # metadata events naming the threads (pipeline stage workers)
+        events += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in thread_names.items()
+        ]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+_TRACER = Tracer()
+
+
+def get_tracer():
+    """Return the process-wide Tracer."""
+    return _TRACER
+
+
+def span(name, **attributes):
+    """Span on the process-wide tracer, see Tracer.span; a no-op if TRACING is off."""
+    if not TRACING:
+        return nullcontext(attributes)
+    return _TRACER.span(name, **attributes)
+
+
+def write_trace(trace_name):
+    """
+    Export the spans of the process to TRACE_DIR/<trace_name>.trace.json and
+    print the per-span percentiles.
+
+    :return: The trace filename, or None if tracing is off.
+    """
+    if not TRACING:
+        return None
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    filename = os.path.join(TRACE_DIR, f"{trace_name}.trace.json")
+    _TRACER.export(filename)
+    print(f"Trace written to {filename}")
+    _TRACER.print_summary()
+    return filename
@@ -1,5 +1,4 @@
 import os
-import requests
 import dotenv
 from collections import defaultdict
 from datetime import datetime
@@ -7,8 +6,23 @@ import pytz
 import pandas as pd
 from typing import Dict, Any
 
+from cassette import http_get
+from tracing import span
+
 dotenv.load_dotenv()
 
+JW_FORECAST_URL = "https://api.janesweather.com/v2/forecast"
+
+
+def jw_forecast_params(location, jw_model):
+    """Query parameters of the JW forecast request of a (lat, lon) location."""
+    return {
+        "model": jw_model,  # ai_enhanced
+        "lat": location[0],
+        "lon": location[1],
+        "show_contributors": "true",
+    }
+
 
 def get_daily_forecasts(location, vars_list, jw_model="access-g.13km"):
     """
@@ -21,23 +35,21 @@ def get_daily_forecasts(location, vars_list, jw_model="access-g.13km"):
     Returns:
         list: List of daily forecast data for each location.
     """
-    response = requests.get(
-        "https://api.janesweather.com/v2/forecast",
-        headers={"X-Api-Key": os.getenv("JW_API_KEY")},
-        params={
-            "model": jw_model,  # ai_enhanced
-            "lat": location[0],
-            "lon": location[1],
-            "show_contributors": "true",
-        },
-    )
+    with span("jw_fetch", jw_model=jw_model) as attributes:
+        response = http_get(
+            JW_FORECAST_URL,
+            headers={"X-Api-Key": os.getenv("JW_API_KEY")},
+            params=jw_forecast_params(location, jw_model),
+        )
+        attributes["status_code"] = response.status_code
 
     if response.status_code == 200:
         data = response.json()
     else:
         print(f"Error fetching data for {location}: {response.status_code}")
 
-    data_by_dates = split_json_by_date(data, vars_list)
+    with span("split_json_by_date"):
+        data_by_dates = split_json_by_date(data, vars_list)
 
     return data_by_dates
 
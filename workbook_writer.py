@@ -0,0 +1,101 @@
+"""
+Streaming xlsx output for the daily overview scripts.
+
+The workbooks are opened in openpyxl's write-only mode: the hourly day
+sheets are appended row by row and streamed to temporary files, so memory
+does not grow with the number of sheets. Only the small overview sheet is
+kept in memory, as a grid of cells that the scripts (and the metrics
+evaluators) fill by coordinate until the workbook is saved.
+"""
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+
+from tracing import span
+
+# written instead of cell values with characters Excel does not allow
+ILLEGAL_CHAR_PLACEHOLDER = "[ILLEGAL CHAR]"
+
+
+def sanitize_frame(df):
+    """
+    Replace the values holding illegal characters in the text columns of df.
+
+    :return: A copy of df, or df itself if nothing had to be replaced.
+    """
+    from pandas.api.types import is_object_dtype, is_string_dtype
+
+    # pandas 3 gives text columns the "str" dtype, older versions "object"
+    text_columns = [
+        c for c in df.columns if is_object_dtype(df[c]) or is_string_dtype(df[c])
+    ]
+    replacements = {}
+    for column in text_columns:
+        illegal = df[column].astype(str).str.contains(ILLEGAL_CHARACTERS_RE)
+        if illegal.any():
+            replacements[column] = df[column].mask(illegal, ILLEGAL_CHAR_PLACEHOLDER)
+    return df.assign(**replacements) if replacements else df
+
+
+def sanitize_value(value):
+    """Return value, or the placeholder if it is a string with illegal characters."""
+    if isinstance(value, str) and ILLEGAL_CHARACTERS_RE.search(value):
+        return ILLEGAL_CHAR_PLACEHOLDER
+    return value
+
+
+class OverviewSheet:
+    """
+    In-memory sheet written by coordinate, e.g. sheet["B4"] = "Sunny.".
+
+    Its rows are appended to the write-only sheet when the workbook is saved.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.cells = {}  # (row, column) -> value
+
+    def __setitem__(self, coordinate, value):
+        column_letter, row = coordinate_from_string(coordinate)
+        self.cells[(row, column_index_from_string(column_letter))] = value
+
+    def __getitem__(self, coordinate):
+        column_letter, row = coordinate_from_string(coordinate)
+        return self.cells.get((row, column_index_from_string(column_letter)))
+
+    def write(self):
+        """Append the cells to the write-only sheet, row by row."""
+        if not self.cells:
+            return
+        n_rows = max(row for row, _ in self.cells)
+        n_columns = max(column for _, column in self.cells)
+        for row in range(1, n_rows + 1):
+            self.worksheet.append(
+                [
+                    sanitize_value(self.cells.get((row, column)))
+                    for column in range(1, n_columns + 1)
+                ]
+            )
+
+
+class StreamingWorkbook:
+    """Write-only workbook with one overview sheet followed by DataFrame sheets."""
+
+    def __init__(self, overview_title="overview"):
+        self.workbook = Workbook(write_only=True)
+        # created first so it stays the first sheet
+        self.overview = OverviewSheet(self.workbook.create_sheet(title=overview_title))
+
+    def add_frame_sheet(self, title, df):
+        """Stream df to a new sheet: a header row, then one row per record."""
+        worksheet = self.workbook.create_sheet(title=title)
+        worksheet.append(list(df.columns))
+        for row in sanitize_frame(df).itertuples(index=False, name=None):
+            worksheet.append(row)
+
+    def save(self, filename):
+        """Write the overview sheet and save; a write-only workbook is saved once."""
+        with span("workbook_save", filename=filename):
+            self.overview.write()
+            self.workbook.save(filename)